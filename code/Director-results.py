@@ -1,9 +1,12 @@
-import json
-import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import os
 
+from decimate import plot_raw_and_smooth
+from director_ingest import load_director
+from figure_export import save_figure
+from smoothing import smooth_runs
+
 # Create output directory
 output_dir = "media/pinpad/director-results"
 os.makedirs(output_dir, exist_ok=True)
@@ -14,17 +17,10 @@ files = {
     'pinpad-dense-3': 'director-result/pinpad-dense-3.jsonl'
 }
 
-# Read and parse JSONL files
+# Read JSONL files (only lines appended since the last run are parsed)
 data = {}
 for name, filepath in files.items():
-    records = []
-    with open(filepath, 'r') as f:
-        for line in f:
-            try:
-                records.append(json.loads(line))
-            except json.JSONDecodeError:
-                continue
-    data[name] = pd.DataFrame(records)
+    data[name] = load_director(filepath)
     print(f"Loaded {name}: {len(data[name])} records")
 
 # =============================================================================
@@ -35,7 +31,8 @@ fig, ax = plt.subplots(figsize=(6, 3.5), dpi=300)
 
 colors = ['#1f77b4', '#ff7f0e']  # blue, orange
 
-for (name, df), color in zip(data.items(), colors):
+curves, names = [], []
+for name, df in data.items():
     # Filter for episode/score entries
     df_scores = df[['step', 'episode/score']].dropna()
     
@@ -46,18 +43,14 @@ for (name, df), color in zip(data.items(), colors):
     # Sort by step
     df_scores = df_scores.sort_values('step')
     
-    x = df_scores['step'] / 1000  # thousands of steps
-    y = df_scores['episode/score']
-    
-    # Smooth the curve
-    window = 20
-    y_smooth = y.rolling(window=window, min_periods=1).mean()
-    
-    # Plot raw data (light)
-    ax.plot(x, y, linewidth=0.5, alpha=0.3, color=color)
-    
-    # Plot smoothed data (bold)
-    ax.plot(x, y_smooth, linewidth=1.4, label=name, alpha=0.8, color=color)
+    names.append(name)
+    curves.append((df_scores['step'].to_numpy(), df_scores['episode/score'].to_numpy()))
+
+# Smooth both runs in one call, over the same window in env. steps even though they log at different rates
+for name, (steps, y), y_smooth, color in zip(names, curves, smooth_runs(curves), colors):
+    # Plot raw data (light) and smoothed data (bold), decimated to the axes' pixel width
+    plot_raw_and_smooth(ax, steps / 1000, y, y_smooth, color=color, label=name,  # thousands of steps
+                        raw_linewidth=0.5, alpha=0.8)
 
 ax.set_xlabel("Env. Steps (×10³)", fontsize=9)
 ax.set_ylabel("Episode Return", fontsize=9)
@@ -68,8 +61,8 @@ ax.tick_params(axis="both", labelsize=8)
 ax.grid(True, alpha=0.3)
 
 plt.tight_layout()
-fig.savefig(f"{output_dir}/director-episode-scores.png", dpi=300, bbox_inches="tight")
+out_path = save_figure(fig, f"{output_dir}/director-episode-scores.png", dpi=300, bbox_inches="tight")
 plt.close(fig)
-print(f"✓ Saved: {output_dir}/director-episode-scores.png")
+print(f"✓ Saved: {out_path}")
 
 print("\n✓ Director results visualization complete!")
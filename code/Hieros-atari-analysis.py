@@ -2,24 +2,32 @@ import wandb
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image
-import io
 import os
-import cv2
 import tempfile
 
+from cache import fetch_history
+from figure_export import save_figure
+from frame_cache import load_frames
+from profiling import mark
+from run_metadata import sweep_runs
+from run_config import ConfigIndex
+
 # Create output directory
 output_dir = "media/atari"
 os.makedirs(output_dir, exist_ok=True)
 
 # Initialize the API
+mark("sweep")
 api = wandb.Api()
 
-# Fetch the sweep
-sweep = api.sweep("rm2278-university-of-cambridge/Hieros-hieros/llr4r8er")
+# Fetch configs, states and summaries of every run in the sweep in one bulk query (cached)
+runs = sweep_runs("atari", api)
+
+print(f"Sweep: {runs.sweep_id}")
+print(f"Found {len(runs)} runs")
 
-print(f"Sweep: {sweep.name}")
-print(f"Found {len(sweep.runs)} runs")
+# Normalized configs (flattened, type-coerced) indexed by run id
+configs = ConfigIndex.from_runs(runs)
 
 # For freeway, use specific run from different sweep
 freeway_run = api.run("rm2278-university-of-cambridge/Hieros-hieros/19ymhh01")
@@ -27,13 +35,13 @@ print(f"\nSpecial freeway run: {freeway_run.name}")
 
 # Group runs by task
 runs_by_task = {}
-for run in sweep.runs:
-    if 'task' in run.config:
-        task = run.config['task']
+for run in runs:
+    task = configs.get(run.id, 'task')
+    if task is not None:
         if task not in runs_by_task:
             runs_by_task[task] = []
         runs_by_task[task].append(run)
-        print(f"Run {run.name}: task={task}, seed={run.config.get('seed', 'unknown')}")
+        print(f"Run {run.name}: task={task}, seed={configs.get(run.id, 'seed', 'unknown')}")
 
 # Add freeway run to the group
 if 'atari_freeway' not in runs_by_task:
@@ -46,6 +54,7 @@ print(f"\nFound {len(runs_by_task)} different tasks")
 # =============================================================================
 # 1. Episode/Score for each task (averaged over seeds)
 # =============================================================================
+mark("episode-scores")
 
 for task, task_runs in runs_by_task.items():
     fig, ax = plt.subplots(figsize=(6, 3.5), dpi=300)
@@ -54,7 +63,7 @@ for task, task_runs in runs_by_task.items():
     run_max_steps = []
     for run in task_runs:
         try:
-            history = run.history(keys=["episode/score", "_step"])
+            history = fetch_history(run, ["episode/score"])
             df = history.dropna(subset=["episode/score"])
             if not df.empty:
                 max_step = df["_step"].max()
@@ -84,7 +93,7 @@ for task, task_runs in runs_by_task.items():
     all_scores = []
     
     for run in filtered_runs:
-        history = run.history(keys=["episode/score", "_step"])
+        history = fetch_history(run, ["episode/score"])
         
         if history.empty or "episode/score" not in history.columns:
             continue
@@ -141,17 +150,18 @@ for task, task_runs in runs_by_task.items():
     plt.tight_layout()
     # Sanitize filename
     safe_task_name = task.replace('/', '_').replace(' ', '_')
-    fig.savefig(f"{output_dir}/{safe_task_name}-scores.png", dpi=300, bbox_inches="tight")
+    output_path = save_figure(fig, f"{output_dir}/{safe_task_name}-scores.png", dpi=300, bbox_inches="tight")
     plt.close(fig)
-    print(f"✓ Saved: {output_dir}/{safe_task_name}-scores.png")
+    print(f"✓ Saved: {output_path}")
 
 # =============================================================================
 # 2. Policy Image Visualization (temporal progression)
 # =============================================================================
+mark("policy-images")
 
 # First, check what image keys are available
 print("\nChecking available media keys...")
-sample_run = sweep.runs[0]
+sample_run = runs[0]
 history = sample_run.history()
 image_keys = [col for col in history.columns if 'image' in col.lower() or 'policy' in col.lower() or 'video' in col.lower() or 'report' in col.lower()]
 print(f"Available media keys: {image_keys}")
@@ -210,7 +220,7 @@ for task, task_runs in runs_by_task.items():
             file_obj = selected_run.file(file_path)
             downloaded_path = file_obj.download(replace=True).name
         elif hasattr(media_obj, "_image"):
-            # If it's a static image, convert to temporary file for cv2
+            # If it's a static image, convert to temporary file for the frame cache
             img = media_obj._image
             import tempfile
             with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
@@ -220,17 +230,11 @@ for task, task_runs in runs_by_task.items():
             print(f"⚠ Unexpected policy_image format for task {task}")
             continue
         
-        # Try to open as video/GIF with cv2
-        cap = cv2.VideoCapture(downloaded_path)
-        
-        if not cap.isOpened():
-            print(f"⚠ Could not open policy_image as video for task {task}")
-            continue
+        # Open the decoded frames (memory-mapped, decoded once per file; mp4 falls back to cv2)
+        all_frames = load_frames(downloaded_path)
         
         # Get total frame count and frame dimensions
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        total_frames, frame_height, frame_width = all_frames.shape[:3]
         print(f"Total frames in policy_image: {total_frames}, Frame size: {frame_width}x{frame_height}")
         
         # Extract 6 frames with 5-frame intervals for better motion visibility
@@ -250,16 +254,7 @@ for task, task_runs in runs_by_task.items():
         
         print(f"Extracting frames {frame_indices} with {frame_interval}-frame intervals from {total_frames} total frames")
         
-        frames = []
-        for frame_idx in frame_indices:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-            ret, frame = cap.read()
-            if ret:
-                # Convert BGR to RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frames.append(frame_rgb)
-        
-        cap.release()
+        frames = [all_frames[frame_idx] for frame_idx in frame_indices]
         
         if len(frames) == 0:
             print(f"⚠ Could not extract frames from policy_image for task {task}")
@@ -293,9 +288,9 @@ for task, task_runs in runs_by_task.items():
         plt.tight_layout()
         plt.tight_layout()
         safe_task_name = task.replace('/', '_').replace(' ', '_')
-        fig.savefig(f"{output_dir}/{safe_task_name}-policy-temporal.png", dpi=300, bbox_inches="tight")
+        output_path = save_figure(fig, f"{output_dir}/{safe_task_name}-policy-temporal.png", dpi=300, bbox_inches="tight")
         plt.close(fig)
-        print(f"✓ Saved: {output_dir}/{safe_task_name}-policy-temporal.png")
+        print(f"✓ Saved: {output_path}")
         
     except Exception as e:
         print(f"⚠ Error processing video for task {task}: {e}")
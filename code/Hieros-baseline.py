@@ -2,6 +2,11 @@ import wandb
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from cache import load_curve
+from decimate import axes_pixel_width, plot_curve
+from figure_export import save_figure
+from subactor_tensor import discover_levels, discover_subactor_keys, subactor_key
+
 # 1. Initialize the API
 api = wandb.Api()
 
@@ -9,38 +14,22 @@ api = wandb.Api()
 # Your URL: https://wandb.ai/rm2278-university-of-cambridge/dreamerv3/runs/fltyjyib
 run = api.run("rm2278-university-of-cambridge/dreamerv3/fltyjyib")
 
-# 3. Download the full history (all metrics logged over time)
-# Note: This might take a few seconds depending on the run length
-history = run.history()
-
-# 4. Define metric groups (each subactor plotted together)
-metric_groups = [
-	("episode/score", "Episode Return", [("episode/score", None)]),
-	("extrinsic_reward", "Extrinsic Reward", [
-		("train/Subactor-0/imag_extrinsic_reward_mean", "Sub 0"),
-		("train/Subactor-1/imag_extrinsic_reward_mean", "Sub 1"),
-		("train/Subactor-2/imag_extrinsic_reward_mean", "Sub 2"),
-	]),
-	("subgoal_reward", "Subgoal Reward", [
-		("train/Subactor-0/imag_subgoal_reward_mean", "Sub 0"),
-		("train/Subactor-1/imag_subgoal_reward_mean", "Sub 1"),
-		("train/Subactor-2/imag_subgoal_reward_mean", "Sub 2"),
-	]),
-	("novelty_reward", "Novelty Reward", [
-		("train/Subactor-0/imag_novelty_reward_mean", "Sub 0"),
-		("train/Subactor-1/imag_novelty_reward_mean", "Sub 1"),
-		("train/Subactor-2/imag_novelty_reward_mean", "Sub 2"),
-	]),
-	("actor_entropy", "Actor Entropy", [
-		("train/Subactor-0/actor_entropy", "Sub 0"),
-		("train/Subactor-1/actor_entropy", "Sub 1"),
-		("train/Subactor-2/actor_entropy", "Sub 2"),
-	]),
-	("model_loss", "Model Loss", [
-		("train/Subactor-0/model_loss", "Sub 0"),
-		("train/Subactor-1/model_loss", "Sub 1"),
-		("train/Subactor-2/model_loss", "Sub 2"),
-	]),
+# 3. The score and every subactor metric recorded by the run (histories are cached after the first run,
+#    together with x4/x16/x64 decimated levels; each panel reads the coarsest level its width needs)
+keys = ["episode/score", *discover_subactor_keys(run.summary.keys()).values()]
+
+# 4. Define metric groups (each subactor plotted together; levels are discovered from the run)
+levels = discover_levels(keys)
+subactor_panels = [
+	("imag_extrinsic_reward_mean", "Extrinsic Reward"),
+	("imag_subgoal_reward_mean", "Subgoal Reward"),
+	("imag_novelty_reward_mean", "Novelty Reward"),
+	("actor_entropy", "Actor Entropy"),
+	("model_loss", "Model Loss"),
+]
+metric_groups = [("episode/score", "Episode Return", [("episode/score", None)])] + [
+	(metric, ylabel, [(subactor_key(level, metric), f"Sub {level}") for level in levels])
+	for metric, ylabel in subactor_panels
 ]
 
 # 5. Create a multi-panel figure with 2 columns per row (3x2 grid)
@@ -50,34 +39,27 @@ n_rows = 3
 fig, axes = plt.subplots(n_rows, n_cols, figsize=(7.0, 6.0), dpi=300)
 axes = axes.flatten()
 
-window = 20  # moving-average window for smoothing
-colors = ['tab:blue', 'tab:orange', 'tab:green']
+window = 20  # moving-average window in logging intervals (a fixed width in env. steps at every pyramid level)
+colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
 
 for plot_idx, (group_key, ylabel, metrics_list) in enumerate(metric_groups):
 	ax = axes[plot_idx]
 	
 	# Plot each metric in the group
 	for metric_idx, (key, label) in enumerate(metrics_list):
-		if key not in history.columns:
+		if key not in keys:
 			print(f"Warning: Metric '{key}' not found, skipping")
 			continue
-		
-		df = history.dropna(subset=[key]).sort_values("_step")
-		if df.empty:
-			continue
 
-		x = df["_step"] / 1e6  # environment steps in millions
-		smooth = df[key].rolling(window=window, min_periods=1).mean()
+		# two points per pixel of the panel is enough; longer runs read a coarser pyramid level
+		curve = load_curve(run, key, 2 * axes_pixel_width(ax))
+		if curve.empty:
+			continue
 
 		color = colors[metric_idx % len(colors)]
-		
-		# light raw curve
-		ax.plot(x, df[key], color=color, linewidth=0.6, alpha=0.3)
-		# smoothed main curve
-		if label:
-			ax.plot(x, smooth, color=color, linewidth=1.4, label=label)
-		else:
-			ax.plot(x, smooth, color=color, linewidth=1.4)
+
+		# light min-max band + smoothed main curve (x in millions of environment steps)
+		plot_curve(ax, curve, x_scale=1e6, window=window, color=color, label=label)
 
 	ax.set_xlabel("Env. Steps (×10⁶)", fontsize=7)
 	ax.set_ylabel(ylabel, fontsize=7)
@@ -98,5 +80,5 @@ for idx in range(n_plots, len(axes)):
 fig.tight_layout(w_pad=0.8, h_pad=0.8)
 
 # Save the plot for your paper (tight, high-res)
-fig.savefig("media/pinpad/Hieros-baseline.png", dpi=300, bbox_inches="tight")
+save_figure(fig, "media/pinpad/Hieros-baseline.png", dpi=300, bbox_inches="tight")
 plt.close(fig)
\ No newline at end of file
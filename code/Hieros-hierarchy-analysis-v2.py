@@ -2,57 +2,71 @@
 """
 Hieros階層性の変更実験の解析スクリプト（図8スタイル）
 max_hierarchyパラメータの影響をepisode/scoreで可視化
+
+HWM_OVERLAY=exploration/coverage のように派生メトリクス（code/exploration_timeseries.py で
+historyキャッシュに保存したもの）を指定すると、同じ図の右軸に破線で重ねて描く。
 """
 
-import wandb
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 from pathlib import Path
 import os
 
+from cache import concat_runs, fetch_history, load_history
+from figure_export import save_figure
+from profiling import stage
+from run_config import normalize_config
+from run_metadata import sweep_runs
+from smoothing import smooth_runs
+from snapshot import open_api
+
+# 学習曲線に重ねる探索指標（例: exploration/coverage, exploration/entropy）。未指定なら重ねない
+OVERLAY = os.environ.get("HWM_OVERLAY")
+
 def create_media_dir():
     """出力ディレクトリの作成"""
     output_dir = Path("media/hierarchy")
     output_dir.mkdir(parents=True, exist_ok=True)
     return output_dir
 
+@stage("fetch")
 def fetch_hierarchy_sweep_data():
     """階層性実験のスイープデータを取得"""
-    api = wandb.Api()
+    api = open_api()
     
     # 新しいスイープの情報 (max_hierarchy 1-3)
-    project = "rm2278-university-of-cambridge/Hieros-hieros" 
     sweep_id = "uul3sfkc"
     
     print(f"Fetching sweep: {sweep_id}")
-    sweep = api.sweep(f"{project}/sweeps/{sweep_id}")
+    # 全ランの設定・状態・サマリーを1回の一括クエリで取得したリスト（キャッシュ付き）
+    runs = sweep_runs(sweep_id, api)
     
-    print(f"Found {len(sweep.runs)} runs")
+    print(f"Found {len(runs)} runs")
     
     # 図8と同じデータ収集方式
     valid_runs = []
+    run_attrs = []
     
-    for run in sweep.runs:
+    for run in runs:
         if run.state != "finished":
             print(f"Skipping run {run.name}: state={run.state}")
             continue
             
-        # max_hierarchyパラメータを取得
-        max_hierarchy = run.config.get('max_hierarchy', None)
+        # max_hierarchyパラメータを取得（run_configで数値に変換済み）
+        max_hierarchy = normalize_config(run.config).get('max_hierarchy', None)
         if max_hierarchy is None:
             print(f"Skipping run {run.name}: no max_hierarchy config")
             continue
-            
-        # max_hierarchyを数値に変換
-        try:
-            max_hierarchy = int(max_hierarchy)
-        except (ValueError, TypeError):
+        # 2.0 のような整数値の float は受け付け、bool や整数でない値は除く
+        if (isinstance(max_hierarchy, bool) or not isinstance(max_hierarchy, (int, float))
+                or not float(max_hierarchy).is_integer()):
             print(f"Skipping run {run.name}: invalid max_hierarchy value: {max_hierarchy}")
             continue
+        max_hierarchy = int(max_hierarchy)
             
         # 図8と同じhistory取得方式
-        history = run.history(keys=["episode/score", "_step"])
+        history = fetch_history(run, ["episode/score"])
         
         if history.empty or "episode/score" not in history.columns:
             print(f"Skipping run {run.name}: no episode/score data")
@@ -64,25 +78,29 @@ def fetch_hierarchy_sweep_data():
         if df.empty:
             print(f"Skipping run {run.name}: all NaN")
             continue
+
+        # 重ねる探索指標は別の行として足す（スコアとはステップが揃わないので結合しない）
+        if OVERLAY:
+            overlay = load_history(run, [OVERLAY])
+            if OVERLAY in overlay.columns:
+                df = pd.concat([df, overlay.dropna(subset=[OVERLAY])], ignore_index=True).sort_values("_step")
             
-        # max_hierarchyとrun情報を追加
-        df['max_hierarchy'] = max_hierarchy
-        df['run_name'] = run.name
-        df['run_id'] = run.id
-        
+        # ラン単位の属性は行ごとに繰り返さず、結合時にカテゴリ列にする
         valid_runs.append(df)
+        run_attrs.append({'max_hierarchy': max_hierarchy, 'run_name': run.name, 'run_id': run.id})
         print(f"✓ Added run {run.name}: max_hierarchy={max_hierarchy}, {len(df)} data points")
     
     if not valid_runs:
         raise ValueError("No valid runs found in sweep")
         
     # 全データを結合
-    all_data = pd.concat(valid_runs, ignore_index=True)
-    print(f"Total data points: {len(all_data)}")
+    all_data = concat_runs(valid_runs, run_attrs)
+    print(f"Total data points: {len(all_data)} ({all_data.memory_usage(deep=True).sum() / 1e6:.2f} MB)")
     print(f"Max hierarchy values: {sorted(all_data['max_hierarchy'].unique())}")
     
     return all_data
 
+@stage("render")
 def create_episode_score_plot(data, output_dir):
     """episode/scoreの学習曲線を作成（図8のスタイルを完全に模倣）"""
     
@@ -93,6 +111,7 @@ def create_episode_score_plot(data, output_dir):
     hierarchy_values = sorted(data['max_hierarchy'].unique())
     colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
     
+    curves, styles, overlay_curves = [], [], []
     for i, max_hier in enumerate(hierarchy_values):
         hier_data = data[data['max_hierarchy'] == max_hier]
         color = colors[i % len(colors)]
@@ -100,26 +119,38 @@ def create_episode_score_plot(data, output_dir):
         # 各runのデータを個別に取得
         for run_id in hier_data['run_id'].unique():
             run_data = hier_data[hier_data['run_id'] == run_id].sort_values("_step")
+            if OVERLAY in run_data.columns:
+                points = run_data.dropna(subset=[OVERLAY])
+                if len(points):
+                    overlay_curves.append((points["_step"].to_numpy(), points[OVERLAY].to_numpy(), color))
+            run_data = run_data.dropna(subset=["episode/score"])
             
             if len(run_data) == 0:
                 continue
                 
-            x = run_data["_step"] / 1000  # thousands of steps  
-            y = run_data["episode/score"]
-            
-            # 図8と同じスムージング
-            window = 20
-            y_smooth = y.rolling(window=window, min_periods=1).mean()
-            
             # 最初のrunだけlabelを付ける
             if run_id == hier_data['run_id'].unique()[0]:
                 label = f'max_hierarchy={max_hier}'
             else:
                 label = None
             
-            # 図8と全く同じスタイリング
-            ax.plot(x, y_smooth, linewidth=1.4, label=label, alpha=0.8, color=color)
-    
+            curves.append((run_data["_step"].to_numpy(), run_data["episode/score"].to_numpy()))
+            styles.append((label, color))
+
+    # 図8と同じスムージング（全runを1回で、ステップ単位の窓で平滑化）
+    for (label, color), (steps, _), y_smooth in zip(styles, curves, smooth_runs(curves)):
+        # 図8と全く同じスタイリング
+        ax.plot(steps / 1000, y_smooth, linewidth=1.4, label=label, alpha=0.8, color=color)  # thousands of steps
+    
+    if overlay_curves:
+        ax_overlay = ax.twinx()
+        smoothed = smooth_runs([(steps, values) for steps, values, _ in overlay_curves])
+        for (steps, _, color), y_smooth in zip(overlay_curves, smoothed):
+            ax_overlay.plot(steps / 1000, y_smooth, linewidth=1.0, linestyle="--", alpha=0.6, color=color)
+        ax_overlay.set_ylabel(f"{OVERLAY} (dashed)", fontsize=9)
+        ax_overlay.spines["top"].set_visible(False)
+        ax_overlay.tick_params(axis="y", labelsize=8)
+
     # 図8と全く同じ軸とスタイリング設定
     ax.set_xlabel("Env. Steps (×10³)", fontsize=9)
     ax.set_ylabel("Episode Return", fontsize=9)
@@ -132,8 +163,9 @@ def create_episode_score_plot(data, output_dir):
     plt.tight_layout()
     
     # 図8と同じ保存設定
-    output_path = output_dir / "hierarchy_episode_scores.png"
-    fig.savefig(output_path, dpi=300, bbox_inches="tight")
+    suffix = f"_{OVERLAY.split('/')[-1]}" if overlay_curves else ""
+    output_path = output_dir / f"hierarchy_episode_scores{suffix}.png"
+    output_path = save_figure(fig, output_path, dpi=300, bbox_inches="tight")
     plt.close(fig)
     
     print(f"✓ Saved: {output_path}")
@@ -4,7 +4,6 @@ Hieros階層性の変更実験の解析スクリプト
 max_hierarchyパラメータの影響をepisode/scoreとheatmapで可視化
 """
 
-import wandb
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,6 +11,13 @@ import seaborn as sns
 from pathlib import Path
 import os
 
+from cache import concat_runs, fetch_history
+from figure_export import save_figure
+from profiling import stage
+from run_config import normalize_config
+from run_metadata import sweep_runs
+from snapshot import open_api
+
 def setup_matplotlib():
     """Matplotlibの設定を他のグラフと統一"""
     plt.style.use('default')
@@ -31,41 +37,41 @@ def create_media_dir():
     media_dir.mkdir(parents=True, exist_ok=True)
     return media_dir
 
+@stage("fetch")
 def fetch_hierarchy_sweep_data():
     """階層性実験のスイープデータを取得"""
-    api = wandb.Api()
+    api = open_api()
     
     # スイープの情報
-    project = "rm2278-university-of-cambridge/Hieros-hieros" 
     sweep_id = "myeqsabh"
     
     print(f"Fetching sweep: {sweep_id}")
-    sweep = api.sweep(f"{project}/sweeps/{sweep_id}")
+    # 全ランの設定・状態・サマリーを1回の一括クエリで取得したリスト（キャッシュ付き）
+    runs = sweep_runs(sweep_id, api)
     
     runs_data = []
+    run_attrs = []
     
     print("Processing runs...")
-    for run in sweep.runs:
+    for run in runs:
         if run.state != "finished":
             print(f"Skipping run {run.name}: state={run.state}")
             continue
             
-        # max_hierarchyパラメータを取得
-        max_hierarchy = run.config.get('max_hierarchy', None)
+        # max_hierarchyパラメータを取得（run_configで数値に変換済み）
+        max_hierarchy = normalize_config(run.config).get('max_hierarchy', None)
         if max_hierarchy is None:
             print(f"Skipping run {run.name}: no max_hierarchy config")
             continue
-            
-        # max_hierarchyを数値に変換
-        try:
-            max_hierarchy = int(max_hierarchy)
-        except (ValueError, TypeError):
+        # 2.0 のような整数値の float は受け付け、bool や整数でない値は除く
+        if (isinstance(max_hierarchy, bool) or not isinstance(max_hierarchy, (int, float))
+                or not float(max_hierarchy).is_integer()):
             print(f"Skipping run {run.name}: invalid max_hierarchy value: {max_hierarchy}")
             continue
+        max_hierarchy = int(max_hierarchy)
             
         # ヒストリーを取得
-        history = run.scan_history(keys=["episode/score", "_step"])
-        df = pd.DataFrame(history)
+        df = fetch_history(run, ["episode/score"])
         
         if df.empty or "episode/score" not in df.columns:
             print(f"Skipping run {run.name}: no episode/score data")
@@ -75,24 +81,22 @@ def fetch_hierarchy_sweep_data():
         if df.empty:
             continue
             
-        # max_hierarchyを追加
-        df['max_hierarchy'] = max_hierarchy
-        df['run_name'] = run.name
-        df['run_id'] = run.id
-        
+        # ラン単位の属性は行ごとに繰り返さず、結合時にカテゴリ列にする
         runs_data.append(df)
+        run_attrs.append({'max_hierarchy': max_hierarchy, 'run_name': run.name, 'run_id': run.id})
         print(f"✓ Added run {run.name}: max_hierarchy={max_hierarchy}, {len(df)} data points")
     
     if not runs_data:
         raise ValueError("No valid runs found in sweep")
         
     # 全データを結合
-    all_data = pd.concat(runs_data, ignore_index=True)
-    print(f"Total data points: {len(all_data)}")
+    all_data = concat_runs(runs_data, run_attrs)
+    print(f"Total data points: {len(all_data)} ({all_data.memory_usage(deep=True).sum() / 1e6:.2f} MB)")
     print(f"Max hierarchy values: {sorted(all_data['max_hierarchy'].unique())}")
     
     return all_data
 
+@stage("render")
 def create_episode_score_plot(data, output_dir):
     """episode/scoreの学習曲線を作成（他のPinpadグラフに合わせたスタイル）"""
     plt.figure(figsize=(10, 6))  # Better aspect ratio like other Pinpad figures
@@ -137,12 +141,13 @@ def create_episode_score_plot(data, output_dir):
     plt.tight_layout()
     
     output_path = output_dir / "hierarchy_episode_scores.png"
-    plt.savefig(output_path, bbox_inches='tight', dpi=300, facecolor='white')
+    output_path = save_figure(plt.gcf(), output_path, bbox_inches='tight', dpi=300, facecolor='white')
     plt.close()
     
     print(f"✓ Saved: {output_path}")
     return output_path
 
+@stage("render")
 def create_performance_heatmap(data, output_dir):
     """最終性能のヒートマップを作成"""
     # 各ランの最終スコアを取得
@@ -213,7 +218,7 @@ def create_performance_heatmap(data, output_dir):
     plt.tight_layout()
     
     output_path = output_dir / "hierarchy_performance_analysis.png"
-    plt.savefig(output_path, bbox_inches='tight', dpi=300)
+    output_path = save_figure(plt.gcf(), output_path, bbox_inches='tight', dpi=300)
     plt.close()
     
     print(f"✓ Saved: {output_path}")
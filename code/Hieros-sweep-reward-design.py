@@ -1,60 +1,62 @@
-import wandb
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image
-import io
 import os
 
+from cache import fetch_history
+from figure_export import save_figure
+from image_grid import save_grid
+from run_config import ConfigIndex
+from wandb_media import load_media_image
+from profiling import mark
+from run_metadata import sweep_runs
+from smoothing import smooth_runs
+from snapshot import open_api
+
 # Create output directory
 output_dir = "media/pinpad/reward-design-sweep"
 os.makedirs(output_dir, exist_ok=True)
 
 # Initialize the API
-api = wandb.Api()
+mark("sweep")
+api = open_api()
 
-# Fetch the sweep
-sweep = api.sweep("rm2278-university-of-cambridge/Hieros-hieros/f19iko7r")
+# Fetch configs, states and summaries of every run in the sweep in one bulk query (cached)
+runs = sweep_runs("reward-design", api)
 
-print(f"Sweep: {sweep.name}")
-print(f"Found {len(sweep.runs)} runs")
+print(f"Sweep: {runs.sweep_id}")
+print(f"Found {len(runs)} runs")
 
-# Filter runs by task (only pinpad-easy_three)
-pinpad3_runs = []
-for run in sweep.runs:
-    if 'task' in run.config:
-        task = run.config['task']
-        print(f"Run {run.name}: task={task}")
-        if 'pinpad-easy_three' in task or 'pinpad_three' in task or 'pinpad-3' in task:
-            pinpad3_runs.append(run)
+# Filter runs by task (only pinpad-easy_three; task names are canonicalized by run_config)
+configs = ConfigIndex.from_runs(runs)
+for run_id, run in configs.runs.items():
+    print(f"Run {run.name}: task={configs.get(run_id, 'task')}")
+pinpad3_runs = [configs.runs[run_id] for run_id in sorted(configs.lookup("task", "pinpad_three"))]
 
 print(f"\nFiltered to {len(pinpad3_runs)} pinpad-easy_three runs")
 
 if not pinpad3_runs:
     print("⚠ No pinpad-3/pinpad-easy_three runs found, showing all runs instead")
-    pinpad3_runs = sweep.runs
+    pinpad3_runs = runs
 
 # =============================================================================
 # 1. Episode/Score for all runs
 # =============================================================================
+mark("episode-scores")
 
 fig, ax = plt.subplots(figsize=(6, 3.5), dpi=300)
 
+curves, labels = [], []
 for run in pinpad3_runs:
     # Use reward_mode as label
-    if 'env.pinpad-easy.reward_mode' in run.config:
-        label = run.config['env.pinpad-easy.reward_mode']
-    elif 'reward_mode' in run.config:
-        label = run.config['reward_mode']
-    else:
-        label = run.name
+    label = configs.get(run.id, "reward_mode", run.name)
     
     # Skip progress_any
     if label == 'progress_any':
         continue
     
     # Fetch history
-    history = run.history(keys=["episode/score", "_step"])
+    history = fetch_history(run, ["episode/score"])
     
     if history.empty or "episode/score" not in history.columns:
         print(f"Skipping run {run.name} (no episode/score data)")
@@ -67,15 +69,12 @@ for run in pinpad3_runs:
         print(f"Skipping run {run.name} (all NaN)")
         continue
     
-    x = df["_step"] / 1000  # thousands of steps
-    y = df["episode/score"]
-    
-    # Smooth the curve
-    window = 20
-    y_smooth = y.rolling(window=window, min_periods=1).mean()
-    
-    # Plot with label
-    ax.plot(x, y_smooth, linewidth=1.4, label=label, alpha=0.8)
+    labels.append(label)
+    curves.append((df["_step"].to_numpy(), df["episode/score"].to_numpy()))
+
+# Smooth all runs in one call, over a window of 20 logging intervals in env. steps (not 20 points)
+for label, (steps, _), y_smooth in zip(labels, curves, smooth_runs(curves)):
+    ax.plot(steps / 1000, y_smooth, linewidth=1.4, label=label, alpha=0.8)  # thousands of steps
 
 ax.set_xlabel("Env. Steps (×10³)", fontsize=9)
 ax.set_ylabel("Episode Return", fontsize=9)
@@ -86,13 +85,14 @@ ax.tick_params(axis="both", labelsize=8)
 ax.grid(True, alpha=0.3)
 
 plt.tight_layout()
-fig.savefig(f"{output_dir}/sweep-episode-scores.png", dpi=300, bbox_inches="tight")
+output_path = save_figure(fig, f"{output_dir}/sweep-episode-scores.png", dpi=300, bbox_inches="tight")
 plt.close(fig)
-print(f"✓ Saved: {output_dir}/sweep-episode-scores.png")
+print(f"✓ Saved: {output_path}")
 
 # =============================================================================
 # 2. Subgoal Visualization (all seeds at 400k step)
 # =============================================================================
+mark("subgoals")
 
 # Collect all runs with subgoal_visualization
 runs_with_subgoal = []
@@ -126,12 +126,7 @@ else:
         row = df.loc[closest_idx]
         
         # Get reward_mode for labeling
-        if 'env.pinpad-easy.reward_mode' in run.config:
-            label = run.config['env.pinpad-easy.reward_mode']
-        elif 'reward_mode' in run.config:
-            label = run.config['reward_mode']
-        else:
-            label = run.name
+        label = configs.get(run.id, "reward_mode", run.name)
         
         # Skip progress_any
         if label == 'progress_any':
@@ -142,47 +137,18 @@ else:
     if not images_data:
         print("⚠ No images found at 400k")
     else:
-        n_samples = len(images_data)
+        images = [load_media_image(run, row["report/subgoal_visualization"]) for run, row, _ in images_data]
+        labels = [f"{label}" for _, _, label in images_data]
         
-        # Create a figure with max 2 images per row
-        n_cols = min(2, n_samples)
-        n_rows = (n_samples + n_cols - 1) // n_cols
-        fig, axes = plt.subplots(n_rows, n_cols, figsize=(6*n_cols, 5*n_rows), dpi=300)
-        if n_samples == 1:
-            axes = [axes]
-        else:
-            axes = axes.flatten()
-        
-        for idx, (ax, (run, row, label)) in enumerate(zip(axes, images_data)):
-            media_obj = row["report/subgoal_visualization"]
-            
-            if hasattr(media_obj, "_image"):
-                img = media_obj._image
-            elif isinstance(media_obj, dict) and "path" in media_obj:
-                file_path = media_obj["path"]
-                file_obj = run.file(file_path)
-                downloaded_path = file_obj.download(replace=True).name
-                img = Image.open(downloaded_path)
-            else:
-                img = media_obj
-            
-            ax.imshow(img)
-            ax.set_title(f"{label}", fontsize=16)
-            ax.axis("off")
-        
-        # Hide unused subplots
-        for idx in range(n_samples, len(axes)):
-            axes[idx].axis("off")
-        
-        plt.suptitle("Subgoal Visualization @ 400k steps", fontsize=11, fontweight='bold')
-        plt.subplots_adjust(wspace=0.1, hspace=0.2)
-        fig.savefig(f"{output_dir}/sweep-subgoal-temporal.png", dpi=300, bbox_inches="tight")
-        plt.close(fig)
+        # Max 2 images per row, composed at native resolution
+        save_grid(f"{output_dir}/sweep-subgoal-temporal.png", images, labels,
+                  n_cols=2, title="Subgoal Visualization @ 400k steps")
         print(f"✓ Saved: {output_dir}/sweep-subgoal-temporal.png")
 
 # =============================================================================
 # 3. Position Heatmap (all seeds at 400k step)
 # =============================================================================
+mark("heatmaps")
 
 # Collect all runs with position_heatmap
 runs_with_heatmap = []
@@ -216,12 +182,7 @@ else:
         row = df.loc[closest_idx]
         
         # Get reward_mode for labeling
-        if 'env.pinpad-easy.reward_mode' in run.config:
-            label = run.config['env.pinpad-easy.reward_mode']
-        elif 'reward_mode' in run.config:
-            label = run.config['reward_mode']
-        else:
-            label = run.name
+        label = configs.get(run.id, "reward_mode", run.name)
         
         # Skip progress_any
         if label == 'progress_any':
@@ -232,38 +193,12 @@ else:
     if not images_data:
         print("⚠ No images found at 400k")
     else:
-        n_samples = len(images_data)
-        
-        # Create a figure with max 4 images per row
-        n_cols = min(4, n_samples)
-        n_rows = (n_samples + n_cols - 1) // n_cols
-        fig, axes = plt.subplots(n_rows, n_cols, figsize=(4*n_cols, 4*n_rows), dpi=300)
-        if n_samples == 1:
-            axes = [axes]
-        else:
-            axes = axes.flatten()
-        
-        for idx, (ax, (run, row, label)) in enumerate(zip(axes, images_data)):
-            media_obj = row["exploration/position_heatmap"]
-            
-            if hasattr(media_obj, "_image"):
-                img = media_obj._image
-            elif isinstance(media_obj, dict) and "path" in media_obj:
-                file_path = media_obj["path"]
-                file_obj = run.file(file_path)
-                downloaded_path = file_obj.download(replace=True).name
-                img = Image.open(downloaded_path)
-            else:
-                img = media_obj
-            
-            ax.imshow(img)
-            ax.set_title(f"{label}", fontsize=16)
-            ax.axis("off")
+        images = [load_media_image(run, row["exploration/position_heatmap"]) for run, row, _ in images_data]
+        labels = [f"{label}" for _, _, label in images_data]
         
-        plt.suptitle("Position Heatmap @ 400k steps", fontsize=11, fontweight='bold')
-        plt.tight_layout()
-        fig.savefig(f"{output_dir}/sweep-heatmap-temporal.png", dpi=300, bbox_inches="tight")
-        plt.close(fig)
+        # Max 4 images per row, composed at native resolution
+        save_grid(f"{output_dir}/sweep-heatmap-temporal.png", images, labels,
+                  n_cols=4, title="Position Heatmap @ 400k steps")
         print(f"✓ Saved: {output_dir}/sweep-heatmap-temporal.png")
 
 print("\n✓ All visualizations complete!")
@@ -1,42 +1,49 @@
-import wandb
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image
-import io
 import os
 
+from cache import fetch_history
+from figure_export import save_figure
+from image_grid import save_grid
+from run_config import ConfigIndex
+from wandb_media import load_media_image
+from profiling import mark
+from run_metadata import sweep_runs
+from smoothing import smooth_runs
+from snapshot import open_api
+
 # Create output directory
 output_dir = "media/pinpad/reward-ratio-sweep"
 os.makedirs(output_dir, exist_ok=True)
 
 # Initialize the API
-api = wandb.Api()
+mark("sweep")
+api = open_api()
 
-# Fetch the sweep
-sweep = api.sweep("rm2278-university-of-cambridge/Hieros-hieros/wmk3jlws")
+# Fetch configs, states and summaries of every run in the sweep in one bulk query (cached)
+runs = sweep_runs("reward-ratio", api)
 
-print(f"Sweep: {sweep.name}")
-print(f"Found {len(sweep.runs)} runs")
+print(f"Sweep: {runs.sweep_id}")
+print(f"Found {len(runs)} runs")
 
 # =============================================================================
 # 1. Episode/Score for all runs, grouped by novelty_scale
 # =============================================================================
+mark("episode-scores")
 
-# First, group runs by novelty_reward_weight value
-runs_by_novelty = {}
+# First, group runs by novelty_reward_weight value (values are type-normalized by run_config)
+configs = ConfigIndex.from_runs(runs)
 novelty_param_key = 'novelty_reward_weight'
 
-for run in sweep.runs:
-    if novelty_param_key in run.config:
-        novelty_value = run.config[novelty_param_key]
-        if novelty_value not in runs_by_novelty:
-            runs_by_novelty[novelty_value] = []
-        runs_by_novelty[novelty_value].append(run)
+runs_by_novelty = {
+    value: [configs.runs[run_id] for run_id in run_ids]
+    for value, run_ids in configs.group_by(novelty_param_key).items()
+}
 
 if not runs_by_novelty:
     print("⚠ Could not find novelty_reward_weight parameter, using single plot")
-    runs_by_novelty = {"all": sweep.runs}
+    runs_by_novelty = {"all": runs}
 else:
     print(f"✓ Found {len(runs_by_novelty)} different novelty_reward_weight values")
 
@@ -57,17 +64,18 @@ else:
 
 for idx, novelty_val in enumerate(novelty_values):
     ax = axes[idx]
-    runs = runs_by_novelty[novelty_val]
+    novelty_runs = runs_by_novelty[novelty_val]
     
-    for run in runs:
+    curves, labels = [], []
+    for run in novelty_runs:
         # Get the config parameters for reward ratios (excluding novelty)
         found_params = {}
         
         # Get extrinsic and subgoal weights
-        if 'extrinsic_reward_weight' in run.config:
-            found_params['extr'] = run.config['extrinsic_reward_weight']
-        if 'subgoal_reward_weight' in run.config:
-            found_params['subg'] = run.config['subgoal_reward_weight']
+        if configs.get(run.id, 'extrinsic_reward_weight') is not None:
+            found_params['extr'] = configs.get(run.id, 'extrinsic_reward_weight')
+        if configs.get(run.id, 'subgoal_reward_weight') is not None:
+            found_params['subg'] = configs.get(run.id, 'subgoal_reward_weight')
         
         if found_params:
             # Create a compact label
@@ -78,7 +86,7 @@ for idx, novelty_val in enumerate(novelty_values):
             label = run.name
         
         # Fetch history
-        history = run.history(keys=["episode/score", "_step"])
+        history = fetch_history(run, ["episode/score"])
         
         if history.empty or "episode/score" not in history.columns:
             continue
@@ -89,15 +97,12 @@ for idx, novelty_val in enumerate(novelty_values):
         if df.empty:
             continue
         
-        x = df["_step"] / 1000  # thousands of steps
-        y = df["episode/score"]
-        
-        # Smooth the curve
-        window = 20
-        y_smooth = y.rolling(window=window, min_periods=1).mean()
-        
-        # Plot with label
-        ax.plot(x, y_smooth, linewidth=1.4, label=label, alpha=0.8)
+        labels.append(label)
+        curves.append((df["_step"].to_numpy(), df["episode/score"].to_numpy()))
+
+    # Smooth the panel's runs in one call, over a window of 20 logging intervals in env. steps
+    for label, (steps, _), y_smooth in zip(labels, curves, smooth_runs(curves)):
+        ax.plot(steps / 1000, y_smooth, linewidth=1.4, label=label, alpha=0.8)  # thousands of steps
     
     ax.set_xlabel("Env. Steps (×10³)", fontsize=9)
     ax.set_ylabel("Episode Return", fontsize=9)
@@ -113,17 +118,18 @@ for idx in range(n_novelty, len(axes)):
     axes[idx].axis("off")
 
 plt.tight_layout()
-fig.savefig(f"{output_dir}/sweep-episode-scores.png", dpi=300, bbox_inches="tight")
+output_path = save_figure(fig, f"{output_dir}/sweep-episode-scores.png", dpi=300, bbox_inches="tight")
 plt.close(fig)
-print(f"✓ Saved: {output_dir}/sweep-episode-scores.png (split by novelty)")
+print(f"✓ Saved: {output_path} (split by novelty)")
 
 # =============================================================================
 # 2. Subgoal Visualization (all seeds at 400k step)
 # =============================================================================
+mark("subgoals")
 
 # Collect all runs with subgoal_visualization
 runs_with_subgoal = []
-for run in sweep.runs:
+for run in runs:
     try:
         history = run.history(keys=["report/subgoal_visualization", "_step"])
         if not history.empty and "report/subgoal_visualization" in history.columns:
@@ -153,59 +159,30 @@ else:
         row = df.loc[closest_idx]
         
         # Get novelty_reward_weight and subgoal_reward_weight for labeling
-        novelty = run.config.get("novelty_reward_weight", "unknown")
-        subgoal = run.config.get("subgoal_reward_weight", "unknown")
+        novelty = configs.get(run.id, "novelty_reward_weight", "unknown")
+        subgoal = configs.get(run.id, "subgoal_reward_weight", "unknown")
         label = f"novelty={novelty}, subgoal={subgoal}"
         images_data.append((run, row, label))
     
     if not images_data:
         print("⚠ No images found at 400k")
     else:
-        n_samples = len(images_data)
-        
-        # Create a figure with max 2 images per row
-        n_cols = min(2, n_samples)
-        n_rows = (n_samples + n_cols - 1) // n_cols
-        fig, axes = plt.subplots(n_rows, n_cols, figsize=(6*n_cols, 5*n_rows), dpi=300)
-        if n_samples == 1:
-            axes = [axes]
-        else:
-            axes = axes.flatten()
+        images = [load_media_image(run, row["report/subgoal_visualization"]) for run, row, _ in images_data]
+        labels = [label for _, _, label in images_data]
         
-        for idx, (ax, (run, row, label)) in enumerate(zip(axes, images_data)):
-            media_obj = row["report/subgoal_visualization"]
-            
-            if hasattr(media_obj, "_image"):
-                img = media_obj._image
-            elif isinstance(media_obj, dict) and "path" in media_obj:
-                file_path = media_obj["path"]
-                file_obj = run.file(file_path)
-                downloaded_path = file_obj.download(replace=True).name
-                img = Image.open(downloaded_path)
-            else:
-                img = media_obj
-            
-            ax.imshow(img)
-            ax.set_title(label, fontsize=16)
-            ax.axis("off")
-        
-        # Hide unused subplots
-        for idx in range(n_samples, len(axes)):
-            axes[idx].axis("off")
-        
-        plt.suptitle("Subgoal Visualization @ 400k steps", fontsize=11, fontweight='bold')
-        plt.subplots_adjust(wspace=0.1, hspace=0.2)
-        fig.savefig(f"{output_dir}/sweep-subgoal-temporal.png", dpi=300, bbox_inches="tight")
-        plt.close(fig)
+        # Max 2 images per row, composed at native resolution
+        save_grid(f"{output_dir}/sweep-subgoal-temporal.png", images, labels,
+                  n_cols=2, title="Subgoal Visualization @ 400k steps")
         print(f"✓ Saved: {output_dir}/sweep-subgoal-temporal.png")
 
 # =============================================================================
 # 3. Position Heatmap (all seeds at 400k step)
 # =============================================================================
+mark("heatmaps")
 
 # Collect all runs with position_heatmap
 runs_with_heatmap = []
-for run in sweep.runs:
+for run in runs:
     try:
         history = run.history(keys=["exploration/position_heatmap", "_step"])
         if not history.empty and "exploration/position_heatmap" in history.columns:
@@ -235,46 +212,20 @@ else:
         row = df.loc[closest_idx]
         
         # Get novelty_reward_weight and subgoal_reward_weight for labeling
-        novelty = run.config.get("novelty_reward_weight", "unknown")
-        subgoal = run.config.get("subgoal_reward_weight", "unknown")
+        novelty = configs.get(run.id, "novelty_reward_weight", "unknown")
+        subgoal = configs.get(run.id, "subgoal_reward_weight", "unknown")
         label = f"novelty={novelty}, subgoal={subgoal}"
         images_data.append((run, row, label))
     
     if not images_data:
         print("⚠ No images found at 400k")
     else:
-        n_samples = len(images_data)
-        
-        # Create a figure with max 4 images per row
-        n_cols = min(4, n_samples)
-        n_rows = (n_samples + n_cols - 1) // n_cols
-        fig, axes = plt.subplots(n_rows, n_cols, figsize=(4*n_cols, 4*n_rows), dpi=300)
-        if n_samples == 1:
-            axes = [axes]
-        else:
-            axes = axes.flatten()
-        
-        for idx, (ax, (run, row, label)) in enumerate(zip(axes, images_data)):
-            media_obj = row["exploration/position_heatmap"]
-            
-            if hasattr(media_obj, "_image"):
-                img = media_obj._image
-            elif isinstance(media_obj, dict) and "path" in media_obj:
-                file_path = media_obj["path"]
-                file_obj = run.file(file_path)
-                downloaded_path = file_obj.download(replace=True).name
-                img = Image.open(downloaded_path)
-            else:
-                img = media_obj
-            
-            ax.imshow(img)
-            ax.set_title(label, fontsize=16)
-            ax.axis("off")
+        images = [load_media_image(run, row["exploration/position_heatmap"]) for run, row, _ in images_data]
+        labels = [label for _, _, label in images_data]
         
-        plt.suptitle("Position Heatmap @ 400k steps", fontsize=11, fontweight='bold')
-        plt.tight_layout()
-        fig.savefig(f"{output_dir}/sweep-heatmap-temporal.png", dpi=300, bbox_inches="tight")
-        plt.close(fig)
+        # Max 4 images per row, composed at native resolution
+        save_grid(f"{output_dir}/sweep-heatmap-temporal.png", images, labels,
+                  n_cols=4, title="Position Heatmap @ 400k steps")
         print(f"✓ Saved: {output_dir}/sweep-heatmap-temporal.png")
 
 print("\n✓ All visualizations complete!")
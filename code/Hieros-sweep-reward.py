@@ -1,40 +1,52 @@
-import wandb
-import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-from PIL import Image
-import io
 import os
 
+from cache import fetch_history
+from figure_export import save_figure
+from image_grid import save_grid
+from run_config import ConfigIndex
+from wandb_media import load_media_image
+from profiling import mark
+from run_metadata import sweep_runs
+from smoothing import smooth_runs
+from snapshot import open_api
+
 # Create output directory
 output_dir = "media/pinpad/reward-sweep"
 os.makedirs(output_dir, exist_ok=True)
 
 # Initialize the API
-api = wandb.Api()
+mark("sweep")
+api = open_api()
+
+# Fetch configs, states and summaries of every run in the sweep in one bulk query (cached)
+runs = sweep_runs("reward", api)
 
-# Fetch the sweep
-sweep = api.sweep("rm2278-university-of-cambridge/Hieros-hieros/jf65b2tm")
+print(f"Sweep: {runs.sweep_id}")
+print(f"Found {len(runs)} runs")
 
-print(f"Sweep: {sweep.name}")
-print(f"Found {len(sweep.runs)} runs")
+# Normalized configs (flattened, type-coerced) indexed by run id
+configs = ConfigIndex.from_runs(runs)
 
 # =============================================================================
 # 1. Episode/Score for all runs, labeled by sweep parameter
 # =============================================================================
+mark("episode-scores")
 
 fig, ax = plt.subplots(figsize=(6, 3.5), dpi=300)
 
-for run in sweep.runs:
+curves, labels = [], []
+for run in runs:
     # Get the config parameter - check what parameter is being swept
     # Common parameters: extrinsic_scale, subgoal_scale, novelty_scale
     param_name = None
     param_value = None
     
     for key in ['extrinsic_scale', 'subgoal_scale', 'novelty_scale', 'reward_scale']:
-        if key in run.config:
+        if configs.get(run.id, key) is not None:
             param_name = key
-            param_value = run.config.get(key, "unknown")
+            param_value = configs.get(run.id, key)
             break
     
     if param_name is None:
@@ -44,7 +56,7 @@ for run in sweep.runs:
         label = f"{param_name}={param_value}"
     
     # Fetch history
-    history = run.history(keys=["episode/score", "_step"])
+    history = fetch_history(run, ["episode/score"])
     
     if history.empty or "episode/score" not in history.columns:
         print(f"Skipping run {run.name} (no episode/score data)")
@@ -57,15 +69,12 @@ for run in sweep.runs:
         print(f"Skipping run {run.name} (all NaN)")
         continue
     
-    x = df["_step"] / 1000  # thousands of steps
-    y = df["episode/score"]
-    
-    # Smooth the curve
-    window = 20
-    y_smooth = y.rolling(window=window, min_periods=1).mean()
-    
-    # Plot with label
-    ax.plot(x, y_smooth, linewidth=1.4, label=label, alpha=0.8)
+    labels.append(label)
+    curves.append((df["_step"].to_numpy(), df["episode/score"].to_numpy()))
+
+# Smooth all runs in one call, over a window of 20 logging intervals in env. steps (not 20 points)
+for label, (steps, _), y_smooth in zip(labels, curves, smooth_runs(curves)):
+    ax.plot(steps / 1000, y_smooth, linewidth=1.4, label=label, alpha=0.8)  # thousands of steps
 
 ax.set_xlabel("Env. Steps (×10³)", fontsize=9)
 ax.set_ylabel("Episode Return", fontsize=9)
@@ -76,17 +85,18 @@ ax.tick_params(axis="both", labelsize=8)
 ax.grid(True, alpha=0.3)
 
 plt.tight_layout()
-fig.savefig(f"{output_dir}/sweep-episode-scores.png", dpi=300, bbox_inches="tight")
+output_path = save_figure(fig, f"{output_dir}/sweep-episode-scores.png", dpi=300, bbox_inches="tight")
 plt.close(fig)
-print(f"✓ Saved: {output_dir}/sweep-episode-scores.png")
+print(f"✓ Saved: {output_path}")
 
 # =============================================================================
 # 2. Subgoal Visualization (temporal progression from left to right)
 # =============================================================================
+mark("subgoals")
 
 # Pick the first run that has report/subgoal_visualization data
 selected_run = None
-for run in sweep.runs:
+for run in runs:
     # Check if this run has any report/subgoal_visualization media
     try:
         history = run.history(keys=["report/subgoal_visualization"])
@@ -122,44 +132,11 @@ else:
             closest_idx = (df["_step"] - target).abs().idxmin()
             sampled_rows.append(df.loc[closest_idx])
         
-        sampled = pd.DataFrame(sampled_rows)
-        n_samples = len(sampled)
-        
-        # Create a figure with 5 rows × 1 column (vertical layout)
-        fig, axes = plt.subplots(5, 1, figsize=(6, 10), dpi=300)
-        axes = axes.flatten()
+        images = [load_media_image(selected_run, row["report/subgoal_visualization"]) for row in sampled_rows]
+        labels = [f"Step {row['_step'] / 1000:.0f}k" for row in sampled_rows]
         
-        for idx, (ax, (_, row)) in enumerate(zip(axes, sampled.iterrows())):
-            # W&B stores media as wandb.data_types.Image objects
-            # We need to download the actual image
-            media_obj = row["report/subgoal_visualization"]
-            
-            if hasattr(media_obj, "_image"):
-                # It's a wandb.Image, get the PIL image
-                img = media_obj._image
-            elif isinstance(media_obj, dict) and "path" in media_obj:
-                # Fetch from wandb file
-                file_path = media_obj["path"]
-                # Download the file to a temporary location
-                file_obj = selected_run.file(file_path)
-                downloaded_path = file_obj.download(replace=True).name
-                img = Image.open(downloaded_path)
-            else:
-                # Try to render as-is
-                img = media_obj
-            
-            ax.imshow(img)
-            step_thousands = row['_step'] / 1000
-            ax.set_title(f"Step {step_thousands:.0f}k", fontsize=7)
-            ax.axis("off")
-        
-        # Hide unused subplots
-        for idx in range(n_samples, len(axes)):
-            axes[idx].axis("off")
-        
-        plt.tight_layout()
-        fig.savefig(f"{output_dir}/sweep-subgoal-temporal.png", dpi=300, bbox_inches="tight")
-        plt.close(fig)
+        # Vertical layout
+        save_grid(f"{output_dir}/sweep-subgoal-temporal.png", images, labels, n_cols=1)
         print(f"✓ Saved: {output_dir}/sweep-subgoal-temporal.png")
     else:
         print("⚠ No valid report/subgoal_visualization data found")
@@ -167,9 +144,10 @@ else:
 # =============================================================================
 # 3. Position Heatmap (temporal progression)
 # =============================================================================
+mark("heatmaps")
 
 selected_run = None
-for run in sweep.runs:
+for run in runs:
     try:
         history = run.history(keys=["exploration/position_heatmap"])
         if not history.empty and "exploration/position_heatmap" in history.columns:
@@ -201,37 +179,11 @@ else:
             closest_idx = (df["_step"] - target).abs().idxmin()
             sampled_rows.append(df.loc[closest_idx])
         
-        sampled = pd.DataFrame(sampled_rows)
-        n_samples = len(sampled)
-        
-        fig, axes = plt.subplots(2, 3, figsize=(9, 6), dpi=300)
-        axes = axes.flatten()
-        
-        for idx, (ax, (_, row)) in enumerate(zip(axes, sampled.iterrows())):
-            media_obj = row["exploration/position_heatmap"]
-            
-            if hasattr(media_obj, "_image"):
-                img = media_obj._image
-            elif isinstance(media_obj, dict) and "path" in media_obj:
-                file_path = media_obj["path"]
-                file_obj = selected_run.file(file_path)
-                downloaded_path = file_obj.download(replace=True).name
-                img = Image.open(downloaded_path)
-            else:
-                img = media_obj
-            
-            ax.imshow(img)
-            step_thousands = row['_step'] / 1000
-            ax.set_title(f"Step {step_thousands:.0f}k", fontsize=7)
-            ax.axis("off")
-        
-        # Hide unused subplots
-        for idx in range(n_samples, len(axes)):
-            axes[idx].axis("off")
+        images = [load_media_image(selected_run, row["exploration/position_heatmap"]) for row in sampled_rows]
+        labels = [f"Step {row['_step'] / 1000:.0f}k" for row in sampled_rows]
         
-        plt.tight_layout()
-        fig.savefig(f"{output_dir}/sweep-heatmap-temporal.png", dpi=300, bbox_inches="tight")
-        plt.close(fig)
+        # 2 rows × 3 columns
+        save_grid(f"{output_dir}/sweep-heatmap-temporal.png", images, labels, n_cols=3)
         print(f"✓ Saved: {output_dir}/sweep-heatmap-temporal.png")
     else:
         print("⚠ No valid position_heatmap data found")
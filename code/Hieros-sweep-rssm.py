@@ -1,36 +1,39 @@
-import wandb
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import os
 
+from cache import fetch_history
+from figure_export import save_figure
+from run_metadata import sweep_runs
+from smoothing import smooth_runs
+from snapshot import open_api
+
 # Create output directory
 output_dir = "media/pinpad/rssm-sweep"
 os.makedirs(output_dir, exist_ok=True)
 
 # Initialize the API
-api = wandb.Api()
+api = open_api()
 
-# Fetch the sweep
-sweep = api.sweep("rm2278-university-of-cambridge/Hieros-hieros/uhfc6bh3")
+# Fetch configs, states and summaries of every run in the sweep in one bulk query (cached)
+runs = sweep_runs("rssm", api)
 
-print(f"Sweep: {sweep.name}")
-print(f"Found {len(sweep.runs)} runs")
+print(f"Sweep: {runs.sweep_id}")
+print(f"Found {len(runs)} runs")
 
 # =============================================================================
 # Episode/Score for all runs, labeled by sweep parameter
 # =============================================================================
 
 # First, print config of first run to see what parameters exist
-if sweep.runs:
+if runs:
     print(f"\nChecking config parameters...")
-    for idx, run in enumerate(sweep.runs):
+    for idx, run in enumerate(runs):
         print(f"\nRun {idx+1}: {run.name} (ID: {run.id})")
-        # Fetch history to see max step
-        history = run.history(keys=["episode/score", "_step"])
-        if not history.empty:
-            max_step = history["_step"].max()
-            print(f"  Max step: {max_step}")
+        # Max step comes from the run summary, no history download needed
+        if run.last_step is not None:
+            print(f"  Max step: {run.last_step}")
         # Check for common parameters that might differ
         for key in ['dynamics_model', 'steps', 'seed', 'dyn_cell', 'dyn_stoch', 'dyn_deter', 'max_hierarchy']:
             if key in run.config:
@@ -38,9 +41,10 @@ if sweep.runs:
 
 fig, ax = plt.subplots(figsize=(6, 3.5), dpi=300)
 
-for idx, run in enumerate(sweep.runs):
+curves, labels = [], []
+for idx, run in enumerate(runs):
     # Fetch history first to determine label
-    history = run.history(keys=["episode/score", "_step"])
+    history = fetch_history(run, ["episode/score"])
     
     if history.empty or "episode/score" not in history.columns:
         print(f"Skipping run {run.name} (no episode/score data)")
@@ -60,15 +64,12 @@ for idx, run in enumerate(sweep.runs):
         max_step = df["_step"].max()
         label = f"RSSM ({int(max_step/1000)}k steps)"
     
-    x = df["_step"] / 1000  # thousands of steps
-    y = df["episode/score"]
-    
-    # Smooth the curve
-    window = 20
-    y_smooth = y.rolling(window=window, min_periods=1).mean()
-    
-    # Plot with label
-    ax.plot(x, y_smooth, linewidth=1.4, label=label, alpha=0.8)
+    labels.append(label)
+    curves.append((df["_step"].to_numpy(), df["episode/score"].to_numpy()))
+
+# Smooth all runs in one call, over a window of 20 logging intervals in env. steps (not 20 points)
+for label, (steps, _), y_smooth in zip(labels, curves, smooth_runs(curves)):
+    ax.plot(steps / 1000, y_smooth, linewidth=1.4, label=label, alpha=0.8)  # thousands of steps
 
 ax.set_xlabel("Env. Steps (×10³)", fontsize=9)
 ax.set_ylabel("Episode Return", fontsize=9)
@@ -79,8 +80,8 @@ ax.tick_params(axis="both", labelsize=8)
 ax.grid(True, alpha=0.3)
 
 plt.tight_layout()
-fig.savefig(f"{output_dir}/sweep-episode-scores.png", dpi=300, bbox_inches="tight")
+output_path = save_figure(fig, f"{output_dir}/sweep-episode-scores.png", dpi=300, bbox_inches="tight")
 plt.close(fig)
-print(f"✓ Saved: {output_dir}/sweep-episode-scores.png")
+print(f"✓ Saved: {output_path}")
 
 print("\n✓ Episode scores visualization complete!")
@@ -0,0 +1,399 @@
+"""
+解析結果のローカルキャッシュ
+W&Bから取得・デコードしたデータを HWM_CACHE_DIR (既定: cache/) 以下に保存する
+
+history はラン・メトリクスごとに cache/history/<run_id>/<key>.parquet として保存し、
+(_step, <key>) の2列を持つ。実行中のランから取得した列は未完了として印を付け、次に読むときに
+前回より後に記録された点だけを取得して追記する（ランが終了した後の取得で完了になる）。
+_step は int64 を差分符号化 (DELTA_BINARY_PACKED)、値は float32 で持つ。
+派生メトリクス（ヒートマップから計算した探索指標など）も同じ形式で保存するので、
+W&Bに記録されたメトリクスと同じように読み出せる。
+
+スクリプトは fetch_history で取得精度 (HWM_FIDELITY) を切り替える:
+    full    : 全点（scan_history をキャッシュ）。論文の図はこれで作る（既定）
+    grid    : 全点を固定幅のステップグリッドでビン平均した決定的な間引き（プレビュー用）
+    sampled : run.history の既定動作（サーバ側のランダムな約500点。再現性は無い）
+
+図の大きさに合わせて読むときは load_curve を使う。全点のhistoryから ×4, ×16, ×64 に
+間引いたピラミッド（バケットごとの平均・最小・最大）を cache/pyramid/<run_id>/<key>/ に作っておき、
+要求された点数を満たす最も粗いレベルを読むので、描画コストはランの長さではなく図の幅で決まる。
+
+複数のスクリプトが（NFS上の共有ディレクトリも含めて）同時に同じキャッシュを使えるように、
+書き込みは一時ファイルからの rename で原子的に行い、キーごとのロック（スレッド間は
+threading.Lock、プロセス間は fcntl.lockf）で同じオブジェクトの取得を1回にまとめる (single-flight)。
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import math
+import os
+import secrets
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from profiling import stage
+
+CACHE_DIR = Path(os.environ.get("HWM_CACHE_DIR", "cache"))
+FIDELITY = os.environ.get("HWM_FIDELITY", "full").lower()
+GRID_POINTS = 500
+PYRAMID_FACTORS = (1, 4, 16, 64)
+# これ以上 history が増えないランの状態
+FINAL_STATES = {"finished", "crashed", "failed", "killed"}
+
+# W&Bには存在せず、ローカルのバッチ処理で作られるメトリクスと、その生成スクリプト
+DERIVED_METRICS = {
+    "exploration/coverage": "code/exploration_timeseries.py",
+    "exploration/entropy": "code/exploration_timeseries.py",
+    "exploration/mean_occupancy": "code/exploration_timeseries.py",
+}
+
+
+def cache_path(*parts):
+    """キャッシュ内のパスを返す（親ディレクトリは作成する）"""
+    path = CACHE_DIR.joinpath(*map(str, parts))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+@contextlib.contextmanager
+def atomic_write(path):
+    """一時ファイルのパスを渡し、書き終えたら path に rename する（読み手は書きかけを見ない）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # 同じディレクトリに置くので rename は原子的。ドットで始まり .tmp で終わるので glob に掛からない
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{secrets.token_hex(4)}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+@contextlib.contextmanager
+def key_lock(path):
+    """キャッシュ上のパスごとの排他ロック（同じプロセスのスレッド間とプロセス間の両方）"""
+    path = Path(path)
+    try:
+        key = str(path.resolve().relative_to(CACHE_DIR.resolve()))
+    except ValueError:
+        key = str(path.resolve())
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(key, threading.Lock())
+    # fcntl のロックはプロセス単位なので、スレッド間は threading.Lock で排他する
+    lock_file = cache_path("locks", hashlib.sha1(key.encode()).hexdigest()[:16] + ".lock")
+    with thread_lock, open(lock_file, "a+b") as f:
+        # lockf (POSIXロック) は NFS 上でもロックデーモン経由で有効
+        fcntl.lockf(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.lockf(f, fcntl.LOCK_UN)
+
+
+def single_flight(path, produce, write):
+    """path が無いときだけ write(produce(), 一時ファイル) で作り、path を返す
+
+    同じ path を作ろうとしている他のスレッド・プロセスはロックで待ち、出来上がったものを使う。
+    """
+    path = Path(path)
+    if not path.exists():
+        with key_lock(path):
+            if not path.exists():
+                with atomic_write(path) as tmp:
+                    write(produce(), tmp)
+    return path
+
+
+def write_npy(array, path):
+    with open(path, "wb") as f:
+        np.save(f, array)
+
+
+def write_parquet(df, path):
+    df.to_parquet(path, index=False)
+
+
+def write_history_parquet(df, path, meta=None):
+    """(_step, 値) の表を、ステップは差分符号化・値は float32 で書き込む（meta はスキーマのメタデータ）"""
+    table = pa.table({
+        "_step": pa.array(df["_step"].to_numpy(dtype=np.int64)),
+        **{key: pa.array(df[key].to_numpy(dtype=np.float32)) for key in df.columns if key != "_step"},
+    })
+    if meta is not None:
+        table = table.replace_schema_metadata({"hwm": json.dumps(meta)})
+    # 単調増加のステップは差分がほぼ一定なので、辞書符号化より差分符号化の方がずっと小さい
+    pq.write_table(table, path, compression="zstd", use_dictionary=False,
+                   column_encoding={"_step": "DELTA_BINARY_PACKED"})
+
+
+def history_file(run_id, key):
+    """メトリクス1つ分のhistoryキャッシュのパス"""
+    return cache_path("history", run_id, key.replace("/", "~") + ".parquet")
+
+
+def history_meta(path):
+    """historyキャッシュの状態 {"complete": ランが終了してから取得したか, "checked_step": 確認時のサマリーの _step}
+
+    メタデータの無い古いキャッシュは、完了しているか分からないので未完了として扱う。
+    """
+    meta = pq.read_schema(path).metadata or {}
+    return json.loads(meta.get(b"hwm", b'{"complete": false, "checked_step": null}'))
+
+
+def save_history_column(run_id, key, df, complete=True, checked_step=None):
+    """(_step, key) の2列をキャッシュに保存する
+
+    実行中のランから取得した列は complete=False で保存し、次に読むときに追記の対象にする。
+    """
+    df = df[["_step", key]].dropna(subset=[key]).sort_values("_step")
+    df = df.drop_duplicates("_step", keep="last")
+    with atomic_write(history_file(run_id, key)) as tmp:
+        write_history_parquet(df, tmp, {"complete": complete, "checked_step": checked_step})
+    # ピラミッドも一緒に作っておく（読むときは解像度に合ったレベルだけを読む）
+    _ensure_pyramid(run_id, key)
+
+
+def _fetch_history_column(run, key, min_step=None):
+    """W&Bから1メトリクス分のhistory（min_step 以降）を取得する"""
+    if min_step is None:
+        rows = run.scan_history(keys=["_step", key])
+    else:
+        rows = run.scan_history(keys=["_step", key], min_step=min_step)
+    df = pd.DataFrame(rows, columns=["_step", key])
+    df[key] = pd.to_numeric(df[key], errors="coerce")
+    return df
+
+
+def _needs_update(run, path):
+    """キャッシュが無いか、未完了で前回の確認からランが進んだ（または終了した）か"""
+    if not path.exists():
+        return True
+    meta = history_meta(path)
+    if meta["complete"]:
+        return False
+    last_step = run.summary.get("_step")
+    if run.state in FINAL_STATES or last_step is None or meta["checked_step"] is None:
+        return True
+    return last_step > meta["checked_step"]
+
+
+def _update_history_column(run, key, path):
+    """全点を取得するか、キャッシュの最後のステップより後の点だけを取得して追記する（キーのロック内で呼ぶ）"""
+    complete = run.state in FINAL_STATES
+    checked_step = run.summary.get("_step")
+    if not path.exists():
+        save_history_column(run.id, key, _fetch_history_column(run, key), complete, checked_step)
+        return
+    cached = pd.read_parquet(path)
+    after = int(cached["_step"].max()) if len(cached) else -1
+    new = _fetch_history_column(run, key, min_step=after + 1)
+    new = new[new["_step"] > after]
+    save_history_column(run.id, key, pd.concat([cached, new], ignore_index=True), complete, checked_step)
+
+
+def refresh_history(run, keys):
+    """keys の historyキャッシュを、ランの現在の状態に合わせて取得・追記する
+
+    終了後に取得した列は二度と取得しない。実行中のランの列は、サマリーの _step が
+    前回の確認より進んでいるときだけ、追記分を scan_history(min_step=...) で取得する。
+    """
+    if getattr(run, "is_snapshot", False):
+        return
+    for key in keys:
+        path = history_file(run.id, key)
+        if key == "_step" or key in DERIVED_METRICS:
+            continue
+        if _needs_update(run, path):
+            with key_lock(path):
+                # 他のプロセスが取得中だったなら、ロックが取れた時点で更新済み
+                if _needs_update(run, path):
+                    _update_history_column(run, key, path)
+
+
+def refresh_cached_history(run):
+    """ランのキャッシュ済みの全メトリクスを refresh_history する"""
+    directory = CACHE_DIR / "history" / run.id
+    keys = [path.stem.replace("~", "/") for path in directory.glob("*.parquet")] if directory.exists() else []
+    refresh_history(run, keys)
+
+
+@stage("fetch")
+def load_history(run, keys):
+    """run.history(keys=...) の代わりにキャッシュ経由でスカラーメトリクスを読む
+
+    キャッシュに無いメトリクスはW&Bから取得して保存し、実行中のランの列は新しく記録された点を追記する。
+    戻り値は _step で外部結合した DataFrame（run.history と同じ形）。
+    """
+    if getattr(run, "is_snapshot", False):
+        # スナップショットのランは間引き済みのhistoryをそのまま返す
+        return run.history(keys=keys)
+
+    refresh_history(run, keys)
+    frames = []
+    for key in keys:
+        if key == "_step":
+            continue
+        path = history_file(run.id, key)
+        if not path.exists():
+            if key in DERIVED_METRICS:
+                print(f"⚠ {key} for run {run.name} is not cached; run {DERIVED_METRICS[key]} first")
+            continue
+        frames.append(pd.read_parquet(path).set_index("_step"))
+
+    if not frames:
+        return pd.DataFrame(columns=["_step"])
+    history = pd.concat(frames, axis=1, join="outer").sort_index()
+    return history.reset_index()
+
+
+def grid_step(max_step, n_points=GRID_POINTS):
+    """max_step を約 n_points 個に分けるビン幅（1, 2, 5 × 10^k に切り上げ）
+
+    切りの良い幅に丸めるので、ランが少し伸びてもグリッドは変わらない。
+    """
+    raw = max(max_step / n_points, 1)
+    scale = 10 ** math.floor(math.log10(raw))
+    return next(m * scale for m in (1, 2, 5, 10) if m * scale >= raw)
+
+
+def grid_downsample(history, width=None, n_points=GRID_POINTS):
+    """_step を幅 width のビンに分けて各メトリクスを平均する（_step はビンの中心）"""
+    if history.empty:
+        return history
+    width = width or grid_step(history["_step"].max(), n_points)
+    bins = (history["_step"] // width).astype(np.int64)
+    grid = history.drop(columns="_step").groupby(bins).mean()
+    grid.insert(0, "_step", grid.index * width + width // 2)
+    return grid.reset_index(drop=True)
+
+
+def fetch_history(run, keys, mode=None):
+    """取得精度 mode（既定は HWM_FIDELITY）で run のスカラーメトリクスを読む"""
+    mode = (mode or FIDELITY).lower()
+    keys = [key for key in keys if key != "_step"]
+    if mode == "sampled":
+        return run.history(keys=keys + ["_step"])
+    history = load_history(run, keys)
+    if mode == "grid":
+        return grid_downsample(history)
+    if mode != "full":
+        raise ValueError(f"unknown HWM_FIDELITY: {mode} (expected full, grid or sampled)")
+    return history
+
+
+def pyramid_file(run_id, key, factor):
+    """historyを factor 点ずつのバケットにまとめたピラミッドのレベルのパス"""
+    return cache_path("pyramid", run_id, key.replace("/", "~"), f"x{factor}.parquet")
+
+
+def build_pyramid_level(steps, values, factor):
+    """連続する factor 点ごとの (_step, mean, min, max, count)。_step はバケット内の平均"""
+    steps = np.asarray(steps, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    starts = np.arange(0, len(values), factor)
+    if len(starts) == 0:
+        return pd.DataFrame({"_step": [], "mean": [], "min": [], "max": [], "count": []})
+    count = np.diff(np.append(starts, len(values)))
+    return pd.DataFrame({
+        "_step": np.round(np.add.reduceat(steps, starts) / count).astype(np.int64),
+        "mean": (np.add.reduceat(values, starts) / count).astype(np.float32),
+        "min": np.minimum.reduceat(values, starts).astype(np.float32),
+        "max": np.maximum.reduceat(values, starts).astype(np.float32),
+        "count": count.astype(np.int32),
+    })
+
+
+def pyramid_factor(n_rows, n_points):
+    """n_rows 点の系列を n_points 点以上で描くのに使える、最も粗いレベルの倍率"""
+    if not n_points:
+        return 1
+    return max((f for f in PYRAMID_FACTORS if n_rows // f >= n_points), default=1)
+
+
+def _ensure_pyramid(run_id, key):
+    """historyキャッシュからピラミッドの全レベルを作る（historyの方が新しければ作り直す）"""
+    source = history_file(run_id, key)
+    coarsest = pyramid_file(run_id, key, PYRAMID_FACTORS[-1])
+
+    def fresh():
+        return coarsest.exists() and coarsest.stat().st_mtime >= source.stat().st_mtime
+
+    if fresh():
+        return
+    with key_lock(coarsest):
+        if fresh():
+            return
+        history = pd.read_parquet(source)
+        # 最も粗いレベルを最後に書くので、それがあれば全レベルが揃っている
+        for factor in PYRAMID_FACTORS[1:]:
+            level = build_pyramid_level(history["_step"], history[key], factor)
+            with atomic_write(pyramid_file(run_id, key, factor)) as tmp:
+                write_parquet(level, tmp)
+
+
+def load_curve(run, key, n_points=None):
+    """key の系列を n_points 点以上の解像度で読む（ピラミッドから最も粗いレベルを選ぶ）
+
+    戻り値は (_step, mean, min, max, count) の DataFrame で、attrs["factor"] に選んだ倍率を持つ。
+    倍率1は全点のhistoryそのもの（mean = min = max）。
+    """
+    if getattr(run, "is_snapshot", False):
+        history = run.history(keys=[key])
+        history = history.dropna(subset=[key]) if key in history.columns else pd.DataFrame({"_step": [], key: []})
+        factor = pyramid_factor(len(history), n_points)
+        curve = build_pyramid_level(history["_step"], history[key], factor)
+        curve.attrs["factor"] = factor
+        return curve
+
+    source = history_file(run.id, key)
+    refresh_history(run, [key])
+    if not source.exists():
+        # キャッシュに無い派生メトリクス
+        print(f"⚠ {key} for run {run.name} is not cached; run {DERIVED_METRICS[key]} first")
+        factor, curve = 1, build_pyramid_level([], [], 1)
+    else:
+        factor = pyramid_factor(pq.read_metadata(source).num_rows, n_points)
+        if factor == 1:
+            history = pd.read_parquet(source)
+            curve = build_pyramid_level(history["_step"], history[key], 1)
+        else:
+            _ensure_pyramid(run.id, key)
+            curve = pd.read_parquet(pyramid_file(run.id, key, factor))
+    curve.attrs["factor"] = factor
+    return curve
+
+
+def concat_runs(frames, attrs):
+    """ランごとの history をまとめた1つの表にする（pd.concat して属性列を足す代わり）
+
+    frames: ランごとの DataFrame、attrs: ランごとの属性の辞書 (run_id, max_hierarchy など)。
+    値は float32、_step は収まれば int32 にし、ラン単位の属性は行ごとに繰り返さず
+    ランの番号をコードに持つカテゴリ型の列にする。
+    """
+    lengths = [len(frame) for frame in frames]
+    data = pd.concat(frames, ignore_index=True)
+    for key in data.columns:
+        if key != "_step" and data[key].dtype.kind == "f":
+            data[key] = data[key].astype(np.float32)
+    if len(data) and data["_step"].max() < np.iinfo(np.int32).max:
+        data["_step"] = data["_step"].astype(np.int32)
+
+    run_index = np.repeat(np.arange(len(frames)), lengths)
+    for name in dict.fromkeys(key for attr in attrs for key in attr):
+        values = [attr.get(name) for attr in attrs]
+        categories = sorted({v for v in values if v is not None}, key=lambda v: (str(type(v)), v))
+        lookup = {value: code for code, value in enumerate(categories)}
+        run_codes = np.array([lookup.get(v, -1) for v in values])
+        data[name] = pd.Categorical.from_codes(run_codes[run_index], categories=categories)
+    return data
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+学習の不安定化・崩壊の逐次検出
+各ランの episode/score と train/Subactor-N/model_loss を記録順に1点ずつ流し、1点あたり O(1) の
+検出器で崩壊イベント（発生ステップ付き）を見つける。
+
+    episode/score : 平滑化したスコアがピークから大きく下がる (drawdown) と、平均の持続的な低下 (Page-Hinkley)
+    model_loss    : 平均の持続的な上昇 (Page-Hinkley)
+
+検出器の状態と見つけたイベントはランごとの要約として cache/collapse/<run_id>.json に保存し、
+次回は前回の最終ステップより後の点だけを（historyキャッシュに追記して）続きから流す。スイープのメタデータ
+（最終ステップ）が前回から変わっていないランは取得自体を省くので、実行中の全スイープに対して
+定期的に回し続けられる。
+
+    python code/collapse_detector.py hierarchy rssm
+    python code/collapse_detector.py --watch --interval 300
+"""
+
+import argparse
+import json
+import math
+import time
+
+from cache import atomic_write, cache_path, key_lock, load_history
+from run_config import ConfigIndex
+from run_metadata import sweep_runs
+from subactor_tensor import discover_subactor_keys
+from sweeps import SWEEPS
+
+SCORE_KEY = "episode/score"
+LOSS_METRIC = "model_loss"
+
+
+class Drawdown:
+    """平滑化した値がピークから fraction × (ピーク - 最低値) 以上下がったら検出する
+
+    ノイズの揺らぎを拾わないように、下げ幅が平滑化値からの残差の標準偏差の min_drop 倍に
+    満たないものは無視する。一度検出したら、下げ幅の半分まで回復するまで次のイベントは出さない。
+    イベントのステップは、検出した点ではなく下落が始まったピークのステップとする。
+    """
+
+    def __init__(self, fraction=0.5, min_drop=3.0, halflife=10, warmup=20):
+        self.fraction = fraction
+        self.min_drop = min_drop
+        self.decay = 0.5 ** (1 / halflife)
+        self.warmup = warmup
+        self.n = 0
+        self.ema = 0.0
+        self.weight = 0.0
+        self.residual = 0.0
+        self.peak = -math.inf
+        self.peak_step = None
+        self.floor = math.inf
+        self.armed = True
+
+    def update(self, value, step):
+        if self.n:
+            # 平滑化値からの残差の二乗平均（ノイズの大きさ）
+            error = value - self.ema / self.weight
+            self.residual += (error ** 2 - self.residual) / self.n
+        self.n += 1
+        # 初期値0への偏りを重みの和で除く指数移動平均
+        self.ema = self.decay * self.ema + (1 - self.decay) * value
+        self.weight = self.decay * self.weight + (1 - self.decay)
+        smooth = self.ema / self.weight
+        if smooth > self.peak:
+            self.peak, self.peak_step = smooth, step
+        self.floor = min(self.floor, smooth)
+        if self.n < self.warmup or self.peak <= self.floor:
+            return None
+        drop = (self.peak - smooth) / (self.peak - self.floor)
+        if self.armed and drop >= self.fraction and self.peak - smooth >= self.min_drop * math.sqrt(self.residual):
+            self.armed = False
+            return {"step": self.peak_step, "peak": self.peak, "value": smooth, "drop": drop}
+        if not self.armed and drop < self.fraction / 2:
+            self.armed = True
+        return None
+
+
+class PageHinkley:
+    """平均の持続的な変化を検出する Page-Hinkley 検定（direction=+1 で上昇、-1 で低下）
+
+    偏差は実行中の標準偏差で割るので、delta と threshold は標準偏差を単位とする。
+    検出したら統計量を初期化し、変化後の水準を基準に次の変化を待つ。イベントのステップは、累積和が
+    最後に極値を取った点（変化点の推定）とする。
+    """
+
+    def __init__(self, direction=1, delta=0.5, threshold=20.0, warmup=30):
+        self.direction = direction
+        self.delta = delta
+        self.threshold = threshold
+        self.warmup = warmup
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.cum = 0.0
+        self.extreme = 0.0
+        self.change_step = None
+
+    def update(self, value, step):
+        # Welford の方法で平均と分散を更新する
+        self.n += 1
+        diff = value - self.mean
+        self.mean += diff / self.n
+        self.m2 += diff * (value - self.mean)
+        if self.n < self.warmup:
+            return None
+        std = math.sqrt(self.m2 / (self.n - 1)) or 1.0
+        self.cum += self.direction * (value - self.mean) / std - self.delta
+        if self.change_step is None or self.cum <= self.extreme:
+            self.extreme = min(self.extreme, self.cum)
+            self.change_step = step
+        if self.cum - self.extreme > self.threshold:
+            event = {"step": self.change_step, "mean": self.mean, "statistic": self.cum - self.extreme}
+            self.reset()
+            return event
+        return None
+
+
+DETECTORS = {"drawdown": Drawdown, "page_hinkley": PageHinkley}
+
+
+def metric_detectors(key):
+    """メトリクスに掛ける検出器 {名前: 検出器}"""
+    if key == SCORE_KEY:
+        return {"drawdown": Drawdown(), "page_hinkley": PageHinkley(direction=-1)}
+    return {"page_hinkley": PageHinkley(direction=1)}
+
+
+def _dump(detector):
+    return {"type": type(detector).__name__, **vars(detector)}
+
+
+def _load(state):
+    state = dict(state)
+    cls = {cls.__name__: cls for cls in DETECTORS.values()}[state.pop("type")]
+    # 既定値で作ってから上書きするので、後から加わった属性を持たない古い状態も読める
+    detector = cls()
+    detector.__dict__.update(state)
+    return detector
+
+
+class RunMonitor:
+    """1ランの全メトリクスの検出器と、見つけたイベント"""
+
+    def __init__(self, run_id, state=None):
+        state = state or {}
+        self.run_id = run_id
+        self.seen_step = state.get("seen_step")
+        self.last_steps = state.get("last_steps", {})
+        self.events = state.get("events", [])
+        self.detectors = {key: {name: _load(d) for name, d in detectors.items()}
+                          for key, detectors in state.get("detectors", {}).items()}
+
+    @classmethod
+    def load(cls, run_id):
+        path = summary_file(run_id)
+        return cls(run_id, json.loads(path.read_text()) if path.exists() else None)
+
+    def update(self, key, steps, values):
+        """key の新しい点を順に流し、見つけたイベントを返す（last_steps 以前の点は無視する）"""
+        detectors = self.detectors.setdefault(key, metric_detectors(key))
+        last = self.last_steps.get(key, -1)
+        found = []
+        for step, value in zip(steps, values):
+            if step <= last or value is None or not math.isfinite(value):
+                continue
+            last = step
+            for name, detector in detectors.items():
+                event = detector.update(float(value), int(step))
+                if event is not None:
+                    # step は変化の始まり、detected_step は検出器が判定を下した点
+                    found.append({"metric": key, "detector": name, "detected_step": int(step), **event})
+        self.last_steps[key] = int(last)
+        self.events.extend(found)
+        return found
+
+    def summary(self):
+        collapses = [e for e in self.events if e["metric"] == SCORE_KEY]
+        return {
+            "n_events": len(self.events),
+            "n_score_events": len(collapses),
+            "first_collapse_step": min((e["step"] for e in collapses), default=None),
+        }
+
+    def save(self):
+        state = {
+            "run_id": self.run_id,
+            "seen_step": self.seen_step,
+            "last_steps": self.last_steps,
+            "summary": self.summary(),
+            "events": self.events,
+            "detectors": {key: {name: _dump(d) for name, d in detectors.items()}
+                          for key, detectors in self.detectors.items()},
+        }
+        with atomic_write(summary_file(self.run_id)) as tmp:
+            tmp.write_text(json.dumps(state, indent=1))
+
+
+def summary_file(run_id):
+    return cache_path("collapse", f"{run_id}.json")
+
+
+def monitored_keys(run):
+    """検出の対象にするメトリクス（スコアと、記録されている全レベルの model_loss）"""
+    subactor = discover_subactor_keys(run.summary.keys())
+    return [SCORE_KEY] + [key for (_, metric), key in sorted(subactor.items()) if metric == LOSS_METRIC]
+
+
+def new_points(run, key, after):
+    """key の after より後の (steps, values)
+
+    load_history はキャッシュの列に前回より後の点だけを追記してから読むので、実行中のランも、
+    実行中にキャッシュされてから終了したランも、最後まで記録された点が得られる。
+    """
+    history = load_history(run, [key])
+    if key not in history.columns:
+        return [], []
+    history = history[history["_step"] > after].dropna(subset=[key])
+    return history["_step"].tolist(), history[key].tolist()
+
+
+def check_run(run):
+    """ランの新しい点を検出器に流し、見つけたイベントを返す。前回から進んでいなければ何もしない"""
+    with key_lock(summary_file(run.id)):
+        monitor = RunMonitor.load(run.id)
+        if monitor.seen_step is not None and monitor.seen_step == run.last_step:
+            return monitor, []
+        found = []
+        for key in monitored_keys(run):
+            steps, values = new_points(run, key, monitor.last_steps.get(key, -1))
+            found += monitor.update(key, steps, values)
+        monitor.seen_step = run.last_step
+        monitor.save()
+    return monitor, found
+
+
+def check_sweep(name, api=None, refresh=False):
+    """スイープの全ランを確認し、{run_id: (RunInfo, RunMonitor)} を返す"""
+    results = {}
+    for run in sweep_runs(name, api, refresh=refresh):
+        monitor, found = check_run(run)
+        for event in found:
+            print(f"⚠ {run.name}: {event['detector']} on {event['metric']} at step {event['step']}"
+                  f" (detected at {event['detected_step']})")
+        results[run.id] = (run, monitor)
+    return results
+
+
+def report(name, results):
+    """掃引パラメータの値ごとに、崩壊したランの数をまとめる"""
+    param = SWEEPS[name]["param"] if name in SWEEPS else None
+    configs = ConfigIndex.from_runs([run for run, _ in results.values()])
+    groups = {}
+    for run, monitor in results.values():
+        groups.setdefault(configs.get(run.id, param) if param else None, []).append((run, monitor))
+    print(f"\n=== {name}: collapse events on {SCORE_KEY} ===")
+    for value, members in sorted(groups.items(), key=lambda item: str(item[0])):
+        collapsed = [(run, m.summary()) for run, m in members if m.summary()["n_score_events"]]
+        head = f"{param}={value}" if param else "all runs"
+        print(f"{head}: {len(collapsed)}/{len(members)} runs collapsed")
+        for run, summary in collapsed:
+            print(f"    {run.name}: first at step {summary['first_collapse_step']}"
+                  f" ({summary['n_score_events']} events)")
+
+
+def main():
+    from snapshot import open_api
+
+    parser = argparse.ArgumentParser(description="Detect training collapse in streaming score and model-loss curves")
+    parser.add_argument("sweeps", nargs="*", default=list(SWEEPS), help="sweep names in sweeps.py")
+    parser.add_argument("--watch", action="store_true", help="keep polling the sweeps")
+    parser.add_argument("--interval", type=int, default=300, help="seconds between polls with --watch")
+    args = parser.parse_args()
+
+    api = open_api()
+    while True:
+        for name in args.sweeps:
+            results = check_sweep(name, api, refresh=args.watch)
+            if not args.watch:
+                report(name, results)
+        if not args.watch:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+実行中スイープのローカルダッシュボード
+historyキャッシュと Director の JSONL を差分だけ読み込み（JSONLは director_ingest の
+バイトオフセット、キャッシュは最後のステップ以降）、スクリプトと同じステップ幅の移動平均の学習曲線を
+http://localhost:<port>/ で自動更新表示する。更新コストは新しいデータ量にだけ比例し、
+描画は系列ごとに一定点数へ間引いた曲線だけを使うので、学習が進んでも重くならない。
+
+    python code/dashboard.py --jsonl director-result/*.jsonl --port 8050
+"""
+
+import argparse
+import bisect
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from cache import CACHE_DIR
+from decimate import axes_pixel_width, lttb
+from director_ingest import DirectorFollower
+from smoothing import POINTS, median_spacing, moving_average
+
+SCORE_KEY = "episode/score"
+CAPACITY = 1000
+
+
+class DecimatedBuffer:
+    """追記される点を、連続する stride 点の平均に間引いて最大 2 × capacity 点で保持する
+
+    点数が 2 × capacity に達したら隣り合う2点を平均して半分にし、以降は stride を2倍にして
+    まとめるので、保持する点数は系列の長さによらず一定で、追記は1点あたり償却 O(1)。
+    """
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.stride = 1
+        self.steps = []
+        self.values = []
+        self.pending = []
+
+    def extend(self, steps, values):
+        for point in zip(steps, values):
+            self.pending.append(point)
+            if len(self.pending) < self.stride:
+                continue
+            step, value = np.mean(self.pending, axis=0)
+            self.steps.append(float(step))
+            self.values.append(float(value))
+            self.pending = []
+            if len(self.steps) >= 2 * self.capacity:
+                self.steps = [(a + b) / 2 for a, b in zip(self.steps[0::2], self.steps[1::2])]
+                self.values = [(a + b) / 2 for a, b in zip(self.values[0::2], self.values[1::2])]
+                self.stride *= 2
+
+    def arrays(self):
+        """保持している点（まとめ途中の点は平均して末尾に付ける）の steps, values 配列のコピー"""
+        steps, values = list(self.steps), list(self.values)
+        if self.pending:
+            step, value = np.mean(self.pending, axis=0)
+            steps.append(float(step))
+            values.append(float(value))
+        return np.array(steps), np.array(values)
+
+
+class SmoothedSeries:
+    """ステップ幅の移動平均（smoothing.smooth_runs と同じ規則）を追記だけで更新する系列
+
+    窓幅は最初に2点以上そろった時点の記録間隔の中央値 × points で決める。新しい点の平滑化には、
+    その窓に掛かる既存の点だけを文脈として moving_average に渡し、生データも窓に掛かる分だけ残す。
+    平滑化した曲線は DecimatedBuffer に間引いて溜めるので、更新も描画もコストは系列の長さによらない。
+    """
+
+    def __init__(self, points=POINTS, capacity=CAPACITY):
+        self.points = points
+        self.width = None
+        self.steps = []
+        self.values = []
+        self.curve = DecimatedBuffer(capacity)
+
+    def extend(self, steps, values):
+        steps = np.asarray(steps, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if not len(steps):
+            return
+        if self.width is None and len(self.steps) + len(steps) >= 2:
+            self.width = self.points * median_spacing(np.concatenate([self.steps, steps]))
+        if self.width is None:
+            smooth = values
+        else:
+            # 窓 (t - width, t] に掛かる既存の点と、その重み（直前の点との間隔）を決める1点を付ける
+            start = max(bisect.bisect_right(self.steps, steps[0] - self.width) - 1, 0)
+            context_steps = np.concatenate([self.steps[start:], steps])
+            context_values = np.concatenate([self.values[start:], values])
+            smooth = moving_average(context_steps, context_values, self.width)[0, -len(steps):]
+        self.steps.extend(steps.tolist())
+        self.values.extend(values.tolist())
+        self.curve.extend(steps.tolist(), smooth.tolist())
+        if self.width is not None:
+            # 次の窓に掛からない点を捨てる
+            drop = max(bisect.bisect_right(self.steps, self.steps[-1] - self.width) - 1, 0)
+            del self.steps[:drop]
+            del self.values[:drop]
+
+
+class HistoryTail:
+    """historyキャッシュの1メトリクス分を、最後に読んだステップより後だけ読み込む"""
+
+    def __init__(self, path, key):
+        self.path = Path(path)
+        self.key = key
+        self.mtime = None
+        self.last_step = None
+
+    def poll(self):
+        mtime = self.path.stat().st_mtime
+        if mtime == self.mtime:
+            return None
+        self.mtime = mtime
+        filters = None if self.last_step is None else [("_step", ">", self.last_step)]
+        df = pd.read_parquet(self.path, filters=filters)
+        if df.empty:
+            return None
+        self.last_step = df["_step"].max()
+        return df
+
+
+class Dashboard:
+    """全ソースの系列を保持し、更新と描画を行う"""
+
+    def __init__(self, jsonl_paths, history_key=SCORE_KEY, cache_dir=CACHE_DIR):
+        self.history_key = history_key
+        self.history_glob = Path(cache_dir) / "history"
+        self.followers = {Path(p).stem: DirectorFollower(p) for p in jsonl_paths}
+        self.seen = {}
+        self.resets = {}
+        self.history_tails = {}
+        self.series = {"Director": {}, "Hieros": {}}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            for name, follower in self.followers.items():
+                # 初回はキャッシュ済みの行も含めて全て系列に入れる
+                start = self.seen.get(name, 0)
+                follower.poll()
+                if follower.resets != self.resets.get(name, 0):
+                    # ファイルが置き換えられたので、前のファイルの点を捨てて最初の行から入れ直す
+                    self.resets[name] = follower.resets
+                    self.series["Director"].pop(name, None)
+                    start = 0
+                self.seen[name] = follower.n_rows
+                cols = follower.since(start)
+                if SCORE_KEY not in cols:
+                    continue
+                mask = ~np.isnan(cols[SCORE_KEY])
+                if mask.any():
+                    series = self.series["Director"].setdefault(name, SmoothedSeries())
+                    series.extend(cols["step"][mask].tolist(), cols[SCORE_KEY][mask].tolist())
+
+            # 新しくキャッシュされたランも拾う
+            filename = self.history_key.replace("/", "~") + ".parquet"
+            for path in self.history_glob.glob(f"*/{filename}"):
+                run_id = path.parent.name
+                tail = self.history_tails.setdefault(run_id, HistoryTail(path, self.history_key))
+                df = tail.poll()
+                if df is not None:
+                    series = self.series["Hieros"].setdefault(run_id, SmoothedSeries())
+                    series.extend(df["_step"].tolist(), df[self.history_key].tolist())
+
+    def render(self):
+        # ロック中は間引き済みの配列をコピーするだけにし、描画は refresh と並行して行う
+        with self.lock:
+            groups = [(title, [(name, *s.curve.arrays()) for name, s in sorted(series.items())])
+                      for title, series in self.series.items() if series]
+        # pyplot のグローバルな状態を使わない Figure は、複数のリクエストスレッドから同時に描画できる
+        fig = Figure(figsize=(6, 3.5 * max(len(groups), 1)), dpi=100)
+        axes = fig.subplots(max(len(groups), 1), 1, squeeze=False)
+        for ax, (title, curves) in zip(axes[:, 0], groups):
+            n_px = axes_pixel_width(ax)
+            for name, steps, smooth in curves:
+                x, y = lttb(steps / 1000, smooth, 2 * n_px)
+                ax.plot(x, y, linewidth=1.4, label=name, alpha=0.8)
+            ax.set_title(title, fontsize=10, fontweight="bold")
+            ax.set_xlabel("Env. Steps (×10³)", fontsize=9)
+            ax.set_ylabel("Episode Return", fontsize=9)
+            ax.legend(fontsize=6, loc="best")
+            ax.spines["top"].set_visible(False)
+            ax.spines["right"].set_visible(False)
+            ax.tick_params(axis="both", labelsize=8)
+            ax.grid(True, alpha=0.3)
+        fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png")
+        return buf.getvalue()
+
+
+PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Hieros sweeps</title>
+<meta http-equiv="refresh" content="{interval}"></head>
+<body style="font-family:sans-serif"><img src="/plot.png" style="max-width:100%"></body></html>
+"""
+
+
+def make_handler(dashboard, interval):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/plot.png"):
+                dashboard.refresh()
+                body, content_type = dashboard.render(), "image/png"
+            elif self.path in ("/", "/index.html"):
+                body, content_type = PAGE.format(interval=interval).encode(), "text/html"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live dashboard of running sweeps")
+    parser.add_argument("--jsonl", nargs="*", default=sorted(map(str, Path("director-result").glob("*.jsonl"))),
+                        help="Director metrics JSONL files to follow")
+    parser.add_argument("--key", default=SCORE_KEY, help="history cache metric to show")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--interval", type=int, default=10, help="browser refresh interval in seconds")
+    args = parser.parse_args()
+
+    dashboard = Dashboard(args.jsonl, history_key=args.key)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(dashboard, args.interval))
+    print(f"✓ Dashboard on http://127.0.0.1:{args.port}/ (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+長い学習曲線の間引き (decimation) ユーティリティ
+LTTBとmin-maxエンベロープで系列を出力ピクセル数程度まで減らし、
+描画・保存コストを学習ステップ数に依存しないようにする
+"""
+
+import numpy as np
+
+from smoothing import median_spacing, moving_average
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets で (x, y) を n_out 点に間引く"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # 先頭と末尾は固定し、残りを n_out-2 個のバケットに分ける
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 次のバケットの平均点（最後のバケットでは末尾点）
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+
+        # 三角形の面積が最大になる点を選ぶ
+        area = np.abs(
+            (x[prev] - avg_x) * (y[lo:hi] - y[prev])
+            - (x[prev] - x[lo:hi]) * (avg_y - y[prev])
+        )
+        prev = lo + int(np.argmax(area))
+        keep[i + 1] = prev
+
+    return x[keep], y[keep]
+
+
+def minmax_envelope(x, y, n_bins):
+    """x を n_bins 個の等幅区間に分け、区間ごとの (中心, 最小, 最大) を返す"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(x) == 0:
+        return x, y, y
+
+    edges = np.linspace(x[0], x[-1], n_bins + 1)
+    starts = np.searchsorted(x, edges[:-1], side="left")
+    # 空の区間は reduceat が扱えないので除外する
+    ends = np.append(starts[1:], len(x))
+    nonempty = starts < ends
+    starts = starts[nonempty]
+
+    lo = np.minimum.reduceat(y, starts)
+    hi = np.maximum.reduceat(y, starts)
+    centers = 0.5 * (edges[:-1] + edges[1:])[nonempty]
+    return centers, lo, hi
+
+
+def axes_pixel_width(ax):
+    """保存時の解像度で軸が占める横方向のピクセル数"""
+    fig = ax.figure
+    width_inches = ax.get_position().width * fig.get_figwidth()
+    return max(int(width_inches * fig.dpi), 16)
+
+
+def plot_raw_and_smooth(ax, x, y, y_smooth, color=None, label=None,
+                        raw_linewidth=0.6, raw_alpha=0.3, linewidth=1.4, alpha=None):
+    """薄い生データ曲線と平滑化曲線を、軸の幅に合わせて間引いて描画する
+
+    生データが1ピクセルあたり2点を超える場合はmin-maxの帯としてラスタライズし、
+    平滑化曲線はLTTBでピーク形状を保ったまま間引く。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    y_smooth = np.asarray(y_smooth, dtype=float)
+    n_px = axes_pixel_width(ax)
+
+    if len(x) > 2 * n_px:
+        xc, lo, hi = minmax_envelope(x, y, n_px)
+        ax.fill_between(xc, lo, hi, color=color, alpha=raw_alpha,
+                        linewidth=0, rasterized=True)
+    else:
+        ax.plot(x, y, color=color, linewidth=raw_linewidth, alpha=raw_alpha)
+
+    xs, ys = lttb(x, y_smooth, 2 * n_px)
+    return ax.plot(xs, ys, color=color, linewidth=linewidth, label=label, alpha=alpha)
+
+
+def plot_curve(ax, curve, x_scale=1, window=20, color=None, label=None,
+               raw_alpha=0.3, linewidth=1.4, alpha=None):
+    """cache.load_curve の系列を描く（バケットの最小・最大の帯と、平均の移動平均）
+
+    window は元の記録間隔 window 個分のステップ幅で、どのピラミッドの倍率でも同じステップ幅で平滑化する
+    （バケットの間隔は元の記録間隔の factor 倍）。
+    """
+    factor = curve.attrs.get("factor", 1)
+    steps = curve["_step"].to_numpy(dtype=float)
+    x = steps / x_scale
+    width = window * median_spacing(steps) / factor
+    smooth = moving_average(steps, curve["mean"].to_numpy(dtype=float), width)[0]
+    if factor > 1:
+        ax.fill_between(x, curve["min"], curve["max"], color=color, alpha=raw_alpha,
+                        linewidth=0, rasterized=True)
+        return ax.plot(x, smooth, color=color, linewidth=linewidth, label=label, alpha=alpha)
+    return plot_raw_and_smooth(ax, x, curve["mean"], smooth, color=color, label=label,
+                               raw_alpha=raw_alpha, linewidth=linewidth, alpha=alpha)
@@ -0,0 +1,215 @@
+"""
+Director の metrics.jsonl の追記分だけを読み込むインジェスト
+ファイルごとに読み込み済みのバイトオフセットを覚え、新しく追記された完全な行だけを
+パースして、メモリ上の列バッファとディスク上の列キャッシュに追記する。
+書き込み途中の最後の行は次回に回すので、学習中のファイルを追いかけても O(新しい行数) で済む。
+
+ディスク上のキャッシュは cache/director/<name>-<hash>/ に、列ごとの生のバイナリ
+(step は int64, それ以外は float64) と、確定した行数・オフセットを記録した state.json を置く。
+state.json にはファイルの inode・更新時刻・先頭ブロックのハッシュも記録し、同じパスのファイルが
+置き換えられた（ローテーション・上書きコピーなど）ことが分かったら最初から読み直す。
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cache import atomic_write, cache_path, key_lock
+
+STEP_KEY = "step"
+# 置き換えの検出に使う先頭ブロックの大きさ（バイト）
+HEAD_BYTES = 4096
+
+
+class ColumnBuffer:
+    """列ごとのNumPy配列に行を追記するバッファ（容量は倍々で確保）"""
+
+    def __init__(self):
+        self.n_rows = 0
+        self.columns = {STEP_KEY: np.empty(0, dtype=np.int64)}
+
+    def _reserve(self, n_rows):
+        capacity = len(self.columns[STEP_KEY])
+        if n_rows <= capacity:
+            return
+        capacity = max(n_rows, 2 * capacity, 1024)
+        for key, values in self.columns.items():
+            grown = np.full(capacity, np.nan if values.dtype.kind == "f" else 0, dtype=values.dtype)
+            grown[:self.n_rows] = values[:self.n_rows]
+            self.columns[key] = grown
+
+    def append(self, batch):
+        """{列名: 配列} の同じ長さの列をまとめて追記する（無い列は NaN で埋める）"""
+        n_new = len(batch[STEP_KEY])
+        self._reserve(self.n_rows + n_new)
+        capacity = len(self.columns[STEP_KEY])
+        for key in batch:
+            if key not in self.columns:
+                self.columns[key] = np.full(capacity, np.nan)
+        end = self.n_rows + n_new
+        for key, values in self.columns.items():
+            values[self.n_rows:end] = batch.get(key, np.nan)
+        self.n_rows = end
+
+    def view(self, start=0):
+        """start 行目以降の列（コピーなし）"""
+        return {key: values[start:self.n_rows] for key, values in self.columns.items()}
+
+    def to_frame(self):
+        return pd.DataFrame(self.view())
+
+
+def _head_digest(f, size):
+    """開いたファイルの先頭 size バイトのハッシュ"""
+    f.seek(0)
+    return hashlib.sha1(f.read(size)).hexdigest()
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def records_to_batch(records):
+    """JSONのレコード列を {列名: 配列} にする（step の無い行と数値でない値は捨てる）"""
+    records = [r for r in records if _is_number(r.get(STEP_KEY))]
+    keys = {key for r in records for key, value in r.items() if key != STEP_KEY and _is_number(value)}
+    batch = {STEP_KEY: np.array([r[STEP_KEY] for r in records], dtype=np.int64)}
+    for key in keys:
+        column = [r[key] if _is_number(r.get(key)) else np.nan for r in records]
+        batch[key] = np.array(column, dtype=np.float64)
+    return batch
+
+
+class DirectorFollower:
+    """1つの metrics.jsonl を追いかけ、ColumnBuffer とディスクキャッシュを更新する"""
+
+    def __init__(self, path, use_cache=True):
+        self.path = Path(path)
+        self.buffer = ColumnBuffer()
+        self.offset = 0
+        self.identity = None
+        # 読み直した回数（行番号で差分を追う側が、行が振り直されたことを知るため）
+        self.resets = 0
+        self.cache_dir = None
+        if use_cache:
+            digest = hashlib.sha1(str(self.path.resolve()).encode()).hexdigest()[:8]
+            self.cache_dir = cache_path("director", f"{self.path.stem}-{digest}", "state.json").parent
+            with key_lock(self.cache_dir / "state.json"):
+                self._load_cache()
+
+    @property
+    def n_rows(self):
+        return self.buffer.n_rows
+
+    def _column_file(self, key):
+        suffix = ".i8" if key == STEP_KEY else ".f8"
+        return self.cache_dir / (key.replace("/", "~") + suffix)
+
+    def _load_cache(self):
+        state_file = self.cache_dir / "state.json"
+        if not state_file.exists():
+            return
+        state = json.loads(state_file.read_text())
+        n_rows = state["rows"]
+        batch = {}
+        for key in state["columns"]:
+            dtype = np.int64 if key == STEP_KEY else np.float64
+            # state.json より後に書かれた（未確定の）行は無視する
+            batch[key] = np.fromfile(self._column_file(key), dtype=dtype, count=n_rows)
+        if n_rows:
+            self.buffer.append(batch)
+        self.offset = state["offset"]
+        self.identity = state.get("identity")
+
+    def _append_cache(self, start):
+        """start 行目以降をディスクの列ファイルに追記し、最後に state.json を更新する"""
+        for key, values in self.buffer.view(start).items():
+            path = self._column_file(key)
+            if not path.exists() and start > 0:
+                # 途中から現れた列は、それまでの行を NaN で埋める
+                np.full(start, np.nan).tofile(path)
+            with open(path, "r+b" if path.exists() else "wb") as f:
+                f.seek(start * values.itemsize)
+                f.truncate()
+                values.tofile(f)
+        state = {"offset": self.offset, "rows": self.n_rows, "columns": list(self.buffer.columns),
+                 "identity": self.identity}
+        with atomic_write(self.cache_dir / "state.json") as tmp:
+            tmp.write_text(json.dumps(state))
+
+    def _reset(self):
+        """ファイルが切り詰められた・置き換えられた場合は最初から読み直す"""
+        self.buffer = ColumnBuffer()
+        self.offset = 0
+        self.identity = None
+        self.resets += 1
+        if self.cache_dir is not None:
+            with key_lock(self.cache_dir / "state.json"):
+                for path in self.cache_dir.iterdir():
+                    path.unlink(missing_ok=True)
+
+    def _replaced(self, f, stat):
+        """読み込み済みの部分が、開いたファイル f と同じ内容でなくなったか"""
+        if stat.st_size < self.offset:
+            return True
+        identity = self.identity
+        if not identity:
+            return False
+        if stat.st_ino != identity["inode"] or stat.st_mtime_ns < identity["mtime"]:
+            return True
+        return _head_digest(f, identity["head_size"]) != identity["head"]
+
+    def poll(self):
+        """追記された完全な行を取り込み、新しい行数を返す"""
+        if not self.path.exists():
+            return 0
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if self._replaced(f, stat):
+                self._reset()
+            f.seek(self.offset)
+            data = f.read()
+            # 読み込み済みになる範囲の先頭ブロックで、次回に同じファイルかを確かめる
+            head_size = min(self.offset + data.rfind(b"\n") + 1, HEAD_BYTES)
+            head = _head_digest(f, head_size)
+
+        # 書き込み途中の最後の行は次回に回す
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return 0
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+        start = self.n_rows
+        batch = records_to_batch(records)
+        if len(batch[STEP_KEY]):
+            self.buffer.append(batch)
+        self.offset += end
+        self.identity = {"inode": stat.st_ino, "mtime": stat.st_mtime_ns, "head_size": head_size, "head": head}
+        if self.cache_dir is not None:
+            # 同じファイルを追う他のプロセスと列ファイルの書き込みが混ざらないようにする
+            with key_lock(self.cache_dir / "state.json"):
+                self._append_cache(start)
+        return self.n_rows - start
+
+    def since(self, start):
+        """start 行目以降の列"""
+        return self.buffer.view(start)
+
+    def frame(self):
+        return self.buffer.to_frame()
+
+
+def load_director(path, use_cache=True):
+    """Director の JSONL を読み込んで DataFrame を返す（前回以降の追記分だけパースする）"""
+    follower = DirectorFollower(path, use_cache=use_cache)
+    follower.poll()
+    return follower.frame()
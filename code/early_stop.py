@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+実行中のスイープの打ち切り候補の提案
+historyキャッシュ（実行中のランは追記分だけ取得して更新する）から各ランの episode/score を読み、
+次の2つの規則で「続けても最良のランを超えそうにないラン」を順位付けして表示する。
+
+    successive halving : 各ランの予算の 1/8, 1/4, 1/2 のステップ (rung) で、そこまで到達したランの
+                         下位 1 - 1/eta に入ったランを候補にする（予算の違うランは予算に対する割合で揃える）
+    曲線の外挿          : 後半の点に score = a + b log(step) を当てはめて予算のステップでの値を予測し、
+                         予測の標準誤差から「最良のランの予測を上回る確率」を求める
+                         （飽和していく曲線では予測が高めに出るので、止めすぎない側に倒れる）
+
+確率が --alpha 未満のランを打ち切りの推奨とし、確率の低い順に並べる。ランは止めない（表示だけ）。
+
+    python code/early_stop.py subactor-update reward-ratio
+"""
+
+import argparse
+import math
+
+import numpy as np
+
+from cache import load_history
+from run_metadata import FINAL_STATES, sweep_runs
+from sweeps import SWEEPS
+
+SCORE_KEY = "episode/score"
+BUDGET = 400_000
+RUNGS = (1 / 8, 1 / 4, 1 / 2)
+
+
+def window_mean(steps, values, end, width):
+    """(end - width, end] に記録された値の平均（点が無ければ NaN）"""
+    mask = (steps > end - width) & (steps <= end)
+    return float(values[mask].mean()) if mask.any() else math.nan
+
+
+def extrapolate(steps, values, budget, min_points=10):
+    """後半の点に a + b log(step) を当てはめた、budget での平均スコアの予測値と標準誤差"""
+    keep = (steps >= steps[-1] / 2) & (steps > 0)
+    x, y = np.log(steps[keep]), values[keep]
+    if len(x) < min_points or np.ptp(x) == 0:
+        return math.nan, math.nan
+    slope, intercept = np.polyfit(x, y, 1)
+    residual = y - (intercept + slope * x)
+    s = math.sqrt(residual @ residual / (len(x) - 2))
+    x0 = math.log(budget)
+    # 回帰直線上の平均の予測の標準誤差
+    se = s * math.sqrt(1 / len(x) + (x0 - x.mean()) ** 2 / ((x - x.mean()) ** 2).sum())
+    return float(intercept + slope * x0), se
+
+
+def final_estimate(steps, values, tail=0.1):
+    """予算まで走り終えたランの最終スコア（最後の tail の区間の平均）と標準誤差"""
+    tail_values = values[steps >= steps[-1] * (1 - tail)]
+    se = tail_values.std(ddof=1) / math.sqrt(len(tail_values)) if len(tail_values) > 1 else 0.0
+    return float(tail_values.mean()), se
+
+
+def prob_exceeds(mean, se, best_mean, best_se):
+    """予測が正規分布に従うとして、mean の方が best_mean を上回る確率"""
+    scale = math.sqrt(se ** 2 + best_se ** 2)
+    if math.isnan(mean) or scale == 0:
+        return math.nan
+    return 0.5 * (1 + math.erf((mean - best_mean) / (scale * math.sqrt(2))))
+
+
+def halving_rungs(curves, budgets, eta=2, rungs=RUNGS):
+    """各 rung で、到達したランのうち上位 1/eta に入らなかったランの {run_id: rung のステップ}
+
+    budgets はランごとの予算 {run_id: ステップ}。rung と平均を取る窓の幅はランごとの予算に対する割合で決める。
+    """
+    dropped = {}
+    for fraction in rungs:
+        scores = {}
+        for run_id, (steps, values) in curves.items():
+            rung = budgets[run_id] * fraction
+            if steps[-1] >= rung:
+                scores[run_id] = window_mean(steps, values, rung, budgets[run_id] / 20)
+        scores = {run_id: score for run_id, score in scores.items() if not math.isnan(score)}
+        keep = max(1, len(scores) // eta)
+        for run_id in sorted(scores, key=scores.get, reverse=True)[keep:]:
+            dropped.setdefault(run_id, int(budgets[run_id] * fraction))
+    return dropped
+
+
+def advise(runs, budget=BUDGET, eta=2, alpha=0.05):
+    """ランごとの予測と提案のリスト（最良を上回る確率の低い順）"""
+    curves, by_id = {}, {}
+    for run in runs:
+        # load_history が実行中のランの追記分を取得する（サマリーの _step が進んでいなければ取得しない）
+        history = load_history(run, [SCORE_KEY])
+        if SCORE_KEY not in history.columns:
+            continue
+        history = history.dropna(subset=[SCORE_KEY])
+        if len(history) < 2:
+            continue
+        curves[run.id] = (history["_step"].to_numpy(dtype=float), history[SCORE_KEY].to_numpy(dtype=float))
+        by_id[run.id] = run
+
+    rows = []
+    budgets = {}
+    for run_id, (steps, values) in curves.items():
+        run = by_id[run_id]
+        run_budget = budgets[run_id] = int(float(run.config.get("steps") or budget))
+        if run.state in FINAL_STATES or steps[-1] >= run_budget:
+            mean, se = final_estimate(steps, values)
+        else:
+            mean, se = extrapolate(steps, values, run_budget)
+        rows.append({"run": run, "step": int(steps[-1]), "budget": run_budget, "mean": mean, "se": se})
+    if not rows:
+        return []
+
+    best = max((row for row in rows if not math.isnan(row["mean"])), key=lambda row: row["mean"], default=None)
+    dropped = halving_rungs(curves, budgets, eta)
+    for row in rows:
+        row["running"] = row["run"].state not in FINAL_STATES
+        row["halving"] = dropped.get(row["run"].id)
+        if best is None or row is best:
+            row["p_best"] = math.nan if best is None else 1.0
+        else:
+            row["p_best"] = prob_exceeds(row["mean"], row["se"], best["mean"], best["se"])
+        row["stop"] = row["running"] and row["p_best"] < alpha
+        row["saved"] = max(0, row["budget"] - row["step"]) if row["stop"] else 0
+    return sorted(rows, key=lambda row: (not row["running"], math.inf if math.isnan(row["p_best"]) else row["p_best"]))
+
+
+def main():
+    from snapshot import open_api
+
+    parser = argparse.ArgumentParser(description="Rank running sweep runs that are worth stopping early")
+    parser.add_argument("sweeps", nargs="*", default=["subactor-update", "reward-ratio"],
+                        help="sweep names in sweeps.py")
+    parser.add_argument("--budget", type=int, default=BUDGET, help="steps per run when the config has no 'steps'")
+    parser.add_argument("--eta", type=int, default=2, help="successive-halving reduction factor")
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="recommend stopping when P(final > best) is below this")
+    parser.add_argument("--all", action="store_true", help="also list finished runs")
+    args = parser.parse_args()
+
+    api = open_api()
+    for name in args.sweeps:
+        runs = sweep_runs(name, api, refresh=True)
+        rows = advise(runs, args.budget, args.eta, args.alpha)
+        param = SWEEPS[name]["param"] if name in SWEEPS else None
+        print(f"\n=== {name} ({runs.sweep_id}): {sum(r['running'] for r in rows)} running / {len(rows)} runs ===")
+        print(f"{'run':>30} {'arm':>12} {'step':>8} {'projected (90%)':>16} {'P(>best)':>9} {'halving':>9}  advice")
+        for row in rows:
+            if not row["running"] and not args.all:
+                continue
+            arm = row["run"].config.get(param, "") if param else ""
+            projected = f"{row['mean']:.1f} ± {1.645 * row['se']:.1f}" if not math.isnan(row["mean"]) else "n/a"
+            p_best = f"{row['p_best']:.3f}" if not math.isnan(row["p_best"]) else "n/a"
+            halving = f"@{row['halving'] // 1000}k" if row["halving"] else ""
+            advice = "stop" if row["stop"] else ("candidate" if row["running"] and row["halving"] else "")
+            print(f"{row['run'].name:>30} {str(arm):>12} {row['step']:>8} {projected:>16} {p_best:>9} {halving:>9}  {advice}")
+
+        remaining = sum(max(0, row["budget"] - row["step"]) for row in rows if row["running"])
+        saved = sum(row["saved"] for row in rows)
+        if remaining:
+            print(f"✓ Stopping the recommended runs saves {saved:,} of {remaining:,} remaining steps"
+                  f" ({saved / remaining:.0%})")
+
+
+if __name__ == "__main__":
+    main()
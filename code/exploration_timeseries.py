@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+探索カバー率の時系列を一括計算してキャッシュするバッチ処理
+各ランで記録された全ての exploration/position_heatmap をプロセスプールでデコードし、
+ステップごとの coverage / entropy / mean_occupancy を history キャッシュに
+exploration/* メトリクスとして保存する（cache.load_history で読み出せる）
+"""
+
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from cache import save_history_column, single_flight, write_npy
+from heatmap_stats import (HEATMAP_KEY, decode_heatmap, heatmap_cache_file,
+                           heatmap_metrics, to_occupancy)
+
+METRIC_KEYS = {
+    "coverage": "exploration/coverage",
+    "entropy": "exploration/entropy",
+    "mean_occupancy": "exploration/mean_occupancy",
+}
+
+_api = None
+
+
+def _init_worker():
+    """ワーカープロセスごとにW&B APIを1つだけ作る"""
+    global _api
+    import wandb
+    _api = wandb.Api()
+
+
+def _decode_task(task):
+    """1枚のヒートマップをデコード（キャッシュ済みなら読み込み）して指標を返す"""
+    run_path, run_id, step, media_path = task
+
+    def download():
+        with tempfile.TemporaryDirectory() as tmp:
+            file_obj = _api.run(run_path).file(media_path)
+            downloaded = file_obj.download(root=tmp, replace=True).name
+            return decode_heatmap(Image.open(downloaded))
+
+    # 他のワーカー・スクリプトが同じヒートマップを取得中なら、その結果を待って使う
+    codes = np.load(single_flight(heatmap_cache_file(run_id, step), download, write_npy))
+    metrics = heatmap_metrics(to_occupancy(codes)[None])
+    return step, {name: float(values[0]) for name, values in metrics.items()}
+
+
+def list_heatmaps(run):
+    """ランに記録された全ヒートマップの (step, media path) を列挙する"""
+    tasks = []
+    for row in run.scan_history(keys=["_step", HEATMAP_KEY]):
+        media_obj = row.get(HEATMAP_KEY)
+        if isinstance(media_obj, dict) and "path" in media_obj:
+            tasks.append((int(row["_step"]), media_obj["path"]))
+    return tasks
+
+
+def build_run_timeseries(run, pool):
+    """1ラン分の探索指標の時系列を計算してキャッシュに保存する"""
+    run_path = "/".join(run.path)
+    tasks = [(run_path, run.id, step, path) for step, path in list_heatmaps(run)]
+    if not tasks:
+        return None
+
+    rows = []
+    for step, metrics in pool.map(_decode_task, tasks, chunksize=8):
+        rows.append({"_step": step, **{METRIC_KEYS[k]: v for k, v in metrics.items()}})
+    df = pd.DataFrame(rows)
+
+    for key in METRIC_KEYS.values():
+        save_history_column(run.id, key, df)
+    return df
+
+
+def main():
+    import wandb
+    from sweeps import SWEEPS, sweep_path
+
+    parser = argparse.ArgumentParser(description="Cache exploration coverage/entropy time series")
+    parser.add_argument("sweeps", nargs="*", default=[name for name in SWEEPS if name != "atari"],
+                        help="sweep names in sweeps.py or sweep ids")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size")
+    args = parser.parse_args()
+
+    api = wandb.Api()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        for name in args.sweeps:
+            sweep = api.sweep(sweep_path(name))
+            print(f"Sweep: {name} ({sweep.id})")
+            for run in sweep.runs:
+                df = build_run_timeseries(run, pool)
+                if df is None:
+                    print(f"  Skipping run {run.name} (no {HEATMAP_KEY})")
+                    continue
+                last = df.sort_values("_step").iloc[-1]
+                print(f"  ✓ {run.name}: {len(df)} heatmaps, "
+                      f"final coverage={last[METRIC_KEYS['coverage']]:.3f}, "
+                      f"entropy={last[METRIC_KEYS['entropy']]:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+図の保存ユーティリティ
+HWM_FIG_FORMAT=pdf (または svg) を指定するとベクター形式で保存し、
+生データ曲線・帯・画像など重いアーティストだけをラスタライズする
+"""
+
+import os
+from pathlib import Path
+
+from matplotlib.collections import Collection
+from matplotlib.lines import Line2D
+
+from profiling import stage
+
+FIG_FORMAT = os.environ.get("HWM_FIG_FORMAT", "png").lower()
+VECTOR_FORMATS = ("pdf", "svg", "eps")
+
+# これより頂点数の多い線・帯はベクターのまま埋め込まない
+DENSE_VERTICES = 1000
+
+
+def _n_vertices(artist):
+    """アーティストが出力する頂点数の概算"""
+    if isinstance(artist, Line2D):
+        return len(artist.get_xdata())
+    if isinstance(artist, Collection):
+        return sum(len(path.vertices) for path in artist.get_paths())
+    return 0
+
+
+def rasterize_dense_artists(fig, min_vertices=DENSE_VERTICES):
+    """頂点数の多い線・帯と全ての画像をラスタライズ対象にする（軸と文字はベクターのまま）"""
+    for ax in fig.axes:
+        for image in ax.images:
+            image.set_rasterized(True)
+        for artist in list(ax.lines) + list(ax.collections):
+            if _n_vertices(artist) > min_vertices:
+                artist.set_rasterized(True)
+
+
+@stage("save")
+def save_figure(fig, path, fmt=None, **kwargs):
+    """図を保存し、実際に書き出したパスを返す
+
+    path の拡張子は fmt (省略時は HWM_FIG_FORMAT) に置き換えられる。
+    ベクター形式では dpi はラスタライズした部分の解像度になる。
+    """
+    fmt = (fmt or FIG_FORMAT).lower()
+    path = Path(path).with_suffix(f".{fmt}")
+
+    if fmt in VECTOR_FORMATS:
+        rasterize_dense_artists(fig)
+        if fmt == "pdf":
+            # 再ビルドしても内容が同じならバイト列も同じになるようにする
+            kwargs.setdefault("metadata", {"CreationDate": None})
+
+    fig.savefig(path, **kwargs)
+    return path
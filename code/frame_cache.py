@@ -0,0 +1,111 @@
+"""
+GIF・動画のデコード済みフレームキャッシュ
+各GIFを (frames, H, W, C) の uint8 .npy として保存し、np.load(mmap_mode='r') で
+ゼロコピーに開く。キーは元ファイルの内容ハッシュなので、元のGIFが変われば
+自動的に作り直される。合計サイズが上限を超えたら最も古く使われたものから削除する。
+PILで開けない mp4 などの動画は cv2.VideoCapture でデコードする（OpenCV が必要）。
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageSequence, UnidentifiedImageError
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from cache import CACHE_DIR, cache_path, single_flight, write_npy
+
+# キャッシュ全体の上限 (HWM_FRAME_CACHE_MB, 既定 4GB)
+MAX_BYTES = int(os.environ.get("HWM_FRAME_CACHE_MB", 4096)) * 1024 * 1024
+VIDEO_SUFFIXES = {".mp4", ".webm", ".avi", ".mov", ".mkv"}
+
+
+def source_hash(path, chunk_size=1 << 20):
+    """元ファイルの内容ハッシュ"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def decode_video(path):
+    """動画を cv2.VideoCapture で (frames, H, W, 3) の RGB uint8 配列にデコードする"""
+    if cv2 is None:
+        raise ImportError(f"{path} is not an image PIL can read; install opencv-python to decode it as a video")
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise ValueError(f"could not open {path} as a video")
+    frames = []
+    try:
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    finally:
+        cap.release()
+    if not frames:
+        raise ValueError(f"no frames decoded from {path}")
+    return np.stack(frames)
+
+
+def decode_frames(path):
+    """GIF（PILで開ける画像）または動画を (frames, H, W, 3) の uint8 配列にデコードする"""
+    if Path(path).suffix.lower() in VIDEO_SUFFIXES:
+        return decode_video(path)
+    try:
+        with Image.open(path) as im:
+            return np.stack([np.asarray(f.convert("RGB")) for f in ImageSequence.Iterator(im)])
+    except UnidentifiedImageError:
+        return decode_video(path)
+
+
+def frames_file(digest):
+    return cache_path("frames", digest[:2], f"{digest}.npy")
+
+
+def load_frames(path):
+    """GIF・動画のフレームを読み取り専用のメモリマップ配列として返す"""
+    cached = frames_file(source_hash(path))
+    for _ in range(2):
+        if cached.exists():
+            # LRUの順序はファイルの更新時刻で管理する
+            os.utime(cached)
+        else:
+            single_flight(cached, lambda: decode_frames(path), write_npy)
+            evict(keep=cached)
+        try:
+            return np.load(cached, mmap_mode="r")
+        except FileNotFoundError:
+            # 開く直前に他のプロセスの evict で消された
+            continue
+    raise FileNotFoundError(cached)
+
+
+def evict(max_bytes=MAX_BYTES, keep=None):
+    """合計サイズが max_bytes 以下になるまで、最も古く使われたフレームを削除する（keep は残す）"""
+    root = CACHE_DIR / "frames"
+    entries = []
+    for path in root.glob("*/*.npy"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep is not None and path == Path(keep):
+            continue
+        # 開いているメモリマップは削除後も有効（POSIX）
+        Path(path).unlink(missing_ok=True)
+        total -= size
+    return total
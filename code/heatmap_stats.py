@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+exploration/position_heatmap の数値化と集計
+色付きヒートマップ画像を占有度の配列に戻して uint16 の .npy としてキャッシュし、
+シード・設定値ごとに平均占有度・カバー率・エントロピーをまとめて計算する
+"""
+
+import argparse
+import re
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from cache import cache_path, single_flight, write_npy
+from run_config import ConfigIndex
+from wandb_media import load_media_image
+
+HEATMAP_KEY = "exploration/position_heatmap"
+
+# 壁（灰色 192,192,192 のセル）を表す値
+WALL = np.iinfo(np.uint16).max
+LEVELS = WALL - 1
+
+# この占有度を超えたセルを「訪問済み」とみなす
+COVERAGE_THRESHOLD = 1.0 / 255
+
+
+def decode_heatmap(img):
+    """色付きヒートマップを uint16 の占有度コード (0..LEVELS, 壁は WALL) に戻す
+
+    ヒートマップは青(0) → シアン → 緑 → 黄 → 赤(最大) の色相ランプで描かれているので、
+    色相 240°→0° を 0→1 に線形に対応させる。
+    """
+    rgb = np.asarray(img.convert("RGB") if isinstance(img, Image.Image) else img).astype(np.float32)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    mx = rgb.max(axis=-1)
+    mn = rgb.min(axis=-1)
+    chroma = mx - mn
+    wall = chroma < 8
+
+    # HSVの色相 (度)
+    safe = np.where(wall, 1.0, chroma)
+    hue = np.select(
+        [mx == r, mx == g],
+        [((g - b) / safe) % 6, (b - r) / safe + 2],
+        (r - g) / safe + 4,
+    ) * 60.0
+    # 240°を超える色相（マゼンタ側）は最小値に丸める
+    value = np.clip((240.0 - np.where(hue > 300, 240.0, hue)) / 240.0, 0.0, 1.0)
+
+    codes = np.rint(value * LEVELS).astype(np.uint16)
+    codes[wall] = WALL
+    return codes
+
+
+def to_occupancy(codes):
+    """uint16 コードを float32 の占有度 (壁は NaN) に変換する"""
+    occ = codes.astype(np.float32) / LEVELS
+    occ[codes == WALL] = np.nan
+    return occ
+
+
+def heatmap_cache_file(run_id, step):
+    return cache_path("heatmaps", run_id, f"{int(step)}.npy")
+
+
+def load_heatmap(run, step, media_obj):
+    """W&Bのヒートマップをデコードして返す（キャッシュがあればそれを使う）"""
+    path = single_flight(heatmap_cache_file(run.id, step),
+                         lambda: decode_heatmap(load_media_image(run, media_obj)), write_npy)
+    return np.load(path)
+
+
+def load_local_heatmaps(media_dir="media/images/exploration"):
+    """ローカルに保存された position_heatmap_<step>_<hash>.png を読み込む"""
+    records = []
+    for path in sorted(Path(media_dir).glob("position_heatmap_*.png")):
+        match = re.match(r"position_heatmap_(\d+)_(\w+)\.png", path.name)
+        if match is None:
+            continue
+        step, digest = match.groups()
+        cached = single_flight(cache_path("heatmaps", "local", f"{digest}.npy"),
+                               lambda: decode_heatmap(Image.open(path)), write_npy)
+        codes = np.load(cached)
+        records.append({"source": digest, "step": int(step), "codes": codes})
+    return records
+
+
+def heatmap_metrics(stack):
+    """[N, H, W] の占有度から各ヒートマップの指標をまとめて計算する
+
+    mean_occupancy: 壁以外のセルの平均占有度（各画像の最大値で正規化済み）
+    coverage: 占有度が閾値を超えたセルの割合
+    entropy: 占有度を確率分布とみなしたエントロピー（一様分布で1になるよう正規化）
+    """
+    stack = np.asarray(stack, dtype=np.float32)
+    cells = ~np.isnan(stack)
+    occ = np.nan_to_num(stack, nan=0.0)
+    n_cells = cells.sum(axis=(1, 2))
+
+    total = occ.sum(axis=(1, 2))
+    mean_occupancy = total / np.maximum(n_cells, 1)
+    coverage = (occ > COVERAGE_THRESHOLD).sum(axis=(1, 2)) / np.maximum(n_cells, 1)
+
+    p = occ / np.maximum(total, 1e-12)[:, None, None]
+    plogp = np.where(p > 0, p * np.log(np.where(p > 0, p, 1.0)), 0.0)
+    entropy = -plogp.sum(axis=(1, 2)) / np.log(np.maximum(n_cells, 2))
+
+    return {
+        "mean_occupancy": mean_occupancy,
+        "coverage": coverage,
+        "entropy": entropy,
+    }
+
+
+def aggregate(stack, groups):
+    """グループ（設定値など）ごとに平均占有度マップと指標の平均・標準偏差を求める"""
+    stack = np.asarray(stack, dtype=np.float32)
+    groups = np.asarray(groups)
+    metrics = pd.DataFrame(heatmap_metrics(stack))
+    metrics["group"] = groups
+
+    summary = metrics.groupby("group").agg(["mean", "std", "count"])
+    with warnings.catch_warnings():
+        # 全セルが壁のヒートマップ（初期ステップ）は NaN のままでよい
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean_maps = {g: np.nanmean(stack[groups == g], axis=0) for g in np.unique(groups)}
+    return summary, mean_maps
+
+
+def collect_sweep_heatmaps(sweep, param, target_step=400000):
+    """スイープの各ランから target_step に最も近いヒートマップを集める（param は正規化した設定から引く）"""
+    runs = list(sweep.runs)
+    configs = ConfigIndex.from_runs(runs)
+    records = []
+    for run in runs:
+        history = run.history(keys=[HEATMAP_KEY, "_step"])
+        if history.empty or HEATMAP_KEY not in history.columns:
+            continue
+        df = history.dropna(subset=[HEATMAP_KEY])
+        if df.empty:
+            continue
+        row = df.loc[(df["_step"] - target_step).abs().idxmin()]
+        codes = load_heatmap(run, row["_step"], row[HEATMAP_KEY])
+        records.append({
+            "source": run.id,
+            "step": int(row["_step"]),
+            "group": configs.get(run.id, param, "unknown"),
+            "codes": codes,
+        })
+        print(f"✓ {run.name}: {param}={records[-1]['group']}, step={records[-1]['step']}")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate exploration heatmaps numerically")
+    parser.add_argument("--sweep", help="sweep name in sweeps.py or sweep id")
+    parser.add_argument("--param", help="config key to group runs by (default: the sweep's param)")
+    parser.add_argument("--step", type=int, default=400000, help="target step for each run")
+    parser.add_argument("--local", default=None, help="aggregate local heatmap PNGs by step instead")
+    args = parser.parse_args()
+
+    if args.local or not args.sweep:
+        records = load_local_heatmaps(args.local or "media/images/exploration")
+        for rec in records:
+            rec["group"] = rec["step"]
+    else:
+        import wandb
+        from sweeps import SWEEPS, sweep_path
+
+        param = args.param or SWEEPS.get(args.sweep, {}).get("param")
+        sweep = wandb.Api().sweep(sweep_path(args.sweep))
+        records = collect_sweep_heatmaps(sweep, param, args.step)
+
+    if not records:
+        print("⚠ No heatmaps found")
+        return
+
+    # 形状の異なるヒートマップは同じ配列に積めないので、最も多い形状だけを使う
+    shapes = pd.Series([rec["codes"].shape for rec in records])
+    shape = shapes.mode().iloc[0]
+    records = [rec for rec in records if rec["codes"].shape == shape]
+
+    stack = to_occupancy(np.stack([rec["codes"] for rec in records]))
+    summary, _ = aggregate(stack, [rec["group"] for rec in records])
+    print(f"\n{len(records)} heatmaps of shape {shape}")
+    print(summary.round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+サブゴール・ヒートマップ画像のグリッド合成
+matplotlibのsubplots + imshowを使わず、NumPyのキャンバスに画像を直接並べて
+PILでラベルを描き、1回でPNGに書き出す（最近傍拡大のみで再サンプリングしない）
+"""
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from profiling import stage
+
+BACKGROUND = 255
+TEXT_COLOR = (0, 0, 0)
+
+
+def _load_font(size):
+    """指定サイズのフォント（無ければPIL既定フォント）"""
+    for name in ("DejaVuSans.ttf", "Arial.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def _to_rgb_array(img):
+    """PIL画像または配列を uint8 の (H, W, 3) 配列にする"""
+    if isinstance(img, Image.Image):
+        return np.asarray(img.convert("RGB"))
+    arr = np.asarray(img)
+    if arr.dtype.kind == "f":
+        arr = np.clip(arr, 0, 1) * 255
+    arr = arr.astype(np.uint8, copy=False)
+    if arr.ndim == 2:
+        arr = np.repeat(arr[:, :, None], 3, axis=2)
+    return arr[:, :, :3]
+
+
+def upscale_nearest(arr, factor):
+    """整数倍の最近傍拡大"""
+    if factor == 1:
+        return arr
+    return arr.repeat(factor, axis=0).repeat(factor, axis=1)
+
+
+def compose_grid(images, labels=None, n_cols=None, title=None,
+                 min_cell_px=512, pad=24, font_size=None):
+    """画像をグリッド状に並べた1枚のPIL画像を返す
+
+    各画像は元の解像度を保ったまま、最も大きい画像の長辺が min_cell_px 以上に
+    なる最小の整数倍で最近傍拡大される。
+    """
+    arrays = [_to_rgb_array(img) for img in images]
+    if not arrays:
+        raise ValueError("No images to compose")
+
+    n = len(arrays)
+    n_cols = min(n_cols or n, n)
+    n_rows = (n + n_cols - 1) // n_cols
+
+    native = max(max(a.shape[:2]) for a in arrays)
+    factor = max(1, -(-min_cell_px // native))
+    arrays = [upscale_nearest(a, factor) for a in arrays]
+
+    cell_h = max(a.shape[0] for a in arrays)
+    cell_w = max(a.shape[1] for a in arrays)
+    font_size = font_size or max(12, cell_w // 16)
+    font = _load_font(font_size)
+    label_h = int(font_size * 1.6) if labels else 0
+    title_h = int(font_size * 2.0) if title else 0
+
+    width = n_cols * cell_w + (n_cols + 1) * pad
+    height = title_h + n_rows * (cell_h + label_h) + (n_rows + 1) * pad
+    canvas = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+
+    origins = []
+    for idx, arr in enumerate(arrays):
+        row, col = divmod(idx, n_cols)
+        x0 = pad + col * (cell_w + pad)
+        y0 = title_h + pad + row * (cell_h + label_h + pad) + label_h
+        # 小さい画像はセルの中央に置く
+        oy = y0 + (cell_h - arr.shape[0]) // 2
+        ox = x0 + (cell_w - arr.shape[1]) // 2
+        canvas[oy:oy + arr.shape[0], ox:ox + arr.shape[1]] = arr
+        origins.append((x0, y0))
+
+    out = Image.fromarray(canvas)
+    draw = ImageDraw.Draw(out)
+    if title:
+        draw.text((width // 2, pad + title_h // 2), title, fill=TEXT_COLOR,
+                  font=_load_font(int(font_size * 1.2)), anchor="mm")
+    if labels:
+        for (x0, y0), label in zip(origins, labels):
+            draw.text((x0 + cell_w // 2, y0 - label_h // 2), str(label),
+                      fill=TEXT_COLOR, font=font, anchor="mm")
+    return out
+
+
+@stage("save")
+def save_grid(path, images, labels=None, n_cols=None, title=None, **kwargs):
+    """compose_grid の結果を300dpiのPNGとして保存し、パスを返す"""
+    grid = compose_grid(images, labels=labels, n_cols=n_cols, title=title, **kwargs)
+    grid.save(path, dpi=(300, 300))
+    return path
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Director と Hieros のメトリクスを共通スキーマで保持する列指向ストア
+Director の JSONL (step, train/worker_*, train/manager_*) と Hieros の W&B history
+(_step, train/Subactor-N/*) を、ソースごとのアダプタで同じ縦持ちのArrowテーブル
+(source, run, step, level, metric, value) に変換し、cache/metrics/ に parquet で保存する。
+エージェントをまたぐ比較は、ストアへの1回のフィルタ付きクエリで済む。
+
+    python code/metric_store.py --director director-result/*.jsonl --hieros <run_id> ...
+"""
+
+import argparse
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from cache import CACHE_DIR, atomic_write
+
+SCHEMA = pa.schema([
+    ("source", pa.dictionary(pa.int8(), pa.string())),
+    ("run", pa.dictionary(pa.int32(), pa.string())),
+    ("step", pa.int64()),
+    # 階層のレベル（0 が環境で行動する最下層）。階層に属さないメトリクスは null
+    ("level", pa.int8()),
+    ("metric", pa.dictionary(pa.int32(), pa.string())),
+    ("value", pa.float64()),
+])
+
+HIEROS_LEVEL = re.compile(r"(?P<ns>\w+)/Subactor-(?P<level>\d+)/(?P<name>.+)")
+DIRECTOR_LEVEL = re.compile(r"(?P<ns>\w+)/(?P<role>worker|manager)_(?P<name>.+)")
+DIRECTOR_ROLES = {"worker": 0, "manager": 1}
+
+
+def normalize_metric(key):
+    """生のメトリクス名を (名前空間付きの名前, レベル) にする
+
+    train/Subactor-1/actor_entropy → (train/actor_entropy, 1)
+    train/manager_actor_loss       → (train/actor_loss, 1)
+    episode/score                  → (episode/score, None)
+    """
+    match = HIEROS_LEVEL.fullmatch(key)
+    if match:
+        return f"{match['ns']}/{match['name']}", int(match["level"])
+    match = DIRECTOR_LEVEL.fullmatch(key)
+    if match:
+        return f"{match['ns']}/{match['name']}", DIRECTOR_ROLES[match["role"]]
+    return key, None
+
+
+def columns_to_table(source, run, steps, columns):
+    """{生のメトリクス名: 値の配列} と共通のステップ列を縦持ちのテーブルにする（NaN は落とす）"""
+    steps = np.asarray(steps, dtype=np.int64)
+    parts = {"step": [], "level": [], "metric": [], "value": []}
+    for key, values in columns.items():
+        values = np.asarray(values, dtype=np.float64)
+        mask = ~np.isnan(values)
+        n = int(mask.sum())
+        if n == 0:
+            continue
+        metric, level = normalize_metric(key)
+        parts["step"].append(steps[mask])
+        parts["value"].append(values[mask])
+        parts["metric"].append(np.full(n, metric, dtype=object))
+        parts["level"].append(np.full(n, -1 if level is None else level, dtype=np.int8))
+
+    if not parts["step"]:
+        return SCHEMA.empty_table()
+    level = np.concatenate(parts["level"])
+    n_rows = len(level)
+    return pa.table({
+        "source": pa.array([source] * n_rows, pa.string()).dictionary_encode(),
+        "run": pa.array([run] * n_rows, pa.string()).dictionary_encode(),
+        "step": np.concatenate(parts["step"]),
+        "level": pa.array(level, mask=level < 0),
+        "metric": pa.array(np.concatenate(parts["metric"]), pa.string()).dictionary_encode(),
+        "value": np.concatenate(parts["value"]),
+    }).cast(SCHEMA)
+
+
+def from_director(path, run=None):
+    """Director の metrics.jsonl を共通スキーマに変換する"""
+    from director_ingest import STEP_KEY, DirectorFollower
+
+    follower = DirectorFollower(path)
+    follower.poll()
+    columns = follower.since(0)
+    steps = columns.pop(STEP_KEY)
+    return columns_to_table("director", run or Path(path).stem, steps, columns)
+
+
+def from_history(run, history):
+    """load_history / run.history の DataFrame (_step 列あり) を共通スキーマに変換する"""
+    columns = {key: pd.to_numeric(history[key], errors="coerce").to_numpy()
+               for key in history.columns if key != "_step"}
+    return columns_to_table("hieros", run, history["_step"].to_numpy(), columns)
+
+
+def from_history_cache(run_id):
+    """cache/history/<run_id>/ にキャッシュ済みの全メトリクスを共通スキーマに変換する"""
+    tables = []
+    for path in sorted((CACHE_DIR / "history" / run_id).glob("*.parquet")):
+        df = pd.read_parquet(path)
+        key = next(c for c in df.columns if c != "_step")
+        tables.append(columns_to_table("hieros", run_id, df["_step"].to_numpy(), {key: df[key].to_numpy()}))
+    return pa.concat_tables(tables) if tables else SCHEMA.empty_table()
+
+
+class MetricStore:
+    """cache/metrics/<source>/<run>.parquet に保存された共通スキーマのテーブル群"""
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root is not None else CACHE_DIR / "metrics"
+
+    def write(self, table):
+        """テーブルをランごとのファイルに書き込む（同じランの既存ファイルは置き換える）"""
+        keys = table.select(["source", "run"]).to_pandas().drop_duplicates()
+        for source, run in keys.itertuples(index=False):
+            mask = pc.and_(pc.equal(table["source"].cast(pa.string()), source),
+                           pc.equal(table["run"].cast(pa.string()), run))
+            path = self.root / source / f"{run}.parquet"
+            with atomic_write(path) as tmp:
+                pq.write_table(table.filter(mask), tmp)
+
+    def dataset(self):
+        return ds.dataset(self.root, format="parquet", schema=SCHEMA)
+
+    def query(self, metrics=None, sources=None, runs=None, levels=None, columns=None):
+        """条件に合う行を1回のスキャンで読み出す（None の条件は絞り込まない）"""
+        if not self.root.exists():
+            return SCHEMA.empty_table().to_pandas()
+        conditions = []
+        for field, values in (("metric", metrics), ("source", sources), ("run", runs), ("level", levels)):
+            if values is not None:
+                conditions.append(ds.field(field).isin(list(values)))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return self.dataset().to_table(filter=expression, columns=columns).to_pandas()
+
+    def wide(self, metric, level=None, sources=None):
+        """1つのメトリクスを [step × (source, run)] の横持ちにする"""
+        df = self.query(metrics=[metric], sources=sources, levels=None if level is None else [level])
+        return df.pivot_table(index="step", columns=["source", "run"], values="value",
+                              aggfunc="last", observed=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest Director and Hieros metrics into the shared metric store")
+    parser.add_argument("--director", nargs="*", default=sorted(map(str, Path("director-result").glob("*.jsonl"))),
+                        help="Director metrics JSONL files")
+    parser.add_argument("--hieros", nargs="*", default=None,
+                        help="run ids whose history cache to ingest (default: all cached runs)")
+    args = parser.parse_args()
+
+    store = MetricStore()
+    for path in args.director:
+        table = from_director(path)
+        store.write(table)
+        print(f"✓ director/{Path(path).stem}: {table.num_rows} rows")
+
+    run_ids = args.hieros
+    if run_ids is None:
+        run_ids = sorted(p.name for p in (CACHE_DIR / "history").glob("*") if p.is_dir())
+    for run_id in run_ids:
+        table = from_history_cache(run_id)
+        if table.num_rows:
+            store.write(table)
+            print(f"✓ hieros/{run_id}: {table.num_rows} rows")
+
+    df = store.query(metrics=["episode/score"], columns=["source", "run", "value"])
+    if not df.empty:
+        print(df.groupby(["source", "run"], observed=True)["value"].agg(["count", "mean", "max"]).round(2))
+
+
+if __name__ == "__main__":
+    main()
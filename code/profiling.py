@@ -0,0 +1,202 @@
+"""
+解析スクリプトの段階ごとの計測
+HWM_PROFILE=1 で有効にすると、stage()/mark() で区切った段階ごとに
+壁時計時間・CPU時間・HTTPリクエスト数（W&B API呼び出し）・受信バイト数・RSSの増減・段階中のピークRSSを
+記録し、終了時に cache/profiles/<script>-<日時>-<pid>.json に書き出す。
+共通処理（load_history, save_figure など）は STAGES（fetch / clean / aggregate / render / save）の
+@stage で計測し、スクリプトは図のまとまりごとに mark() を1回だけ置く。記録は "episode-scores/fetch" のような
+入れ子のパスになり、同じパスの段階は（ループの中で何度呼ばれても）合算して1行にする。
+段階中のピークRSSは Linux では VmHWM を段階の開始時に現在のRSSに戻して測る。
+それができない環境ではプロセス開始からのピーク (ru_maxrss) になる。
+HWM_PROFILE=cprofile なら最初の段階から終了までの cProfile (.prof, pstats形式) も同じ場所に保存する。
+無効のとき（既定）は何もしない。
+
+    HWM_PROFILE=1 python code/Hieros-sweep-entropy.py
+    python -m pstats cache/profiles/<...>.prof   # または snakeviz
+"""
+
+import atexit
+import cProfile
+import functools
+import json
+import os
+import resource
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+PROFILE = os.environ.get("HWM_PROFILE", "").lower()
+ENABLED = PROFILE not in ("", "0", "false")
+
+_counters = {"api_calls": 0, "bytes": 0}
+_records = {}
+_stack = []
+_state = {"mark": None, "profiler": None, "started": None}
+
+# 解析スクリプトの段階の分類
+STAGES = ("fetch", "clean", "aggregate", "render", "save")
+
+
+def _peak_rss_mb():
+    # Linux の ru_maxrss は KB 単位（macOS はバイト）
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _status_mb(field):
+    """/proc/self/status の VmRSS, VmHWM など（MB）。読めなければ None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak():
+    """VmHWM（ピークRSS）を現在のRSSに戻す。できたら True"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _install_http_hooks():
+    """requests の送信回数と urllib3 の受信バイト数を数える"""
+    try:
+        import requests.adapters
+        import urllib3.response
+    except ImportError:
+        return
+
+    send = requests.adapters.HTTPAdapter.send
+    read = urllib3.response.HTTPResponse.read
+
+    def counting_send(self, request, *args, **kwargs):
+        _counters["api_calls"] += 1
+        return send(self, request, *args, **kwargs)
+
+    def counting_read(self, *args, **kwargs):
+        data = read(self, *args, **kwargs)
+        _counters["bytes"] += len(data) if data else 0
+        return data
+
+    requests.adapters.HTTPAdapter.send = counting_send
+    urllib3.response.HTTPResponse.read = counting_read
+
+
+def _start():
+    if _state["started"] is not None:
+        return
+    _state["started"] = time.perf_counter()
+    _install_http_hooks()
+    if PROFILE == "cprofile":
+        _state["profiler"] = cProfile.Profile()
+        _state["profiler"].enable()
+    atexit.register(write_report)
+
+
+class stage:
+    """with stage("fetch"): ... または @stage("render") で段階を計測する（入れ子可）"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        if not ENABLED:
+            return self
+        _start()
+        # 親の段階のここまでのピークを取っておいてから、この段階のためにピークを戻す
+        if _stack:
+            _stack[-1]._peak = max(_stack[-1]._peak, _status_mb("VmHWM") or 0.0)
+        self._resettable = _reset_peak()
+        self._peak = 0.0
+        _stack.append(self)
+        self._start = (time.perf_counter(), time.process_time(),
+                       _counters["api_calls"], _counters["bytes"], _status_mb("VmRSS"))
+        return self
+
+    def __exit__(self, *exc):
+        if not ENABLED:
+            return False
+        wall, cpu, calls, received, rss = self._start
+        if self._resettable:
+            peak = max(self._peak, _status_mb("VmHWM") or 0.0)
+        else:
+            peak = _peak_rss_mb()
+        name = "/".join(s.name for s in _stack)
+        _stack.pop()
+        if _stack:
+            _stack[-1]._peak = max(_stack[-1]._peak, peak)
+
+        record = _records.setdefault(name, {"stage": name, "calls": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                            "api_calls": 0, "bytes": 0, "rss_delta_mb": 0.0,
+                                            "peak_rss_mb": 0.0})
+        end_rss = _status_mb("VmRSS")
+        record["calls"] += 1
+        record["wall_s"] = round(record["wall_s"] + time.perf_counter() - wall, 4)
+        record["cpu_s"] = round(record["cpu_s"] + time.process_time() - cpu, 4)
+        record["api_calls"] += _counters["api_calls"] - calls
+        record["bytes"] += _counters["bytes"] - received
+        if rss is not None and end_rss is not None:
+            record["rss_delta_mb"] = round(record["rss_delta_mb"] + end_rss - rss, 1)
+        record["peak_rss_mb"] = round(max(record["peak_rss_mb"], peak), 1)
+        return False
+
+
+def mark(name):
+    """トップレベルのスクリプト用: 直前の mark の段階を閉じて、新しい段階を始める"""
+    if not ENABLED:
+        return
+    if _state["mark"] is not None:
+        _state["mark"].__exit__(None, None, None)
+    _state["mark"] = stage(name)
+    _state["mark"].__enter__()
+
+
+def write_report():
+    """段階ごとの記録と合計をJSONに書き出す（終了時に自動で呼ばれる）"""
+    from cache import cache_path
+
+    if not ENABLED or _state["started"] is None:
+        return None
+    if _state["mark"] is not None:
+        _state["mark"].__exit__(None, None, None)
+        _state["mark"] = None
+
+    script = Path(sys.argv[0]).stem or "interactive"
+    stem = f"{script}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+    report = {
+        "script": script,
+        "argv": sys.argv[1:],
+        "total": {
+            "wall_s": round(time.perf_counter() - _state["started"], 4),
+            "cpu_s": round(time.process_time(), 4),
+            "api_calls": _counters["api_calls"],
+            "bytes": _counters["bytes"],
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+        },
+        "stages": list(_records.values()),
+    }
+    path = cache_path("profiles", f"{stem}.json")
+    path.write_text(json.dumps(report, indent=2))
+    _state["started"] = None
+
+    if _state["profiler"] is not None:
+        _state["profiler"].disable()
+        _state["profiler"].dump_stats(path.with_suffix(".prof"))
+        _state["profiler"] = None
+    print(f"✓ Profile: {path}")
+    return path
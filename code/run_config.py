@@ -0,0 +1,137 @@
+"""
+ランの設定 (run.config) の正規化とインデックス
+入れ子のキーを平坦化して型を揃え、タスク名を正規化したうえで
+(パラメータ, 値) → ランID の転置インデックスを作り、グループ分けや絞り込みを辞書引きで行う
+"""
+
+import re
+from collections import defaultdict
+
+# 環境ごとの設定キー → 正規のキー（環境側の値が実際に使われるので、こちらを優先する）
+ALIASES = {
+    "env.pinpad-easy.reward_mode": "reward_mode",
+    "env.pinpad.reward_mode": "reward_mode",
+}
+
+NUMBER_WORDS = {"3": "three", "4": "four", "5": "five", "6": "six", "7": "seven", "8": "eight"}
+PINPAD_TASK = re.compile(r"pinpad(?:[-_]easy)?[-_](\w+)")
+
+
+def flatten(config, prefix=""):
+    """入れ子の辞書を "a.b.c" 形式のキーに平坦化する（W&Bの {"value": ...} も展開する）"""
+    flat = {}
+    for key, value in config.items():
+        if isinstance(value, dict) and set(value) >= {"value"} and set(value) <= {"value", "desc"}:
+            value = value["value"]
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+
+def coerce(value):
+    """文字列の数値・真偽値を数値・boolに変換し、リストはタプルにする"""
+    if isinstance(value, list):
+        return tuple(coerce(v) for v in value)
+    if not isinstance(value, str):
+        return value
+    text = value.strip()
+    if text.lower() in ("true", "false"):
+        return text.lower() == "true"
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            continue
+    return value
+
+
+def canonical_task(task):
+    """タスク名を正規化する（pinpad-easy_three / pinpad_three / pinpad-3 → pinpad_three）"""
+    if not isinstance(task, str):
+        return task
+    match = PINPAD_TASK.fullmatch(task)
+    if match:
+        size = match.group(1)
+        return f"pinpad_{NUMBER_WORDS.get(size, size)}"
+    return task
+
+
+def normalize_config(config):
+    """run.config を平坦化・型変換・別名解決した辞書にする"""
+    flat = {key: coerce(value) for key, value in flatten(dict(config)).items()
+            if not key.startswith("_")}
+    for alias, key in ALIASES.items():
+        if alias in flat:
+            flat[key] = flat[alias]
+    if "task" in flat:
+        flat["task"] = canonical_task(flat["task"])
+    return flat
+
+
+class ConfigIndex:
+    """正規化した設定と (パラメータ, 値) → ランID の転置インデックス
+
+    index[param][value] がランIDの集合になっている。
+    """
+
+    def __init__(self):
+        self.configs = {}
+        self.runs = {}
+        self.index = defaultdict(lambda: defaultdict(set))
+
+    @classmethod
+    def from_runs(cls, runs):
+        index = cls()
+        for run in runs:
+            index.add(run.id, run.config, run=run)
+        return index
+
+    def add(self, run_id, config, run=None):
+        config = normalize_config(config)
+        self.configs[run_id] = config
+        if run is not None:
+            self.runs[run_id] = run
+        for key, value in config.items():
+            try:
+                self.index[key][value].add(run_id)
+            except TypeError:
+                # ハッシュできない値（辞書のリストなど）は索引しない
+                continue
+
+    def lookup(self, param, value):
+        """param == value のランIDの集合"""
+        value = canonical_task(value) if param == "task" else coerce(value)
+        if param not in self.index:
+            return set()
+        return set(self.index[param].get(value, ()))
+
+    def select(self, criteria=None, **kwargs):
+        """全ての条件を満たすランIDの集合（キーにドットを含む条件は criteria で渡す）"""
+        criteria = {**(criteria or {}), **kwargs}
+        selected = set(self.configs)
+        for param, value in criteria.items():
+            selected &= self.lookup(param, value)
+        return selected
+
+    def values(self, param):
+        """param が取る値の一覧（ソート済み）"""
+        if param not in self.index:
+            return []
+        return sorted(self.index[param], key=lambda v: (str(type(v)), v))
+
+    def group_by(self, param, run_ids=None):
+        """param の値ごとのランIDのリスト（param を持たないランは除く）"""
+        groups = {}
+        for value in self.values(param):
+            ids = self.index[param][value]
+            if run_ids is not None:
+                ids = ids & set(run_ids)
+            if ids:
+                groups[value] = sorted(ids)
+        return groups
+
+    def get(self, run_id, param, default=None):
+        return self.configs.get(run_id, {}).get(param, default)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+スイープ内の全ランのメタデータ（設定・状態・サマリー・最終ステップ）の一括取得
+api.runs(filters={"sweep": id}, per_page=...) のページング付き一括クエリで取得し、
+cache/runs/<sweep_id>.json に保存する。実行中のランがあれば HWM_META_TTL 秒（既定 600）、
+全ランが終了済みでも HWM_META_FINAL_TTL 秒（既定 86400）経ったら取り直す
+（終了後に再開されたランや、スイープに後から足されたランも拾う）。
+最終ステップなどはサマリーから答えるので、historyをダウンロードする必要が無い。
+
+    python code/run_metadata.py rssm
+"""
+
+import argparse
+import json
+import os
+import time
+
+from cache import FINAL_STATES, atomic_write, cache_path
+from sweeps import PROJECT, SWEEPS
+
+META_TTL = int(os.environ.get("HWM_META_TTL", 600))
+META_FINAL_TTL = int(os.environ.get("HWM_META_FINAL_TTL", 86400))
+PER_PAGE = 200
+
+
+def run_record(run):
+    """Run から保存するメタデータ（JSONにできるスカラーだけ）"""
+    summary = {key: value for key, value in dict(run.summary).items()
+               if isinstance(value, (int, float, str, bool)) or value is None}
+    return {
+        "id": run.id,
+        "name": run.name,
+        "state": run.state,
+        "config": {key: value for key, value in dict(run.config).items() if not key.startswith("_")},
+        "summary": summary,
+        "last_step": summary.get("_step"),
+        "last_logged": summary.get("_timestamp"),
+    }
+
+
+class RunInfo:
+    """ランのメタデータ。history などメタデータ以外の属性は、必要になった時点で Run を取得して委譲する"""
+
+    def __init__(self, record, run=None, api=None):
+        self.record = record
+        self.id = record["id"]
+        self.name = record["name"]
+        self.state = record["state"]
+        self.config = record["config"]
+        self.summary = record["summary"]
+        self.last_step = record["last_step"]
+        self._run = run
+        self._api = api
+        # スナップショットかどうかで Run を取得しに行かないように、ここで決めておく
+        self.is_snapshot = getattr(run, "is_snapshot", False)
+
+    @property
+    def run(self):
+        if self._run is None:
+            if self._api is None:
+                from snapshot import open_api
+                self._api = open_api()
+            self._run = self._api.run(f"{PROJECT}/{self.id}")
+        return self._run
+
+    def __getattr__(self, name):
+        # history / scan_history / file などは Run に任せる
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.run, name)
+
+
+class SweepRuns(list):
+    """スイープの RunInfo のリスト"""
+
+    def __init__(self, sweep_id, runs, fetched_at):
+        super().__init__(runs)
+        self.sweep_id = sweep_id
+        self.fetched_at = fetched_at
+
+    def by_id(self):
+        return {run.id: run for run in self}
+
+    def max_steps(self):
+        """ランごとの最終ステップ（サマリーの _step）"""
+        return {run.id: run.last_step for run in self}
+
+    def all_final(self):
+        return all(run.state in FINAL_STATES for run in self)
+
+
+def _sweep_id(sweep):
+    return SWEEPS[sweep]["id"] if sweep in SWEEPS else sweep.rstrip("/").split("/")[-1]
+
+
+def sweep_runs(sweep, api=None, per_page=PER_PAGE, refresh=False):
+    """スイープ（sweeps.py の名前またはID）の全ランのメタデータ"""
+    from snapshot import open_api
+
+    sweep_id = _sweep_id(sweep)
+    api = api or open_api()
+    snapshot = getattr(api, "snapshot", None)
+    if snapshot is not None:
+        # スナップショットには設定とサマリーが入っている。別のスイープなら api.sweep が ValueError を出す
+        runs = [RunInfo(run_record(run), run=run) for run in api.sweep(sweep_id).runs]
+        return SweepRuns(sweep_id, runs, None)
+
+    path = cache_path("runs", f"{sweep_id}.json")
+    if not refresh and path.exists():
+        cached = json.loads(path.read_text())
+        runs = SweepRuns(sweep_id, [RunInfo(r, api=api) for r in cached["runs"]], cached["fetched_at"])
+        ttl = META_FINAL_TTL if runs.all_final() else META_TTL
+        if time.time() - cached["fetched_at"] < ttl:
+            return runs
+
+    fetched_at = time.time()
+    runs = list(api.runs(PROJECT, filters={"sweep": sweep_id}, per_page=per_page))
+    records = [run_record(run) for run in runs]
+    with atomic_write(path) as tmp:
+        tmp.write_text(json.dumps({"sweep": sweep_id, "fetched_at": fetched_at, "runs": records}, default=str))
+    return SweepRuns(sweep_id, [RunInfo(r, run=run, api=api) for r, run in zip(records, runs)], fetched_at)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print run metadata of a sweep without downloading histories")
+    parser.add_argument("sweeps", nargs="*", default=list(SWEEPS), help="sweep names in sweeps.py")
+    parser.add_argument("--refresh", action="store_true", help="ignore the cached metadata")
+    args = parser.parse_args()
+
+    for name in args.sweeps:
+        runs = sweep_runs(name, refresh=args.refresh)
+        param = SWEEPS[name]["param"] if name in SWEEPS else None
+        print(f"\n=== {name} ({runs.sweep_id}): {len(runs)} runs ===")
+        for run in runs:
+            value = f"  {param}={run.config.get(param)}" if param else ""
+            print(f"{run.name:>30}  {run.state:>9}  step={run.last_step}{value}")
+
+
+if __name__ == "__main__":
+    main()
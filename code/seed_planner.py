@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+シード数の計画（モンテカルロによる検出力の計算）
+キャッシュ済みhistoryから (タスク, アーム) ごとにシード間の最終スコアのばらつきを求め、
+そのばらつきで効果量 effect の差がある2群を n シードずつ生成して Welch の t 検定に掛けることを
+n_sim 回繰り返し、検出力が target に届く最小のシード数を推奨する。
+全セル・全試行を [cells, n_sim, n] の配列で一度に生成・検定するので、候補のシード数ごとに1回の計算で済む。
+t 分布の両側 p 値は正則化不完全ベータ関数（連分数展開）を numpy で計算するので、scipy は要らない。
+
+シードが1つしかないセルは分散が求まらないので、同じタスクで複数シードのあるセルの
+プールした標準偏差を使い、それも無ければランの最後の区間のエピソードスコアの標準偏差で代用する
+（どれを使ったかは表の source 列に出す）。
+
+    python code/seed_planner.py hierarchy atari --relative 0.2
+    python code/seed_planner.py reward-ratio --effect 10
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from cache import load_history
+from sweep_stats import SCORE_KEY, final_score
+
+N_SIM = 2000
+MAX_SEEDS = 30
+
+
+def tail_std(history, key=SCORE_KEY, tail_fraction=0.1):
+    """学習の最後 tail_fraction の区間のエピソードスコアの標準偏差"""
+    df = history.dropna(subset=[key])
+    if len(df) < 2:
+        return np.nan
+    start = df["_step"].max() * (1.0 - tail_fraction)
+    return float(df.loc[df["_step"] >= start, key].std(ddof=1))
+
+
+def collect_cells(runs, param, configs, key=SCORE_KEY, tail_fraction=0.1):
+    """(タスク, アーム) ごとのシードの最終スコアと、ランの最後の区間のエピソードスコアの標準偏差"""
+    rows = []
+    for value, run_ids in configs.group_by(param).items():
+        for run_id in run_ids:
+            history = load_history(runs[run_id], [key])
+            score = final_score(history, key, tail_fraction)
+            if np.isnan(score):
+                continue
+            rows.append({"task": configs.get(run_id, "task", "unknown"), "arm": value, "run_id": run_id,
+                         "score": score, "episode_std": tail_std(history, key, tail_fraction)})
+    return pd.DataFrame(rows, columns=["task", "arm", "run_id", "score", "episode_std"])
+
+
+def seed_spread(runs_df):
+    """セルごとの平均・シード数・シード間の標準偏差と、その求め方 (source)"""
+    cells = runs_df.groupby(["task", "arm"], dropna=False).agg(
+        n=("score", "size"), mean=("score", "mean"), std=("score", "std"), episode_std=("episode_std", "mean"))
+    cells["source"] = np.where(cells["n"] >= 2, "seeds", "")
+
+    # 同じタスクの、複数シードのあるセルの分散をプールする
+    multi = cells[cells["n"] >= 2]
+    pooled = ((multi["n"] - 1) * multi["std"] ** 2).groupby(level="task").sum() \
+        / (multi["n"] - 1).groupby(level="task").sum()
+    tasks = cells.index.get_level_values("task")
+    pooled_std = np.sqrt(pooled.reindex(tasks).to_numpy())
+    single = cells["n"] < 2
+    use_pooled = single & ~np.isnan(pooled_std)
+    cells.loc[use_pooled, "std"] = pooled_std[use_pooled]
+    cells.loc[use_pooled, "source"] = "pooled"
+    use_episode = single & ~use_pooled
+    cells.loc[use_episode, "std"] = cells.loc[use_episode, "episode_std"]
+    cells.loc[use_episode, "source"] = "episodes"
+    return cells.drop(columns="episode_std")
+
+
+# Lanczos 近似 (g = 7) の係数
+LANCZOS = (0.99999999999980993, 676.5203681218851, -1259.1392167224028, 771.32342877765313,
+           -176.61503916999185, 12.507343278686905, -0.13857109526572012, 9.9843695780195716e-6,
+           1.5056327351493116e-7)
+
+
+def _lgamma(x):
+    """x >= 0.5 の配列に対する log Γ(x)（Lanczos 近似。Γ(x) の相対誤差は 2e-7 以下で、p 値には十分）"""
+    x = np.asarray(x, dtype=float) - 1
+    series = LANCZOS[0] + sum(c / (x + i) for i, c in enumerate(LANCZOS[1:], start=1))
+    t = x + 7.5
+    return 0.5 * np.log(2 * np.pi) + (x + 0.5) * np.log(t) - t + np.log(series)
+
+
+def _beta_fraction(a, b, x, max_iter=300, eps=1e-14):
+    """正則化不完全ベータ関数の連分数 (modified Lentz 法)。x < (a + 1) / (a + b + 2) で速く収束する"""
+    tiny = 1e-300
+    c = np.ones_like(x)
+    d = 1 - (a + b) * x / (a + 1)
+    d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+    h = d
+    for m in range(1, max_iter + 1):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1 + numerator * d
+            d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+            c = 1 + numerator / c
+            c = np.where(np.abs(c) < tiny, tiny, c)
+            delta = c * d
+            h = h * delta
+        if np.all(np.abs(delta - 1) < eps):
+            break
+    return h
+
+
+def _betainc(a, b, x):
+    """正則化不完全ベータ関数 I_x(a, b)（a, b >= 0.5）"""
+    a, b, x = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (a, b, x)))
+    inner = (x > 0) & (x < 1)
+    xc = np.where(inner, x, 0.5)
+    with np.errstate(divide="ignore"):
+        log_front = (_lgamma(a + b) - _lgamma(a) - _lgamma(b) + a * np.log(xc) + b * np.log1p(-xc))
+    # 収束の速い側で展開し、反対側は I_x(a, b) = 1 - I_{1-x}(b, a) で求める
+    direct = xc < (a + 1) / (a + b + 2)
+    aa, bb, xx = np.where(direct, a, b), np.where(direct, b, a), np.where(direct, xc, 1 - xc)
+    part = np.exp(log_front) * _beta_fraction(aa, bb, xx) / aa
+    out = np.where(direct, part, 1 - part)
+    return np.where(inner, out, np.where(x >= 1, 1.0, 0.0))
+
+
+def welch_pvalue(a, b, axis=-1):
+    """Welch の t 検定（等分散を仮定しない）の両側 p 値。どちらの群も分散0なら NaN"""
+    n_a, n_b = a.shape[axis], b.shape[axis]
+    var_a = a.var(axis=axis, ddof=1) / n_a
+    var_b = b.var(axis=axis, ddof=1) / n_b
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = (a.mean(axis=axis) - b.mean(axis=axis)) / np.sqrt(var_a + var_b)
+        # Welch-Satterthwaite の自由度
+        df = (var_a + var_b) ** 2 / (var_a ** 2 / (n_a - 1) + var_b ** 2 / (n_b - 1))
+    valid = np.isfinite(t) & np.isfinite(df)
+    df = np.where(valid, df, 1.0)
+    # 自由度 df の t 分布で P(|T| >= |t|) = I_{df / (df + t²)}(df / 2, 1 / 2)
+    pvalue = _betainc(df / 2, 0.5, df / (df + np.where(valid, t, 0.0) ** 2))
+    return np.where(valid, pvalue, np.nan)
+
+
+def simulate_power(means, stds, effects, seeds, n_sim=N_SIM, alpha=0.05, rng=None):
+    """各セルについて、n シードずつの2群の差を Welch の t 検定で検出できる確率 [cells, len(seeds)]
+
+    一方の群は平均 means、他方は means + effects、どちらも標準偏差 stds の正規分布から生成する。
+    """
+    rng = rng or np.random.default_rng(0)
+    means = np.asarray(means, dtype=float)[:, None, None]
+    stds = np.asarray(stds, dtype=float)[:, None, None]
+    effects = np.asarray(effects, dtype=float)[:, None, None]
+    power = np.empty((means.shape[0], len(seeds)))
+    for j, n in enumerate(seeds):
+        noise = rng.standard_normal((2, means.shape[0], n_sim, n))
+        control = means + stds * noise[0]
+        treated = means + effects + stds * noise[1]
+        pvalue = welch_pvalue(control, treated)
+        power[:, j] = (pvalue < alpha).mean(axis=1)
+    return power
+
+
+def min_seeds(power, seeds, target=0.8):
+    """検出力が target 以上になる最小のシード数（届かなければ NaN）"""
+    reached = power >= target
+    first = reached.argmax(axis=1)
+    return np.where(reached.any(axis=1), np.asarray(seeds)[first], np.nan)
+
+
+def plan(cells, effect=None, relative=0.2, target=0.8, alpha=0.05, max_seeds=MAX_SEEDS, n_sim=N_SIM, seed=0):
+    """セルごとの推奨シード数と、現在のシード数での検出力を cells に足して返す
+
+    effect（スコアの絶対値）を省略すると、セルの平均の relative 倍を検出したい差とする。
+    """
+    cells = cells[cells["std"].notna()].copy()
+    cells["effect"] = effect if effect is not None else relative * cells["mean"].abs()
+    seeds = np.arange(2, max_seeds + 1)
+    power = simulate_power(cells["mean"], cells["std"], cells["effect"], seeds, n_sim, alpha,
+                           np.random.default_rng(seed))
+    cells["seeds_needed"] = min_seeds(power, seeds, target)
+    current = np.clip(cells["n"].to_numpy(), seeds[0], seeds[-1]) - seeds[0]
+    # 1シードでは検定できないので検出力は0
+    cells["power_now"] = np.where(cells["n"] >= 2, power[np.arange(len(cells)), current], 0.0)
+    return cells
+
+
+def main():
+    from run_config import ConfigIndex
+    from run_metadata import sweep_runs
+    from snapshot import open_api
+    from sweeps import SWEEPS
+
+    parser = argparse.ArgumentParser(description="Recommend the number of seeds per sweep arm by power simulation")
+    parser.add_argument("sweeps", nargs="*", default=["hierarchy", "atari"], help="sweep names in sweeps.py")
+    parser.add_argument("--param", help="config key defining the arms (default: the sweep's param)")
+    parser.add_argument("--effect", type=float, help="score difference to detect (absolute)")
+    parser.add_argument("--relative", type=float, default=0.2,
+                        help="score difference to detect as a fraction of the arm mean (when --effect is not given)")
+    parser.add_argument("--power", type=float, default=0.8, help="target power")
+    parser.add_argument("--alpha", type=float, default=0.05, help="significance level of Welch's t-test")
+    parser.add_argument("--max-seeds", type=int, default=MAX_SEEDS, help="largest number of seeds considered")
+    parser.add_argument("--sims", type=int, default=N_SIM, help="Monte-Carlo replicates per seed count")
+    parser.add_argument("--tail", type=float, default=0.1, help="fraction of training used for the final score")
+    args = parser.parse_args()
+
+    api = open_api()
+    for name in args.sweeps:
+        param = args.param or SWEEPS[name]["param"]
+        configs = ConfigIndex.from_runs(sweep_runs(name, api))
+        runs_df = collect_cells(configs.runs, param, configs, tail_fraction=args.tail)
+        if runs_df.empty:
+            print(f"⚠ {name}: no runs with scores")
+            continue
+
+        cells = plan(seed_spread(runs_df), args.effect, args.relative, args.power, args.alpha,
+                     args.max_seeds, args.sims)
+        print(f"\n=== {name} ({param}): seeds for power {args.power} at alpha {args.alpha} ===")
+        print(cells.round({"mean": 2, "std": 2, "effect": 2, "power_now": 2}).to_string())
+        needed = cells["seeds_needed"]
+        if needed.isna().any():
+            print(f"⚠ {needed.isna().sum()} cells need more than {args.max_seeds} seeds for this effect size")
+        if needed.notna().any():
+            print(f"✓ Recommended seeds per arm: {int(needed.max())}")
+
+
+if __name__ == "__main__":
+    main()
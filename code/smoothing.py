@@ -0,0 +1,141 @@
+"""
+ステップ単位の平滑化カーネル（複数ランをまとめて処理する）
+y.rolling(window=20) は記録された点の数で平均するので、記録間隔の違うランでは平滑化の強さが変わる。
+ここでは幅をステップ数で指定し、各点をその点が代表するステップ幅（直前の点との間隔）で重み付けする。
+
+ランごとの系列は stack() で [runs × points] の行列（足りない分は NaN）にし、
+全ランを1回の呼び出しで処理する。行の境界をまたがないように、各行のステップに
+行番号 × (全ランのステップ幅より大きい値) を足して1本の単調な配列にし、
+累積和と searchsorted だけで窓の和を求めるので、計算量は全点数に対して O(n log n)（窓の和は O(n)）。
+
+    moving_average : 後ろ向きの窓 (t - width, t] の重み付き平均
+    ema            : 半減期 halflife ステップの指数移動平均（重みの和で割って初期値への偏りを除く）
+    gaussian       : 中心窓の箱型フィルタを passes 回重ねたガウス近似（標準偏差 sigma ステップ）
+"""
+
+import numpy as np
+
+POINTS = 20
+
+
+def stack(curves):
+    """[(steps, values), ...] を NaN で埋めた [runs × points] の steps, values 行列にする"""
+    n = max((len(steps) for steps, _ in curves), default=0)
+    steps = np.full((len(curves), n), np.nan)
+    values = np.full((len(curves), n), np.nan)
+    for row, (s, v) in enumerate(curves):
+        steps[row, :len(s)] = s
+        values[row, :len(v)] = v
+    return steps, values
+
+
+def unstack(matrix, curves):
+    """stack() した行列の各行を、元の系列の長さに切り詰めたリストにする"""
+    return [row[:len(steps)] for row, (steps, _) in zip(matrix, curves)]
+
+
+def median_spacing(steps):
+    """全ランの記録間隔の中央値（ステップ）"""
+    gaps = np.diff(np.atleast_2d(steps), axis=1)
+    gaps = gaps[np.isfinite(gaps) & (gaps > 0)]
+    return float(np.median(gaps)) if gaps.size else 1.0
+
+
+def _prepare(steps, values):
+    """行列の形を揃え、点ごとの重み（直前の有効な点からのステップ幅）を求める"""
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    steps = np.broadcast_to(np.asarray(steps, dtype=np.float64), values.shape)
+    valid = np.isfinite(values) & np.isfinite(steps)
+
+    # 有効な点のステップだけを前に詰めたもの。直前の有効な点との差が重みになる
+    observed = np.where(valid, steps, np.nan)
+    previous = np.fmax.accumulate(observed, axis=1)
+    previous = np.concatenate([np.full((len(values), 1), np.nan), previous[:, :-1]], axis=1)
+    weights = np.where(valid, steps - previous, 0.0)
+    # 各行の最初の点は直前の点が無いので、全体の記録間隔を使う
+    weights = np.where(valid & np.isnan(previous), median_spacing(steps), weights)
+    weights = np.clip(np.nan_to_num(weights), 0.0, None)
+
+    # 埋め草の点は直前の有効なステップに置き、行の中でステップが単調になるようにする
+    filled = np.nan_to_num(np.fmax.accumulate(np.where(np.isfinite(steps), steps, np.nan), axis=1))
+    return filled, np.where(valid, values, 0.0), weights, valid
+
+
+def _flat_keys(steps, margin):
+    """行ごとのステップを、行どうしが重ならないようにずらして1本の配列にする"""
+    span = (steps.max(axis=1) - steps.min(axis=1)).max(initial=0.0) + 2 * margin + 1
+    origin = steps.min(axis=1, keepdims=True)
+    return ((steps - origin) + np.arange(len(steps))[:, None] * span).ravel()
+
+
+def _window_mean(keys, values, weights, lo, hi, side_lo):
+    """keys の各点について [key + lo, key + hi] の窓の重み付き平均（累積和の差）"""
+    sum_wy = np.concatenate([[0.0], np.cumsum(values * weights)])
+    sum_w = np.concatenate([[0.0], np.cumsum(weights)])
+    start = np.searchsorted(keys, keys + lo, side=side_lo)
+    end = np.searchsorted(keys, keys + hi, side="right")
+    total = sum_w[end] - sum_w[start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, (sum_wy[end] - sum_wy[start]) / total, np.nan)
+
+
+def moving_average(steps, values, width):
+    """後ろ向きの窓 (t - width, t] の、ステップ幅で重み付けした移動平均"""
+    steps, values, weights, valid = _prepare(steps, values)
+    keys = _flat_keys(steps, width)
+    out = _window_mean(keys, values.ravel(), weights.ravel(), -width, 0.0, "right")
+    return np.where(valid, out.reshape(values.shape), np.nan)
+
+
+def ema(steps, values, halflife):
+    """半減期 halflife ステップの指数移動平均（重みの和で正規化するので最初の点に引きずられない）
+
+    s(t) = Σ w_j y_j exp(-λ(t - t_j)) / Σ w_j exp(-λ(t - t_j))  (λ = ln2 / halflife)
+    を対数領域の累積 (np.logaddexp.accumulate) で求めるので、長いランでも桁あふれしない。
+    値の正負は別々に累積する。
+    """
+    steps, values, weights, valid = _prepare(steps, values)
+    rate = np.log(2) / halflife
+    decay = rate * (steps - steps[:, :1])
+    with np.errstate(divide="ignore"):
+        log_w = np.log(weights) + decay
+        log_pos = np.logaddexp.accumulate(log_w + np.log(np.clip(values, 0, None)), axis=1)
+        log_neg = np.logaddexp.accumulate(log_w + np.log(np.clip(-values, 0, None)), axis=1)
+        log_norm = np.logaddexp.accumulate(log_w, axis=1)
+    with np.errstate(invalid="ignore"):
+        out = np.exp(log_pos - log_norm) - np.exp(log_neg - log_norm)
+    return np.where(valid & np.isfinite(log_norm), out, np.nan)
+
+
+def gaussian(steps, values, sigma, passes=3):
+    """標準偏差 sigma ステップのガウス平滑化を、中心窓の箱型フィルタ passes 回で近似する"""
+    steps, values, weights, valid = _prepare(steps, values)
+    # 幅 b の箱の分散は b²/12 なので、passes 回重ねて分散 sigma² になる幅
+    half = np.sqrt(12 * sigma ** 2 / passes) / 2
+    keys = _flat_keys(steps, half)
+    out = values.ravel()
+    for _ in range(passes):
+        out = _window_mean(keys, np.nan_to_num(out), weights.ravel(), -half, half, "left")
+    return np.where(valid, out.reshape(values.shape), np.nan)
+
+
+def smooth_runs(curves, kind="ma", points=POINTS, width=None):
+    """ランごとの (steps, values) を一度に平滑化し、ランごとの配列のリストで返す
+
+    width（ステップ）を省略すると、記録間隔の中央値 × points にする。
+    ema と gaussian は同じ幅の移動平均と同程度の平滑化になるように半減期・標準偏差を決める
+    （移動平均の窓の平均的な遅れ width/2 に合わせた半減期、窓と同じ分散の標準偏差）。
+    """
+    if not curves:
+        return []
+    steps, values = stack(curves)
+    width = width or points * median_spacing(steps)
+    if kind == "ma":
+        smooth = moving_average(steps, values, width)
+    elif kind == "ema":
+        smooth = ema(steps, values, width * np.log(2) / 2)
+    elif kind == "gaussian":
+        smooth = gaussian(steps, values, width / np.sqrt(12))
+    else:
+        raise ValueError(f"unknown smoothing: {kind} (expected ma, ema or gaussian)")
+    return unstack(smooth, curves)
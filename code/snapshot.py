@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+スイープのスナップショット（1ファイルのアーカイブ）の書き出しと読み込み
+設定・間引いたhistory (Parquet)・重複を除いたメディアを1つの .hwm ファイルにまとめ、
+共著者がW&Bにアクセスせずに解析スクリプトを実行できるようにする。
+
+ファイル形式:
+    [ヘッダ 24バイト: MAGIC, マニフェストのオフセット, 長さ] [メンバ ...] [マニフェスト (JSON)]
+メンバはそれぞれ独立に圧縮する（zstandard があれば zstd、無ければ zlib）。
+Parquet（内部で zstd 圧縮済み）と PNG/GIF は圧縮せずに格納するので、読み込み側は
+ファイルを mmap してメンバのバイト列をコピー・展開なしに参照できる。
+
+    python code/snapshot.py export entropy -o entropy.hwm
+    HWM_SNAPSHOT=entropy.hwm python code/Hieros-sweep-entropy.py
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"HWMSNAP1"
+HEADER = struct.Struct("<8sQQ")
+SNAPSHOT = os.environ.get("HWM_SNAPSHOT")
+MEDIA_KEYS = ("exploration/position_heatmap", "report/subgoal_visualization")
+MAX_POINTS = 2000
+
+
+def _compress(data):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+
+def _decompress(codec, data):
+    if codec == "none":
+        return data
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstandard is None:
+            raise ImportError("this snapshot uses zstd; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"unknown codec: {codec}")
+
+
+class SnapshotWriter:
+    """メンバを順に追記し、close() でマニフェストを書く"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = open(self.path, "wb")
+        self.file.write(HEADER.pack(MAGIC, 0, 0))
+        self.members = {}
+
+    def add(self, name, data, compress=True):
+        if name in self.members:
+            return
+        codec, stored = _compress(data) if compress else ("none", data)
+        if codec != "none" and len(stored) >= len(data):
+            codec, stored = "none", data
+        self.members[name] = {"offset": self.file.tell(), "length": len(stored),
+                              "size": len(data), "codec": codec}
+        self.file.write(stored)
+
+    def add_json(self, name, obj):
+        self.add(name, json.dumps(obj, default=str).encode())
+
+    def add_frame(self, name, df):
+        buf = io.BytesIO()
+        df.to_parquet(buf, index=False, compression="zstd")
+        self.add(name, buf.getvalue(), compress=False)
+
+    def close(self):
+        manifest = json.dumps({"version": 1, "members": self.members}).encode()
+        offset = self.file.tell()
+        self.file.write(manifest)
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, offset, len(manifest)))
+        self.file.close()
+
+
+class Snapshot:
+    """アーカイブを mmap して読み取り専用で開く"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, offset, length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a sweep snapshot")
+        self.members = json.loads(bytes(self._mmap[offset:offset + length]))["members"]
+        self.sweep = self.json("sweep.json")
+        self.name = self.sweep["display_name"]
+        self.media = self.json("media.json")
+        self.runs = [SnapshotRun(self, run_id, info) for run_id, info in self.json("runs.json").items()]
+
+    def read(self, name):
+        """メンバのバイト列（無圧縮のメンバは mmap へのゼロコピーの memoryview）"""
+        entry = self.members[name]
+        view = memoryview(self._mmap)[entry["offset"]:entry["offset"] + entry["length"]]
+        return view if entry["codec"] == "none" else _decompress(entry["codec"], view)
+
+    def json(self, name):
+        return json.loads(bytes(self.read(name)))
+
+    def table(self, name):
+        return pq.read_table(pa.BufferReader(pa.py_buffer(self.read(name))))
+
+
+class SnapshotRun:
+    """wandb の Run のうち、解析スクリプトが使う部分だけを持つ読み取り専用のラン"""
+
+    is_snapshot = True
+
+    def __init__(self, snapshot, run_id, info):
+        self._snapshot = snapshot
+        self.id = run_id
+        self.name = info["name"]
+        self.state = info["state"]
+        self.config = info["config"]
+        self.summary = info["summary"]
+        self._media = info["media"]
+
+    def history(self, keys=None, **kwargs):
+        """スカラーは間引いたhistory、メディアは {"path": ...} のセルとして返す"""
+        history = self._snapshot.table(f"history/{self.id}.parquet").to_pandas()
+        if keys is not None:
+            history = history[["_step"] + [k for k in keys if k in history.columns and k != "_step"]]
+        for key, cells in self._media.items():
+            if keys is not None and key not in keys:
+                continue
+            media = pd.DataFrame({"_step": [step for step, _ in cells],
+                                  key: [{"path": path} for _, path in cells]})
+            history = history.merge(media, on="_step", how="outer")
+        return history.sort_values("_step").reset_index(drop=True)
+
+    def scan_history(self, keys=None, **kwargs):
+        return self.history(keys).to_dict("records")
+
+    def media_bytes(self, path):
+        """W&Bのメディアファイルのパスに対応するメンバのバイト列"""
+        return self._snapshot.read(self._snapshot.media[path])
+
+
+class SnapshotApi:
+    """wandb.Api の代わりにスナップショット内のスイープを返す"""
+
+    def __init__(self, path):
+        self.snapshot = Snapshot(path)
+
+    def sweep(self, path):
+        if path.rstrip("/").split("/")[-1] != self.snapshot.sweep["id"]:
+            raise ValueError(f"snapshot {self.snapshot.path} contains sweep {self.snapshot.sweep['id']}, not {path}")
+        return self.snapshot
+
+    def run(self, path):
+        run_id = path.rstrip("/").split("/")[-1]
+        for run in self.snapshot.runs:
+            if run.id == run_id:
+                return run
+        raise ValueError(f"run {run_id} is not in snapshot {self.snapshot.path}")
+
+
+def open_api():
+    """HWM_SNAPSHOT が指定されていればスナップショットを、無ければW&B APIを返す"""
+    if SNAPSHOT:
+        return SnapshotApi(SNAPSHOT)
+    import wandb
+    return wandb.Api()
+
+
+def downsample(history, max_points=MAX_POINTS):
+    """各メトリクスを等間隔に最大 max_points 点まで間引いて _step で外部結合する"""
+    frames = []
+    for key in history.columns:
+        if key == "_step":
+            continue
+        df = history[["_step", key]].dropna()
+        if len(df) > max_points:
+            df = df.iloc[np.linspace(0, len(df) - 1, max_points).round().astype(int)]
+        frames.append(df.set_index("_step"))
+    if not frames:
+        return pd.DataFrame(columns=["_step"])
+    return pd.concat(frames, axis=1, join="outer").sort_index().reset_index()
+
+
+def _scalar_summary(summary):
+    return {k: v for k, v in dict(summary).items()
+            if isinstance(v, (int, float, str, bool)) or v is None}
+
+
+def export_sweep(name, out, keys=None, max_points=MAX_POINTS, media_keys=MEDIA_KEYS):
+    """スイープを1つのアーカイブに書き出す"""
+    import wandb
+    from cache import load_history
+    from subactor_tensor import discover_subactor_keys
+    from sweeps import SWEEPS, sweep_path
+
+    sweep = wandb.Api().sweep(sweep_path(name))
+    writer = SnapshotWriter(out)
+    writer.add_json("sweep.json", {"name": name, "id": SWEEPS[name]["id"], "param": SWEEPS[name]["param"],
+                                      "display_name": sweep.name})
+    runs, media_members = {}, {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in sweep.runs:
+            run_keys = keys or ["episode/score", *discover_subactor_keys(run.summary.keys()).values()]
+            writer.add_frame(f"history/{run.id}.parquet", downsample(load_history(run, run_keys), max_points))
+
+            media = {}
+            for key in media_keys:
+                cells = []
+                for row in run.scan_history(keys=["_step", key]):
+                    cell = row.get(key)
+                    if not isinstance(cell, dict) or "path" not in cell:
+                        continue
+                    if cell["path"] not in media_members:
+                        local = run.file(cell["path"]).download(root=tmp, replace=True).name
+                        data = Path(local).read_bytes()
+                        # 同じ内容のメディアは1つだけ格納する
+                        member = f"media/{hashlib.sha1(data).hexdigest()}{Path(cell['path']).suffix}"
+                        writer.add(member, data, compress=False)
+                        media_members[cell["path"]] = member
+                    cells.append((int(row["_step"]), cell["path"]))
+                if cells:
+                    media[key] = cells
+
+            runs[run.id] = {"name": run.name, "state": run.state, "config": dict(run.config),
+                            "summary": _scalar_summary(run.summary), "media": media}
+            print(f"✓ {run.name}: {sum(len(c) for c in media.values())} media")
+    writer.add_json("runs.json", runs)
+    writer.add_json("media.json", media_members)
+    writer.close()
+    return Path(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or inspect a sweep snapshot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="pack a sweep into one archive")
+    export.add_argument("sweep", help="sweep name in sweeps.py")
+    export.add_argument("-o", "--output", help="archive path (default: <sweep>.hwm)")
+    export.add_argument("--max-points", type=int, default=MAX_POINTS, help="points kept per metric")
+    info = sub.add_parser("info", help="list the contents of an archive")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        path = export_sweep(args.sweep, args.output or f"{args.sweep}.hwm", max_points=args.max_points)
+        print(f"✓ Saved: {path} ({path.stat().st_size / 1e6:.1f} MB)")
+    else:
+        snapshot = Snapshot(args.path)
+        print(f"sweep {snapshot.sweep['name']} ({snapshot.sweep['id']}), {len(snapshot.runs)} runs")
+        for kind in ("history", "media"):
+            entries = [e for n, e in snapshot.members.items() if n.startswith(f"{kind}/")]
+            print(f"  {kind}: {len(entries)} members, {sum(e['length'] for e in entries) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+サブアクター（階層レベル）ごとのメトリクスを1つのテンソルにまとめるローダ
+ランに記録された train/Subactor-N/<metric> のキーを自動で見つけ、
+共通のステップグリッド上でビン平均した [run, level, metric, step] の float32 配列を作る。
+組み立てた結果は cache/subactor/ に .npz で保存するので、レベル別の報酬分解なども
+配列のスライスだけで行える。
+"""
+
+import argparse
+import hashlib
+import re
+import warnings
+
+import numpy as np
+
+from cache import atomic_write, cache_path, key_lock, load_history
+
+SUBACTOR_KEY = re.compile(r"train/Subactor-(?P<level>\d+)/(?P<metric>.+)")
+N_STEPS = 200
+
+
+def subactor_key(level, metric):
+    return f"train/Subactor-{level}/{metric}"
+
+
+def discover_subactor_keys(keys):
+    """キーの一覧から {(level, metric): key} を見つける"""
+    found = {}
+    for key in keys:
+        match = SUBACTOR_KEY.fullmatch(key)
+        if match:
+            found[(int(match["level"]), match["metric"])] = key
+    return found
+
+
+def discover_levels(keys):
+    """キーの一覧に現れるサブアクターのレベル（昇順）"""
+    return sorted({level for level, _ in discover_subactor_keys(keys)})
+
+
+def step_grid(max_step, n_steps=N_STEPS):
+    """0..max_step を n_steps 個のビンに分けたときのビンの境界と中心"""
+    edges = np.linspace(0, max_step, n_steps + 1)
+    return edges, (edges[:-1] + edges[1:]) / 2
+
+
+def bin_mean(steps, values, edges):
+    """ステップ列を edges のビンに分けて平均する（サンプルの無いビンは NaN）"""
+    steps = np.asarray(steps, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    keep = ~np.isnan(values) & (steps >= edges[0]) & (steps <= edges[-1])
+    index = np.clip(np.searchsorted(edges, steps[keep], side="right") - 1, 0, len(edges) - 2)
+    n_bins = len(edges) - 1
+    sums = np.bincount(index, weights=values[keep], minlength=n_bins)
+    counts = np.bincount(index, minlength=n_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+class SubactorTensor:
+    """values[run, level, metric, step] と各軸のラベル"""
+
+    def __init__(self, values, runs, levels, metrics, steps):
+        self.values = values
+        self.runs = list(runs)
+        self.levels = list(levels)
+        self.metrics = list(metrics)
+        self.steps = np.asarray(steps)
+
+    def sel(self, metric=None, level=None):
+        """metric / level を名前で指定したスライス（指定しない軸は残す）"""
+        values = self.values
+        if metric is not None:
+            values = values[:, :, self.metrics.index(metric)] if level is None \
+                else values[:, self.levels.index(level), self.metrics.index(metric)]
+        elif level is not None:
+            values = values[:, self.levels.index(level)]
+        return values
+
+    def save(self, path):
+        with atomic_write(path) as tmp, open(tmp, "wb") as f:
+            np.savez(f, values=self.values, runs=np.array(self.runs), levels=np.array(self.levels),
+                     metrics=np.array(self.metrics), steps=self.steps)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f["values"], f["runs"].tolist(), f["levels"].tolist(),
+                       f["metrics"].tolist(), f["steps"])
+
+
+def run_subactor_keys(run, metrics=None):
+    """ランのサブアクターメトリクスのキー {(level, metric): key}（metrics を指定すればそれだけ）"""
+    keys = discover_subactor_keys(run.summary.keys())
+    if metrics is not None:
+        keys = {k: v for k, v in keys.items() if k[1] in metrics}
+    return keys
+
+
+def tensor_cache_file(runs, metrics, n_steps):
+    """ラン（と最終ステップ）・メトリクス・グリッド幅から決まるキャッシュのパス"""
+    parts = [f"{run.id}:{run.summary.get('_step')}" for run in sorted(runs, key=lambda r: r.id)]
+    parts += sorted(metrics or []) + [str(n_steps)]
+    digest = hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+    return cache_path("subactor", f"{digest}.npz")
+
+
+def build_tensor(runs, metrics=None, n_steps=N_STEPS, use_cache=True):
+    """ラン群のサブアクターメトリクスを [run, level, metric, step] にまとめる
+
+    metrics を省略すると、いずれかのランに記録された全メトリクスを使う。
+    レベルは全ランの和集合で、そのレベルを持たないランは NaN になる。
+    キャッシュのキーはサマリーの _step で決まる。組み立てに使う load_history が読む前に historyキャッシュを
+    その時点まで追いつかせるので、テンソルはキーと同じステップまでの点を含む。
+    """
+    runs = list(runs)
+    path = tensor_cache_file(runs, metrics, n_steps)
+    if use_cache and path.exists():
+        return SubactorTensor.load(path)
+    with key_lock(path):
+        if use_cache and path.exists():
+            return SubactorTensor.load(path)
+        return _build_tensor(runs, metrics, n_steps, path)
+
+
+def _build_tensor(runs, metrics, n_steps, path):
+    """build_tensor の本体（キーのロックを取った状態で呼ばれる）"""
+    run_keys = {run.id: run_subactor_keys(run, metrics) for run in runs}
+    levels = sorted({level for keys in run_keys.values() for level, _ in keys})
+    metrics = sorted(metrics or {metric for keys in run_keys.values() for _, metric in keys})
+    max_step = max((run.summary.get("_step") or 0 for run in runs), default=0)
+    edges, centers = step_grid(max_step, n_steps)
+
+    values = np.full((len(runs), len(levels), len(metrics), n_steps), np.nan, dtype=np.float32)
+    for r, run in enumerate(runs):
+        keys = run_keys[run.id]
+        if not keys:
+            continue
+        history = load_history(run, list(keys.values()))
+        for (level, metric), key in keys.items():
+            if key in history.columns:
+                values[r, levels.index(level), metrics.index(metric)] = bin_mean(
+                    history["_step"], history[key], edges)
+
+    tensor = SubactorTensor(values, [run.id for run in runs], levels, metrics, centers)
+    tensor.save(path)
+    return tensor
+
+
+def main():
+    from run_config import ConfigIndex
+    from run_metadata import sweep_runs
+    from snapshot import open_api
+    from sweeps import SWEEPS
+
+    parser = argparse.ArgumentParser(description="Per-level reward decomposition from the subactor tensor")
+    parser.add_argument("sweep", nargs="?", default="hierarchy", help="sweep name in sweeps.py")
+    parser.add_argument("--steps", type=int, default=N_STEPS, help="number of bins on the shared step grid")
+    parser.add_argument("--tail", type=float, default=0.1, help="fraction of the grid averaged as the final value")
+    args = parser.parse_args()
+
+    api = open_api()
+    configs = ConfigIndex.from_runs(sweep_runs(args.sweep, api))
+    rewards = ["imag_extrinsic_reward_mean", "imag_subgoal_reward_mean", "imag_novelty_reward_mean"]
+    tensor = build_tensor(configs.runs.values(), rewards, n_steps=args.steps)
+
+    # 最後 tail の区間の平均: [run, level, metric]
+    n_tail = max(1, int(args.tail * len(tensor.steps)))
+    with warnings.catch_warnings():
+        # 記録の無いレベル・区間は NaN のまま
+        warnings.simplefilter("ignore", RuntimeWarning)
+        final = np.nanmean(tensor.values[..., -n_tail:], axis=-1)
+    param = SWEEPS[args.sweep]["param"]
+    for value, run_ids in configs.group_by(param).items():
+        rows = [tensor.runs.index(run_id) for run_id in run_ids]
+        print(f"\n=== {param}={value} (n={len(rows)}) ===")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = np.nanmean(final[rows], axis=0)
+        print("level  " + "  ".join(f"{m.split('_')[1]:>10}" for m in tensor.metrics))
+        for l, level in enumerate(tensor.levels):
+            print(f"{level:>5}  " + "  ".join(f"{v:10.4f}" for v in mean[l]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+report/subgoal_visualization GIF のフレーム単位解析
+各GIFをプロセスプールで解析し（デコード結果は frame_cache で共有）、階層レベルごとに
+サブゴールと実際のフレームの画素距離・サブゴールの切り替わり頻度を計算して
+(run, step, source, level) をキーとする表にまとめる（同じランの同じステップに複数のGIFがあっても、
+W&B のメディアのハッシュを含むファイル名 source で区別する）
+
+GIFの各フレームは 64x64 のタイルを並べたもので、行0が実際の観測、
+行L (L>=1) がレベルLのサブゴールのデコード画像、列がバッチ内のサンプル。
+"""
+
+import argparse
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cache import atomic_write, cache_path, key_lock, write_parquet
+from frame_cache import load_frames
+
+TILE = 64
+
+# タイルの平均画素差がこれを超えたらサブゴールが切り替わったとみなす (0..1)
+CHANGE_THRESHOLD = 0.02
+
+NAME_PATTERN = re.compile(r"subgoal_visualization_(\d+)_(\w+)\.gif")
+RUN_ID_PATTERN = re.compile(r"[a-z0-9]{8}")
+INDEX = ["run", "step", "source", "level"]
+
+
+def split_tiles(frames, tile=TILE):
+    """(T, H, W, 3) を (T, level, sample, tile, tile, 3) に並べ替える"""
+    t, h, w, c = frames.shape
+    tiles = frames.reshape(t, h // tile, tile, w // tile, tile, c)
+    return tiles.transpose(0, 1, 3, 2, 4, 5)
+
+
+def frame_metrics(frames, tile=TILE, threshold=CHANGE_THRESHOLD):
+    """レベルごとのフレーム単位の指標を計算する
+
+    distance[t, L]: レベルLのサブゴールと実際の観測 (行0) の平均画素距離
+    change[t, L]: 前フレームから切り替わったサンプルの割合
+    """
+    tiles = split_tiles(frames, tile).astype(np.float32) / 255.0
+    observed = tiles[:, :1]
+
+    # (T, level, sample)
+    distance = np.abs(tiles - observed).mean(axis=(3, 4, 5))
+    delta = np.abs(np.diff(tiles, axis=0)).mean(axis=(3, 4, 5))
+    switched = delta > threshold
+
+    change = np.concatenate([np.zeros_like(switched[:1]), switched], axis=0)
+    return distance.mean(axis=2), change.mean(axis=2), switched
+
+
+def analyze_gif(task):
+    """1つのGIFを解析してレベルごとの集計行を返す"""
+    path, run, step = task
+    frames = load_frames(path)
+    distance, change, switched = frame_metrics(frames)
+    n_frames = frames.shape[0]
+
+    rows = []
+    # 行0は観測そのもの（距離は常に0）なので、サブゴールの行 (L>=1) だけを集計する
+    for level in range(1, distance.shape[1]):
+        # サンプルごとの切り替え回数から平均ホライズン（切り替え間のフレーム数）を求める
+        n_switches = switched[:, level].sum(axis=0)
+        horizon = n_frames / (n_switches + 1)
+        rows.append({
+            "run": run,
+            "step": step,
+            "level": level,
+            "source": Path(path).name,
+            "n_frames": n_frames,
+            "subgoal_distance": float(distance[:, level].mean()),
+            "final_distance": float(distance[-1, level]),
+            "change_rate": float(change[1:, level].mean()),
+            "mean_horizon": float(horizon.mean()),
+        })
+    return rows
+
+
+def find_gifs(roots):
+    """GIFを探し、(path, run, step) のタスクを作る
+
+    run は W&B からダウンロードした <run_id>/media/... の形なら run_id、
+    それ以外は親ディレクトリ名とする。
+    """
+    tasks = {}
+    for root in roots:
+        for path in sorted(Path(root).rglob("subgoal_visualization_*.gif")):
+            match = NAME_PATTERN.match(path.name)
+            if match is None:
+                continue
+            parts = path.parts
+            run = path.parent.name
+            if "media" in parts[1:] and RUN_ID_PATTERN.fullmatch(parts[parts.index("media") - 1]):
+                run = parts[parts.index("media") - 1]
+            # 重なったルートから同じファイルが見つかっても1回だけ解析する
+            tasks.setdefault((run, path.name), (str(path), run, int(match.group(1))))
+    return list(tasks.values())
+
+
+def build_table(roots, workers=None, table_path=None):
+    """未解析のGIFだけを解析して表を更新し、(run, step, source, level) インデックスの表を返す"""
+    table_path = table_path or cache_path("subgoal_gifs.parquet")
+    # 表の読み込みから書き戻しまでを1つのロックで囲み、同時に実行しても同じGIFを二度解析しない
+    with key_lock(table_path):
+        table = pd.read_parquet(table_path) if Path(table_path).exists() else None
+        if table is not None:
+            # 以前の版が観測の行0もレベル0として保存していた表から、その行を除く
+            table = table[table["level"] >= 1]
+
+        tasks = find_gifs(roots)
+        if table is not None:
+            done = set(zip(table["run"], table["source"]))
+            tasks = [task for task in tasks if (task[1], Path(task[0]).name) not in done]
+
+        if tasks:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                rows = [row for result in pool.map(analyze_gif, tasks) for row in result]
+            new = pd.DataFrame(rows)
+            table = new if table is None else pd.concat([table, new], ignore_index=True)
+            with atomic_write(table_path) as tmp:
+                write_parquet(table, tmp)
+            print(f"✓ Analyzed {len(tasks)} GIFs")
+
+    if table is None:
+        return pd.DataFrame(columns=INDEX).set_index(INDEX)
+    table = table.set_index(INDEX).sort_index()
+    if not table.index.is_unique:
+        duplicated = table.index[table.index.duplicated()].unique()
+        raise ValueError(f"duplicate (run, step, source, level) keys in {table_path}: {list(duplicated[:5])}")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze subgoal visualization GIFs")
+    parser.add_argument("roots", nargs="*", default=["media/videos/report"],
+                        help="directories searched recursively for subgoal GIFs")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size")
+    args = parser.parse_args()
+
+    table = build_table(args.roots, workers=args.workers)
+    if table.empty:
+        print("⚠ No subgoal visualization GIFs found")
+        return
+
+    # 上位レベルほど長いホライズンのサブゴールを出しているか
+    by_level = table.groupby("level")[["subgoal_distance", "change_rate", "mean_horizon"]].agg(["mean", "std"])
+    print(f"\n{len(table.index.unique('step'))} steps, {len(table)} (run, step, source, level) rows")
+    print(by_level.round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+スイープの設定値（アーム）間の統計的比較
+キャッシュ済みhistoryから各ランの最終スコアを求め、IQM・層別ブートストラップ信頼区間・
+改善確率 (probability of improvement) を計算する。ブートストラップは全てNumPyで
+ベクトル化しているので、数千回のリサンプルを全アームの組について数秒で行える。
+"""
+
+import argparse
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from cache import load_history
+
+SCORE_KEY = "episode/score"
+N_BOOTSTRAP = 5000
+
+
+def final_score(history, key=SCORE_KEY, tail_fraction=0.1):
+    """学習の最後 tail_fraction の区間（ステップ基準）の平均スコア"""
+    df = history.dropna(subset=[key])
+    if df.empty:
+        return np.nan
+    start = df["_step"].max() * (1.0 - tail_fraction)
+    return float(df.loc[df["_step"] >= start, key].mean())
+
+
+def iqm(scores, axis=-1):
+    """四分位平均 (上下25%を除いた平均)。axis 方向にまとめて計算する"""
+    scores = np.sort(scores, axis=axis)
+    n = scores.shape[axis]
+    k = int(np.floor(0.25 * n))
+    return np.take(scores, np.arange(k, n - k), axis=axis).mean(axis=axis)
+
+
+def stratified_resample(scores, strata, n_bootstrap=N_BOOTSTRAP, rng=None):
+    """層（タスクなど）ごとに復元抽出した [n_bootstrap, n] のスコア行列を返す"""
+    rng = rng or np.random.default_rng(0)
+    scores = np.asarray(scores, dtype=float)
+    strata = np.asarray(strata)
+    columns = []
+    for stratum in np.unique(strata):
+        members = np.flatnonzero(strata == stratum)
+        picks = rng.integers(0, len(members), size=(n_bootstrap, len(members)))
+        columns.append(scores[members[picks]])
+    return np.concatenate(columns, axis=1)
+
+
+def bootstrap_ci(scores, strata=None, statistic=iqm, n_bootstrap=N_BOOTSTRAP,
+                 confidence=0.95, rng=None):
+    """統計量の点推定と層別ブートストラップ信頼区間"""
+    scores = np.asarray(scores, dtype=float)
+    strata = np.zeros(len(scores)) if strata is None else strata
+    samples = stratified_resample(scores, strata, n_bootstrap, rng)
+    values = statistic(samples, axis=1)
+    alpha = (1.0 - confidence) / 2
+    lo, hi = np.quantile(values, [alpha, 1.0 - alpha])
+    return float(statistic(scores[None], axis=1)[0]), float(lo), float(hi)
+
+
+def probability_of_improvement(x, y, axis_batch=False):
+    """P(X > Y) (同点は1/2)。axis_batch=True なら [B, n], [B, m] をまとめて計算する"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if not axis_batch:
+        x, y = x[None], y[None]
+    gt = (x[:, :, None] > y[:, None, :]).mean(axis=(1, 2))
+    eq = (x[:, :, None] == y[:, None, :]).mean(axis=(1, 2))
+    poi = gt + 0.5 * eq
+    return poi if axis_batch else float(poi[0])
+
+
+def compare_arms(arm_scores, arm_strata=None, n_bootstrap=N_BOOTSTRAP,
+                 confidence=0.95, seed=0):
+    """全アームのIQMと、全てのアームの組の改善確率をまとめて計算する
+
+    arm_scores: {アーム: ランごとの最終スコア}
+    arm_strata: {アーム: ランごとの層ラベル}（省略時は層なし）
+    """
+    rng = np.random.default_rng(seed)
+    arm_strata = arm_strata or {}
+    alpha = (1.0 - confidence) / 2
+
+    samples = {}
+    rows = []
+    for arm, scores in arm_scores.items():
+        scores = np.asarray(scores, dtype=float)
+        strata = np.asarray(arm_strata.get(arm, np.zeros(len(scores))))
+        samples[arm] = stratified_resample(scores, strata, n_bootstrap, rng)
+        values = iqm(samples[arm], axis=1)
+        lo, hi = np.quantile(values, [alpha, 1.0 - alpha])
+        rows.append({"arm": arm, "n": len(scores), "iqm": iqm(scores[None], axis=1)[0],
+                     "ci_low": lo, "ci_high": hi})
+    summary = pd.DataFrame(rows).set_index("arm")
+
+    pairs = []
+    for a, b in combinations(arm_scores, 2):
+        poi = probability_of_improvement(arm_scores[a], arm_scores[b])
+        boot = probability_of_improvement(samples[a], samples[b], axis_batch=True)
+        lo, hi = np.quantile(boot, [alpha, 1.0 - alpha])
+        pairs.append({"arm_x": a, "arm_y": b, "p_improve": poi, "ci_low": lo, "ci_high": hi})
+    return summary, pd.DataFrame(pairs)
+
+
+def collect_arm_scores(runs, param, configs, key=SCORE_KEY, tail_fraction=0.1):
+    """ランを param の値ごとにまとめ、キャッシュ済みhistoryから最終スコアを集める"""
+    arm_scores, arm_strata = {}, {}
+    for value, run_ids in configs.group_by(param).items():
+        scores, strata = [], []
+        for run_id in run_ids:
+            run = runs[run_id]
+            score = final_score(load_history(run, [key]), key, tail_fraction)
+            if np.isnan(score):
+                continue
+            scores.append(score)
+            strata.append(configs.get(run_id, "task", "unknown"))
+        if scores:
+            arm_scores[value] = scores
+            arm_strata[value] = strata
+    return arm_scores, arm_strata
+
+
+def main():
+    from run_config import ConfigIndex
+    from run_metadata import sweep_runs
+    from snapshot import open_api
+    from sweeps import SWEEPS
+
+    parser = argparse.ArgumentParser(description="Compare sweep arms with bootstrap statistics")
+    parser.add_argument("sweeps", nargs="*", default=["hierarchy", "reward-ratio", "entropy"],
+                        help="sweep names in sweeps.py")
+    parser.add_argument("--param", help="config key defining the arms (default: the sweep's param)")
+    parser.add_argument("--bootstrap", type=int, default=N_BOOTSTRAP, help="number of resamples")
+    parser.add_argument("--tail", type=float, default=0.1, help="fraction of training used for the final score")
+    args = parser.parse_args()
+
+    api = open_api()
+    for name in args.sweeps:
+        param = args.param or SWEEPS[name]["param"]
+        configs = ConfigIndex.from_runs(sweep_runs(name, api))
+        arm_scores, arm_strata = collect_arm_scores(configs.runs, param, configs, tail_fraction=args.tail)
+        if len(arm_scores) < 2:
+            print(f"⚠ {name}: fewer than two arms with scores")
+            continue
+
+        summary, pairs = compare_arms(arm_scores, arm_strata, n_bootstrap=args.bootstrap)
+        print(f"\n=== {name} ({param}) ===")
+        print(summary.round(2).to_string())
+        print(pairs.round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
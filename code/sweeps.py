@@ -0,0 +1,63 @@
+"""
+解析対象のW&Bスイープ一覧
+各スイープのID・掃引パラメータ・図を生成するスクリプトと出力先をまとめる
+"""
+
+PROJECT = "rm2278-university-of-cambridge/Hieros-hieros"
+
+SWEEPS = {
+    "subactor-update": {
+        "id": "w3isl3qy",
+        "param": "subactor_update_every",
+        "script": "code/Hieros-sweep-analysis.py",
+        "media_dir": "media/pinpad/subactor-update-sweep",
+    },
+    "entropy": {
+        "id": "zd4mp7ve",
+        "param": "actor_entropy",
+        "script": "code/Hieros-sweep-entropy.py",
+        "media_dir": "media/pinpad/entropy-sweep",
+    },
+    "reward-ratio": {
+        "id": "wmk3jlws",
+        "param": "novelty_reward_weight",
+        "script": "code/Hieros-sweep-reward-ratio.py",
+        "media_dir": "media/pinpad/reward-ratio-sweep",
+    },
+    "reward-design": {
+        "id": "f19iko7r",
+        "param": "reward_mode",
+        "script": "code/Hieros-sweep-reward-design.py",
+        "media_dir": "media/pinpad/reward-design-sweep",
+    },
+    "reward": {
+        "id": "jf65b2tm",
+        "param": None,
+        "script": "code/Hieros-sweep-reward.py",
+        "media_dir": "media/pinpad/reward-sweep",
+    },
+    "rssm": {
+        "id": "uhfc6bh3",
+        "param": "max_hierarchy",
+        "script": "code/Hieros-sweep-rssm.py",
+        "media_dir": "media/pinpad/rssm-sweep",
+    },
+    "hierarchy": {
+        "id": "uul3sfkc",
+        "param": "max_hierarchy",
+        "script": "code/Hieros-hierarchy-analysis-v2.py",
+        "media_dir": "media/hierarchy",
+    },
+    "atari": {
+        "id": "llr4r8er",
+        "param": "task",
+        "script": "code/Hieros-atari-analysis.py",
+        "media_dir": "media/atari",
+    },
+}
+
+
+def sweep_path(name):
+    """スイープ名 (またはスイープID) から api.sweep() に渡すパスを返す"""
+    sweep_id = SWEEPS[name]["id"] if name in SWEEPS else name
+    return f"{PROJECT}/{sweep_id}"
@@ -0,0 +1,27 @@
+"""
+W&Bのhistoryに記録されたメディア (画像・GIF) の読み込み
+"""
+
+import io
+
+from PIL import Image
+
+from profiling import stage
+
+
+@stage("fetch")
+def load_media_image(run, media_obj):
+    """historyのメディアセルをPIL画像として開く（GIFは先頭フレーム）"""
+    if hasattr(media_obj, "_image"):
+        # It's a wandb.Image, get the PIL image
+        return media_obj._image
+    if isinstance(media_obj, dict) and "path" in media_obj and hasattr(run, "media_bytes"):
+        # スナップショットのランはアーカイブ内のメンバから開く
+        return Image.open(io.BytesIO(run.media_bytes(media_obj["path"])))
+    if isinstance(media_obj, dict) and "path" in media_obj:
+        # Fetch from wandb file
+        file_obj = run.file(media_obj["path"])
+        downloaded_path = file_obj.download(replace=True).name
+        return Image.open(downloaded_path)
+    # Try to use as-is
+    return media_obj
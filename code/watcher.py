@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+入力が変わった図だけを作り直すウォッチャ
+スイープごとに全ランの (状態, 最終ステップ, 最終記録時刻) を一括クエリで取得し、
+ローカルの Director JSONL は (サイズ, 更新時刻) を見て、前回成功時の指紋と比べる。
+変わったものに対応するスクリプト（sweeps.py の script）だけをジョブキューに入れる。
+スイープが変わったときは、ジョブを入れる前にそのランのキャッシュ済みhistoryに新しい点を追記する。
+キューは同じスクリプトのジョブを1つにまとめ、全ランが終了済みで変化の無いスイープは
+問い合わせ自体を省くので、何も動いていないときのコストはほぼゼロになる。
+
+    python code/watcher.py                # 5分ごとに監視
+    python code/watcher.py --once         # 1回だけ確認して、変わった図を作り直す
+    python code/watcher.py --baseline     # 現状を記録するだけ（ジョブは実行しない）
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+from cache import atomic_write, cache_path, refresh_cached_history
+from run_metadata import FINAL_STATES, sweep_runs
+from sweeps import SWEEPS
+
+# W&B以外の入力を持つ図のジョブ
+LOCAL_JOBS = {
+    "director": {
+        "inputs": ["director-result/*.jsonl"],
+        "script": "code/Director-results.py",
+    },
+}
+
+
+def _digest(items):
+    return hashlib.sha1(json.dumps(items, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def sweep_fingerprint(runs):
+    """スイープの指紋と、全ランが終了済みかどうか"""
+    items = sorted((run.id, run.state, run.last_step, run.record.get("last_logged")) for run in runs)
+    return _digest(items), all(run.state in FINAL_STATES for run in runs)
+
+
+def local_fingerprint(patterns):
+    """ローカル入力ファイルの (パス, サイズ, 更新時刻) の指紋"""
+    items = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            stat = os.stat(path)
+            items.append((path, stat.st_size, stat.st_mtime_ns))
+    return _digest(items), False
+
+
+class JobQueue:
+    """スクリプトをキーに重複をまとめる実行待ちキュー"""
+
+    def __init__(self):
+        self.pending = OrderedDict()
+
+    def put(self, script, source, fingerprint):
+        """同じスクリプトが既に待っていれば、指紋の更新だけを追加する"""
+        self.pending.setdefault(script, {})[source] = fingerprint
+
+    def __len__(self):
+        return len(self.pending)
+
+    def drain(self, run_job):
+        """待っているジョブを順に実行し、成功したものの {source: 指紋} を返す"""
+        done = {}
+        while self.pending:
+            script, sources = self.pending.popitem(last=False)
+            if run_job(script):
+                done.update(sources)
+        return done
+
+
+class Watcher:
+    """前回成功時の指紋を cache/watch/state.json に保持し、変わった入力のジョブを出す"""
+
+    def __init__(self, sweeps=None, local_jobs=LOCAL_JOBS, recheck_final=False):
+        self.sweeps = list(sweeps or SWEEPS)
+        self.recheck_final = recheck_final
+        self.local_jobs = local_jobs
+        self.state_file = cache_path("watch", "state.json")
+        self.state = json.loads(self.state_file.read_text()) if self.state_file.exists() else {}
+        self.queue = JobQueue()
+
+    def poll(self, api=None):
+        """全ての入力を確認し、変わったもののジョブをキューに入れる。入れた数を返す"""
+        before = len(self.queue)
+        for name in self.sweeps:
+            previous = self.state.get(f"sweep:{name}", {})
+            if previous.get("final") and not self.recheck_final:
+                # 終了済みのスイープは変わらないので問い合わせない
+                continue
+            runs = sweep_runs(name, api, refresh=True)
+            fingerprint, final = sweep_fingerprint(runs)
+            if fingerprint != previous.get("fingerprint"):
+                # 図のスクリプトが新しい点を読めるように、キャッシュ済みのhistoryを先に追記しておく
+                for run in runs:
+                    refresh_cached_history(run)
+                self.queue.put(SWEEPS[name]["script"], f"sweep:{name}",
+                               {"fingerprint": fingerprint, "final": final})
+
+        for name, job in self.local_jobs.items():
+            fingerprint, final = local_fingerprint(job["inputs"])
+            if fingerprint != self.state.get(f"local:{name}", {}).get("fingerprint"):
+                self.queue.put(job["script"], f"local:{name}", {"fingerprint": fingerprint, "final": final})
+        return len(self.queue) - before
+
+    def commit(self, done):
+        self.state.update(done)
+        with atomic_write(self.state_file) as tmp:
+            tmp.write_text(json.dumps(self.state, indent=2))
+
+    def run_pending(self, run_job=None):
+        self.commit(self.queue.drain(run_job or run_script))
+
+    def baseline(self):
+        """キューに入ったジョブを実行せずに成功したものとして記録する"""
+        self.commit(self.queue.drain(lambda script: True))
+
+
+def run_script(script):
+    print(f"▶ {script}")
+    result = subprocess.run([sys.executable, script])
+    if result.returncode != 0:
+        print(f"⚠ {script} failed with exit code {result.returncode}; it will be retried on the next poll")
+        return False
+    return True
+
+
+def main():
+    from snapshot import open_api
+
+    parser = argparse.ArgumentParser(description="Rebuild only the figures whose inputs changed")
+    parser.add_argument("sweeps", nargs="*", default=list(SWEEPS), help="sweep names in sweeps.py")
+    parser.add_argument("--interval", type=int, default=300, help="seconds between polls")
+    parser.add_argument("--once", action="store_true", help="poll once, run the jobs and exit")
+    parser.add_argument("--recheck", action="store_true",
+                        help="also query sweeps whose runs had all finished (e.g. after adding runs)")
+    parser.add_argument("--baseline", action="store_true", help="record the current state without running jobs")
+    args = parser.parse_args()
+
+    api = open_api()
+    watcher = Watcher(args.sweeps, recheck_final=args.recheck)
+    while True:
+        n_jobs = watcher.poll(api)
+        if args.baseline:
+            watcher.baseline()
+            print(f"✓ Recorded the current state of {len(watcher.state)} inputs")
+            return
+        if n_jobs:
+            watcher.run_pending()
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()